@@ -4,9 +4,9 @@ import casinobot.cards as c
 import casinobot.player as p
 from casinobot.split import SplitHand
 from casinobot import casino
+from casinobot.channel import Channel, SAY
 import time
 from threading import Timer
-from types import MethodType
 from collections import OrderedDict
 
 DELAY_TIME = 1.0
@@ -25,26 +25,26 @@ help = OrderedDict([('hit', "To tell the dealer to give you another card, use th
 # Method for calculating a hands value
 def hand_value(self):
     # Count ace's as 1, if the hand has an ace, then add 10 if value isn't a bust
-    value = 0
-    contains_ace = False
+    value = self.value
 
-    for card in self.cards:
-        value += c.VALUES[card.rank]
-        if card.rank == 'A':
-            contains_ace = True
-
-    if value <= 11 and contains_ace:
+    if value <= 11 and self.aces:
         value += 10
 
     return value
 
 
 class Game:
-    # The main game object for blackjack
-    def __init__(self, phenny, uid, nick, hooks):
+    # The main game object for blackjack, played at `table` (the IRC bot's default table if None)
+    def __init__(self, phenny, uid, nick, hooks, shoe=None, table=None):
         self.game_type = "blackjack"
         self.started = False
         self.deck = False
+        self.table = table if table is not None else p.default_table
+        # The table's players and in-game list, which are only ever changed in place
+        self.players = self.table.players
+        self.in_game = self.table.in_game
+        # Kept between games if given, otherwise a new deck is shuffled every game
+        self.shoe = shoe if shoe is not None else self.table.shoe
         self.accept_bets = False
         self.accept_surrender = False
         self.accept_doubledown = False
@@ -54,37 +54,29 @@ class Game:
         self.timer_start = 0
         self.starter_uid = False
         self.turns = False  # The users who have turns, in order, current is at index 0
-        self.phenny = phenny
+        self.phenny = Channel.wrap(phenny)
 
         self.hooks = hooks
 
-        p.add_player(0, 'Dealer')
-        p.players[0].hand.hand_value = MethodType(
-            hand_value, p.players[0].hand)
-        p.players[0].add_gold(1000000)
+        self.table.seat_dealer(1000000)
         self.starter_uid = uid
 
         self.phenny.say(
             "A new game of blackjack has begun! Type !enter if you'd like to play. You have 30 seconds to join.")
-        self.phenny.say(p.add_to_game(self.phenny, uid))
-        p.players[uid].hand.hand_value = MethodType(
-            hand_value, p.players[uid].hand)
+        self.phenny.say(self.table.add_to_game(self.phenny, uid))
 
         self.hooks.on_init(self)
 
         self.begin_game()
 
     def join(self, uid):
-        if len(p.in_game) < 6 and uid not in p.in_game:
-            msg = p.add_to_game(self.phenny, uid)
-            # Add the hand_value function
-            p.players[uid].hand.hand_value = MethodType(
-                hand_value, p.players[uid].hand)
+        if len(self.in_game) < 6 and uid not in self.in_game:
+            msg = self.table.add_to_game(self.phenny, uid)
 
             # Joining during betting
             if not self.accept_bets:
                 # If we are at the max number of players, start the game
-                if len(p.in_game) == 6:
+                if len(self.in_game) == 6:
                     self.t.cancel()
                     self.begin_game()
 
@@ -94,7 +86,7 @@ class Game:
                     self.t = Timer(DELAY_TIME, self.begin_game)
                     self.t.start()
             return msg
-        elif uid in p.in_game:
+        elif uid in self.in_game:
             return "You have already joined the game!"
         else:
             return "This game has reached the max amount (6) of players. Please try again later."
@@ -103,16 +95,16 @@ class Game:
         self.t = False
         self.phenny.say(
             "Welcome to the Casino! This round of blackjack has now begun!")
-        if len(p.in_game) > 1:
-            self.phenny.say(str("There are %d players this round: %s" %
-                                (len(p.in_game), p.list_in_game())))
+        if len(self.in_game) > 1:
+            self.phenny.say(lambda: "There are %d players this round: %s" %
+                            (len(self.in_game), self.table.list_in_game()))
         else:
-            self.phenny.say(str("There is %d player this round: %s" %
-                                (len(p.in_game), p.list_in_game())))
+            self.phenny.say(lambda: "There is %d player this round: %s" %
+                            (len(self.in_game), self.table.list_in_game()))
 
         # Place bets
         self.phenny.say(
-            "Time to place your initial bets! You have %d seconds. Use '!bet amount' to bet. You can place multiple bets." % DELAY_TIME)
+            "Time to place your initial bets! You have %d seconds. Use '!bet amount' to bet. You can place multiple bets.", DELAY_TIME)
         self.accept_bets = True
 
         self.hooks.on_begin_game(self)
@@ -120,78 +112,87 @@ class Game:
         self.deal_cards()
 
     def bet(self, uid, amount):
-        self.phenny.say(p.players[uid].place_bet(amount))
+        self.phenny.say(self.players[uid].place_bet(amount))
 
     def deal_cards(self):
         self.t = False
         # Stop betting
         self.accept_bets = False
 
-        # Build the deck and shuffle it
-        self.deck = c.Deck()
-        # We use 2 decks to give the house a better advantage
-        self.deck.cards = self.deck.cards + self.deck.cards
-        self.deck.shuffle()
+        if self.shoe is not None:
+            self.deck = self.shoe
+            self.deck.start_round()
+        else:
+            # Build the deck and shuffle it
+            # We use 2 decks to give the house a better advantage
+            self.deck = c.CompactDeck(2)
+            self.deck.shuffle()
 
         # Deal the cards to the players
         self.phenny.say("The Dealer begins dealing...")
 
-        p.deal(self.deck, 2)
+        self.table.deal(self.deck, 2)
 
         # Show cards
-        for uid in p.in_game:
-            self.phenny.write(
-                ('NOTICE', p.players[uid].name + " Your Hand: " + str(p.players[uid].hand)))   # NOTICE
+        for uid in self.in_game:
+            self.phenny.notice(self.players[uid].name, "Your Hand: %s", self.players[uid].hand)
             # reset the split counter, used for fake ids
-            p.players[uid].splits = 0
+            self.players[uid].splits = 0
         self.show_table()
         self.started = True
 
         # Check for naturals (an immediate blackjack)
         dealer_win = False
-        if p.players[0].hand.hand_value() == 21:
+        if self.players[0].hand.total == 21:
             dealer_win = True
             self.phenny.say("The dealer started with a natural blackjack!")
             self.show_full_table()
 
-        for uid in p.in_game[:]:
-            if p.players[uid].hand.hand_value() == 21:
+        for uid in self.in_game[:]:
+            if self.players[uid].hand.total == 21:
                 if dealer_win:
-                    p.players[uid].tie(self.phenny)
-                    self.phenny.say(str(
-                        "%s and the dealer both have natural blackjacks. They tie!" % p.players[uid].name))
+                    self.players[uid].tie(self.phenny)
+                    self.phenny.say(
+                        "%s and the dealer both have natural blackjacks. They tie!", self.players[uid].name)
                 else:
-                    self.phenny.say(p.players[uid].win_natural(self.phenny))
+                    self.phenny.say(self.players[uid].win_natural(self.phenny))
             elif dealer_win:
-                casino.gold += (p.players[uid].bet * 0.25)
-                p.players[uid].lose(self.phenny)
-                p.players[uid].natlosses += 1
+                casino.gold += (self.players[uid].bet * 0.25)
+                self.players[uid].lose(self.phenny)
+                self.players[uid].natlosses += 1
                 self.phenny.say(
-                    "%s lost to the dealers natural blackjack." % p.players[uid].name)
+                    "%s lost to the dealers natural blackjack.", self.players[uid].name)
 
         # Play game
         self.play()
 
+    def output_enabled(self, level=SAY):
+        # Whether messages at `level` are sent anywhere, so renderings can be skipped if not
+        return self.phenny.enabled(level)
+
     def show_table(self):
+        if not self.output_enabled():
+            return
         table = 'Table: '
         table += 'Dealer - ' + self.show_dealers_hand() + ' '
-        for uid in p.in_game:
-            table += p.players[uid].name + " - " + \
-                str(p.players[uid].hand) + ' '
+        for uid in self.in_game:
+            table += self.players[uid].name + " - " + \
+                str(self.players[uid].hand) + ' '
         self.phenny.say(table)
 
     # Shows all of dealers cards
     def show_full_table(self):
+        if not self.output_enabled():
+            return
         table = 'Table: '
-        table += 'Dealer - ' + str(p.players[0].hand) + ' '
-        for uid in p.in_game:
-            table += p.players[uid].name + " - " + \
-                str(p.players[uid].hand) + ' '
+        table += 'Dealer - ' + str(self.players[0].hand) + ' '
+        for uid in self.in_game:
+            table += self.players[uid].name + " - " + \
+                str(self.players[uid].hand) + ' '
         self.phenny.say(table)
 
-    @staticmethod
-    def show_dealers_hand():
-        dealer = str(p.players[0].hand).split(" ")
+    def show_dealers_hand(self):
+        dealer = str(self.players[0].hand).split(" ")
         dealer[0] = "XX"
         dealer = " ".join(dealer)
         return dealer
@@ -211,21 +212,21 @@ class Game:
         self.set_doubledown(uid)
         self.set_split(uid)
         # create the command list programatically
-        message = self.command_list()
-        self.phenny.say("%s. %s?" % (p.players[uid].name, message))
+        if self.output_enabled():
+            self.phenny.say("%s. %s?", self.players[uid].name, self.command_list())
         self.hooks.on_start_turn(self, uid)
-        #self.t = Timer(DELAY_TIME, self.stand, [p.players[uid].uid, True])
+        #self.t = Timer(DELAY_TIME, self.stand, [self.players[uid].uid, True])
         # self.t.start()
 
     def play(self):
-        if len(p.in_game) == 0:
+        if len(self.in_game) == 0:
             self.game_over()  # All players already lost
             return
         # Start by reversing the in-game list as the dealer starts on their left
-        p.in_game = p.in_game[::-1]
+        self.in_game.reverse()
 
         # Hit or stand? Keep asking until the user stands or busts
-        self.turns = p.in_game[:]
+        self.turns = self.in_game[:]
         uid = self.turns[0]
         self._start_turn(uid)
 
@@ -237,23 +238,22 @@ class Game:
         """
         if self.turns and self.is_current_player(pid):
             uid = self.turns[0]
-            p.players[uid].hand.add_card(self.deck.deal_card())
-            self.phenny.say("Hit. %s: %s" %
-                            (p.players[uid].name, str(p.players[uid].hand)))
+            self.players[uid].hand.add_card(self.deck.deal_card())
+            self.phenny.say("Hit. %s: %s", self.players[uid].name, self.players[uid].hand)
             if self.t and self.t.is_alive():
                 self.t.cancel()
                 self.t = False
 
-            if p.players[uid].hand.hand_value() > 21:
-                casino.gold += (p.players[uid].bet * 0.25)
-                p.players[uid].lose(self.phenny)
+            if self.players[uid].hand.is_bust:
+                casino.gold += (self.players[uid].bet * 0.25)
+                self.players[uid].lose(self.phenny)
                 self.phenny.say(
-                    "BUST! %s went over 21. Their bet was lost to the dealer." % p.players[uid].name)
+                    "BUST! %s went over 21. Their bet was lost to the dealer.", self.players[uid].name)
                 del self.turns[0]
 
-            if p.players[uid].hand.hand_value() == 21:
+            if self.players[uid].hand.total == 21:
                 self.phenny.say(
-                    "Blackjack! %s reached 21, therefore they stand." % p.players[uid].name)
+                    "Blackjack! %s reached 21, therefore they stand.", self.players[uid].name)
                 self.stand(pid)
             # This players next move
             elif len(self.turns) > 0 and self.turns[0] == uid:
@@ -261,21 +261,18 @@ class Game:
                 self.accept_doubledown = False
                 self.accept_split = False
 
-                self.phenny.write(
-                    ('NOTICE', p.players[uid].name + " Your Hand: " + str(p.players[uid].hand)))   # NOTICE
-                self.phenny.say("Hit. %s. !Stand or !Hit?" %
-                                p.players[uid].name)
+                self.phenny.notice(self.players[uid].name, "Your Hand: %s", self.players[uid].hand)
+                self.phenny.say("Hit. %s. !Stand or !Hit?", self.players[uid].name)
                 self.hooks.on_hit(self, uid)
                 #self.t = Timer(DELAY_TIME, self.stand, [pid, True])
                 # self.t.start()
-            elif len(p.in_game) == 0:
-                self.show_full_table()
-                self.game_over()  # All players lost, end the game
+            elif len(self.in_game) == 0:
+                self.skip_dealer()  # All players lost, end the game
             else:
                 self.next_player()
 
     def is_current_player(self, uid):
-        return p.players[self.turns[0]].uid == uid
+        return self.players[self.turns[0]].uid == uid
 
     def stand(self, pid, auto=False):
         if self.turns and self.is_current_player(pid):
@@ -284,7 +281,7 @@ class Game:
 
             if auto:
                 self.phenny.say(
-                    "%s took too long. They stand automatically." % p.players[uid].name)
+                    "%s took too long. They stand automatically.", self.players[uid].name)
                 self.t = False
             elif self.t and self.t.is_alive():
                 self.t.cancel()
@@ -301,49 +298,40 @@ class Game:
                 self.t.cancel()
                 self.t = False
 
-            bet = p.players[uid].bet
+            bet = self.players[uid].bet
             casino.gold += (bet * 0.25)
-            p.players[0].add_gold(bet/2)
-            p.players[uid].add_gold(bet/2)
+            self.players[0].add_gold(bet/2)
+            self.players[uid].add_gold(bet/2)
 
             if self.hooks:
-                self.hooks.on_loss(p.players[uid], surrender=True)
+                self.hooks.on_loss(self.players[uid], surrender=True)
 
-            p.players[uid].bet = 0
+            self.players[uid].bet = 0
 
-            p.players[uid].surrenders += 1
-            p.players[uid].winning_streak = 0
-            p.players[uid].tie_streak = 0
-            p.players[uid].surrender_streak += 1
-            if p.players[uid].surrender_streak > p.players[uid].surrender_streak_max:
-                p.players[uid].surrender_streak_max = p.players[uid].surrender_streak
-            p.players[uid].losing_streak += 1
-            if p.players[uid].losing_streak > p.players[uid].losing_streak_max:
-                p.players[uid].losing_streak_max = p.players[uid].losing_streak
+            self.players[uid].count_surrender()
 
-            p.remove_from_game(uid)
-            gold = p.players[uid].gold
-            self.phenny.write(('NOTICE', p.players[uid].name + " You surrendered losing half your bet of " + str(
-                bet) + " to the dealer. You have " + str(gold) + " left."))  # NOTICE
+            self.table.remove_from_game(uid)
+            gold = self.players[uid].gold
+            self.phenny.notice(self.players[uid].name, "You surrendered losing half your bet of %s to the dealer. You have %s left.",
+                               bet, gold)
 
             self.next_player()
 
     def doubledown(self, pid):
         if self.accept_doubledown and self.turns and self.is_current_player(pid):
             uid = self.turns[0]
-            bet = p.players[uid].bet
-            self.phenny.say(p.players[uid].place_bet(bet))
-            p.players[uid].did_doubledown = True
+            bet = self.players[uid].bet
+            self.phenny.say(self.players[uid].place_bet(bet))
+            self.players[uid].did_doubledown = True
 
-            p.players[uid].hand.add_card(self.deck.deal_card())
-            self.phenny.say("Hit. %s: %s" %
-                            (p.players[uid].name, str(p.players[uid].hand)))
+            self.players[uid].hand.add_card(self.deck.deal_card())
+            self.phenny.say("Hit. %s: %s", self.players[uid].name, self.players[uid].hand)
 
-            if p.players[uid].hand.hand_value() > 21:
-                casino.gold += (p.players[uid].bet * 0.25)
-                p.players[uid].lose(self.phenny)
+            if self.players[uid].hand.is_bust:
+                casino.gold += (self.players[uid].bet * 0.25)
+                self.players[uid].lose(self.phenny)
                 self.phenny.say(
-                    "BUST! %s went over 21. Their bet was lost to the dealer." % p.players[uid].name)
+                    "BUST! %s went over 21. Their bet was lost to the dealer.", self.players[uid].name)
                 self.next_player()
             else:
                 self.stand(pid)
@@ -356,30 +344,26 @@ class Game:
                 self.t.cancel()
                 self.t = False
             # pay up the new bet
-            p.players[uid].remove_gold(p.players[uid].bet)
-            self.phenny.say("Split. %s has split his hand to two, adding his bet of %s to his second hand" % (
-                p.players[uid].name, p.players[uid].bet))
+            self.players[uid].remove_gold(self.players[uid].bet)
+            self.phenny.say("Split. %s has split his hand to two, adding his bet of %s to his second hand",
+                            self.players[uid].name, self.players[uid].bet)
             # create a fake id for our new player. should work out as unique
-            p.players[uid].splits += 1
-            new_id = p.make_fake_id(uid)
-            splitted = SplitHand(p.players[uid], new_id)
+            self.players[uid].splits += 1
+            new_id = self.table.make_fake_id(uid)
+            splitted = SplitHand(self.players[uid], new_id, self.table)
             # insert this new hand as a fake player
-            p.players[new_id] = splitted
-            p.in_game.append(new_id)
+            self.players[new_id] = splitted
+            self.in_game.append(new_id)
             self.turns.insert(1, new_id)
-            # add the hand_value method to the new "player"
-            p.players[new_id].hand.hand_value = MethodType(
-                hand_value, p.players[new_id].hand)
 
             # hit both of the new players, and evaluate their scores
             deleted = False
             for x, i in enumerate([uid, new_id]):
-                p.players[i].hand.add_card(self.deck.deal_card())
-                self.phenny.say("Hit. %s: %s" %
-                                (p.players[i].name, str(p.players[i].hand)))
+                self.players[i].hand.add_card(self.deck.deal_card())
+                self.phenny.say("Hit. %s: %s", self.players[i].name, self.players[i].hand)
 
-                if p.players[i].hand.hand_value() == 21:
-                    self.phenny.say(p.players[i].win_natural(self.phenny))
+                if self.players[i].hand.total == 21:
+                    self.phenny.say(self.players[i].win_natural(self.phenny))
                     del self.turns[x if not deleted else 0]
                     deleted = True
 
@@ -387,14 +371,14 @@ class Game:
             # will play this player, but the code overlaps
 
     def set_doubledown(self, uid):
-        if p.players[uid].hand.hand_value() in [9, 10, 11] and int(p.players[uid].gold) >= int(p.players[uid].bet):
+        if self.players[uid].hand.total in [9, 10, 11] and int(self.players[uid].gold) >= int(self.players[uid].bet):
             # We allow double downs when hand value is 9,10, or 11 and the player has enough gold to double their bet
             self.accept_doubledown = True
         else:
             self.accept_doubledown = False
 
     def set_split(self, uid):
-        if p.players[uid].hand.cards[0].rank == p.players[uid].hand.cards[1].rank and p.players[uid].gold >= int(p.players[uid].bet) and p.players[uid].splits < 4:
+        if self.players[uid].hand.is_pair and self.players[uid].gold >= int(self.players[uid].bet) and self.players[uid].splits < 4:
             self.accept_split = True
         else:
             self.accept_split = False
@@ -410,73 +394,79 @@ class Game:
             self.dealer_play()  # All turns complete, dealer plays
 
     def _hand(self, uid):
-        self.phenny.write(
-            ('NOTICE', p.players[uid].name + " Your Hand: %s" % p.players[uid].hand))
+        self.phenny.notice(self.players[uid].name, "Your Hand: %s", self.players[uid].hand)
 
     def hand(self, uid):
-        for i in p.in_game:
-            if p.players[i].uid == uid:
-                if self.turns[0] == i and p.players[i].splits > 0:
+        for i in self.in_game:
+            if self.players[i].uid == uid:
+                if self.turns[0] == i and self.players[i].splits > 0:
                     extra = ' <- Current Hand'
                 else:
                     extra = ''
-                self.phenny.write(
-                    ('NOTICE', p.players[i].name + " Your Hand: %s" % p.players[i].hand + extra))
+                self.phenny.notice(self.players[i].name, "Your Hand: %s%s", self.players[i].hand, extra)
+
+    def skip_dealer(self):
+        # No hands are left to play against, so the round ends without the dealer drawing
+        self.hooks.on_skip_dealer(self)
+        self.show_full_table()
+        self.game_over()
 
     def dealer_play(self):
+        if len(self.in_game) == 0:
+            self.skip_dealer()  # Every hand busted or surrendered
+            return
         self.phenny.say(
             "Alright, Dealers Turn. The dealer flips his card upright...")
-        self.phenny.say("Dealer's Hand: " + str(p.players[0].hand))
-        while p.players[0].hand.hand_value() < 17:
-            p.players[0].hand.add_card(self.deck.deal_card())
-            self.phenny.say("Hit. Dealer: " + str(p.players[0].hand))
-            if p.players[0].hand.hand_value() > 21:
+        self.phenny.say("Dealer's Hand: %s", self.players[0].hand)
+        while self.players[0].hand.total < 17:
+            self.players[0].hand.add_card(self.deck.deal_card())
+            self.phenny.say("Hit. Dealer: %s", self.players[0].hand)
+            if self.players[0].hand.is_bust:
                 self.phenny.say(
                     "BUST! The Dealer went over 21. All remaining players win!")
-                for uid in p.in_game[:]:
-                    p.players[uid].win(self.phenny, (p.players[uid].bet * 2))
+                for uid in self.in_game[:]:
+                    self.players[uid].win(self.phenny, (self.players[uid].bet * 2))
                 self.game_over()
                 break
         else:
-            self.phenny.say("Stay. Dealers finishing hand: " +
-                            str(p.players[0].hand))
+            self.phenny.say("Stay. Dealers finishing hand: %s", self.players[0].hand)
             self.calc_winners()
 
     def calc_winners(self):
         self.phenny.say("Results for remaining players:")
         self.show_full_table()
-        dealer_value = p.players[0].hand.hand_value()
+        dealer_value = self.players[0].hand.total
 
-        for uid in p.in_game[:]:
-            player_value = p.players[uid].hand.hand_value()
+        for uid in self.in_game[:]:
+            player_value = self.players[uid].hand.total
             if dealer_value > player_value or player_value > 21:
-                self.phenny.say("Dealer's hand beat %s's hand by %d points." % (
-                    p.players[uid].name, dealer_value - player_value))
-                casino.gold += (p.players[uid].bet * 0.25)
-                p.players[uid].lose(self.phenny)
+                self.phenny.say("Dealer's hand beat %s's hand by %d points.",
+                                self.players[uid].name, dealer_value - player_value)
+                casino.gold += (self.players[uid].bet * 0.25)
+                self.players[uid].lose(self.phenny)
             elif dealer_value == player_value:
                 self.phenny.say(
-                    "There was a tie between %s and the dealer." % p.players[uid].name)
-                p.players[uid].tie(self.phenny)
+                    "There was a tie between %s and the dealer.", self.players[uid].name)
+                self.players[uid].tie(self.phenny)
             else:
-                self.phenny.say("%s's hand beat the Dealer's hand by %d points." % (
-                    p.players[uid].name, player_value - dealer_value))
-                self.phenny.say(p.players[uid].win(
-                    self.phenny, (p.players[uid].bet * 2)))
+                self.phenny.say("%s's hand beat the Dealer's hand by %d points.",
+                                self.players[uid].name, player_value - dealer_value)
+                self.phenny.say(self.players[uid].win(
+                    self.phenny, (self.players[uid].bet * 2)))
         self.game_over()  # Now end the game
 
     def game_over(self):
         self.hooks.on_game_over(self)
 
-        del p.in_game[:]
-        del p.players[0]
+        del self.in_game[:]
+        del self.players[0]
         if self.t and self.t.is_alive():
             self.t.cancel()
             self.t = False
-        for uid in p.players:
-            p.players[uid].bet = 0
-            p.players[uid].in_game = False
-            p.players[uid].hand.empty_hand()
+        for uid in self.players:
+            self.players[uid].bet = 0
+            self.players[uid].in_game = False
+            self.players[uid].hand.empty_hand()
         self.phenny.say("Game Over!")
 
         # Update casino's game variables
@@ -1,12 +1,19 @@
 #!/usr/bin/env python
 
 import random
+from array import array
 
 # Global for cards
 SUITS = ("H", "D", 'S', 'C')
 RANKS = ('A', '2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K')
 VALUES = {'A':1, '2':2, '3':3, '4':4, '5':5, '6':6, '7':7, '8':8, '9':9, '10':10, 'J':10, 'Q':10, 'K':10}
 
+# Compact cards are small ints: suit index * 13 + rank index, so `code % 13` is the rank index
+ACE = 0
+RANK_VALUES = tuple(VALUES[rank] for rank in RANKS)
+CARD_RANKS = tuple(code % len(RANKS) for code in range(len(SUITS) * len(RANKS)))
+CARD_VALUES = tuple(RANK_VALUES[rank] for rank in CARD_RANKS)
+
 
 class Card:
     # An object for creating cards with specific suits and ranks
@@ -14,9 +21,15 @@ class Card:
         if (suit in SUITS) and (rank in RANKS):
             self.suit = suit
             self.rank = rank
+            self.index = RANKS.index(rank)
+            self.code = SUITS.index(suit) * len(RANKS) + self.index
+            self.value = VALUES[rank]
         else:
             self.suit = None
             self.rank = None
+            self.index = None
+            self.code = None
+            self.value = 0
             print("Invalid card: {0}{1}".format(rank, suit))# DEBUG
 
     def __str__(self):
@@ -26,28 +39,109 @@ class Card:
             return "{}{}".format(self.rank, self.suit)
 
 
+# Shared `Card` views of the compact cards, indexed by card code
+CARDS = tuple(Card(suit, rank) for suit in SUITS for rank in RANKS)
+
+
 class Deck:
-    # An object for building the deck of cards using the Card object
-    def __init__(self):
-        self.cards = []
-        for suit in SUITS:
-            for rank in RANKS:
-                self.cards.append(Card(suit, rank))
+    # An object for building the deck of cards using the Card object, shuffled with
+    # `rng` (anything with a `shuffle`, like `random.Random`)
+    def __init__(self, rng=random):
+        self.cards = list(CARDS)
+        self.random = rng
 
     def __str__(self):
         return "Deck: " + " ".join(str(c) for c in self.cards)
 
     def shuffle(self):
-        random.shuffle(self.cards)
+        self.random.shuffle(self.cards)
 
     def deal_card(self):
         return self.cards.pop(0)
 
 
+class CompactDeck:
+    # A shoe of `decks` decks stored as card codes, dealt by moving a cursor through it
+    def __init__(self, decks=1, rng=random):
+        self.cards = array('B', range(len(CARDS))) * decks
+        self.pos = 0
+        self.random = rng
+        # Times the cards were shuffled, so anything following the dealt cards knows to
+        # start over
+        self.shuffles = 0
+
+    def __str__(self):
+        return "Deck: " + " ".join(str(CARDS[c]) for c in self.cards[self.pos:])
+
+    def __len__(self):
+        return len(self.cards) - self.pos
+
+    def shuffle(self):
+        self.random.shuffle(self.cards)
+        self.pos = 0
+        self.shuffles += 1
+
+    def deal(self):
+        # Deal a compact card
+        card = self.cards[self.pos]
+        self.pos += 1
+        return card
+
+    def deal_card(self):
+        # Deal a `Card` view
+        card = self.cards[self.pos]
+        self.pos += 1
+        return CARDS[card]
+
+
+class Shoe(CompactDeck):
+    # A shoe of 1-8 decks that is kept between rounds. The cut card is placed after
+    # `penetration` (0-1) of the shoe, and the shoe is only reshuffled at the start of a
+    # round once the cut card has been reached. A penetration of 0 reshuffles every round.
+    def __init__(self, decks=2, penetration=0.0, rng=random):
+        if not 1 <= decks <= 8:
+            raise ValueError("A shoe holds 1-8 decks")
+        if not 0 <= penetration <= 1:
+            raise ValueError("Penetration must be between 0 and 1")
+        CompactDeck.__init__(self, decks, rng)
+        self.decks = decks
+        self.penetration = penetration
+        self.cut = int(len(self.cards) * penetration)
+        self.reset()
+
+    def reset(self):
+        # Put the cards back in order, a new shoe is shuffled before the first round
+        self.cards = array('B', range(len(CARDS))) * self.decks
+        self.pos = len(self.cards)
+        self.shuffles += 1
+
+    def start_round(self):
+        if self.pos >= self.cut:
+            self.shuffle()
+
+    def deal(self):
+        try:
+            card = self.cards[self.pos]
+        except IndexError:
+            # Ran out of cards in the middle of a round, reshuffle the whole shoe
+            self.shuffle()
+            card = self.cards[0]
+        self.pos += 1
+        return card
+
+    def deal_card(self):
+        return CARDS[self.deal()]
+
+
 class Hand:
     # An object for building a players hand, with cards drawn from the deck
+    __slots__ = ('cards', 'value', 'aces')
+
     def __init__(self):
         self.cards = []
+        # Running total counting aces as 1, and how many aces there are
+        self.value = 0
+        self.aces = 0
 
     def __str__(self):
         return " ".join(str(c) for c in self.cards) + " "
@@ -55,21 +149,89 @@ class Hand:
 
     def add_card(self, card):
         self.cards.append(card)
+        self.value += card.value
+        if card.index == ACE:
+            self.aces += 1
 
     def remove_card(self, index):
-        return self.cards.pop(int(index))
+        card = self.cards.pop(int(index))
+        self.value -= card.value
+        if card.index == ACE:
+            self.aces -= 1
+        return card
 
     def empty_hand(self):
         del self.cards[:]
+        self.value = 0
+        self.aces = 0
 
     def get_value(self):
         # Count ace's as 1 by default, can override this in the various games
-        return sum(VALUES[card.rank] for card in self.cards)
+        return self.value
 
     def number_cards(self):
         return ", ".join("{} - {}".format(i, card)
                          for i, card in enumerate(self.cards, 1))
 
 
+class BlackjackHand(Hand):
+    # A blackjack hand, keeping its blackjack value up to date as cards are added and
+    # removed: `total` counts an ace as 11 if that doesn't bust the hand, which makes it
+    # soft. Also kept are whether it's a pair, bust or a natural (21 with two cards).
+    __slots__ = ('total', 'is_soft', 'is_pair', 'is_bust', 'is_natural')
+
+    def __init__(self):
+        self.cards = []
+        self.value = self.aces = self.total = 0
+        self.is_soft = self.is_pair = self.is_bust = self.is_natural = False
+
+    def update(self):
+        held = self.cards
+        value = self.value
+        self.is_soft = soft = value <= 11 and self.aces > 0
+        self.total = total = value + 10 if soft else value
+        self.is_bust = total > 21
+        if len(held) == 2:
+            self.is_pair = held[0].index == held[1].index
+            self.is_natural = total == 21
+        else:
+            self.is_pair = self.is_natural = False
+
+    def add_card(self, card):
+        # Called for every card dealt, so it updates the hand itself
+        held = self.cards
+        held.append(card)
+        self.value = value = self.value + card.value
+        if card.index == ACE:
+            self.aces += 1
+        if value <= 11 and self.aces:
+            self.total = total = value + 10
+            self.is_soft = True
+        else:
+            self.total = total = value
+            self.is_soft = False
+        self.is_bust = total > 21
+        count = len(held)
+        if count == 2:
+            self.is_pair = held[0].index == card.index
+            self.is_natural = total == 21
+        elif count == 3:
+            # Only two cards make a pair or a natural
+            self.is_pair = self.is_natural = False
+
+    def remove_card(self, index):
+        card = Hand.remove_card(self, index)
+        self.update()
+        return card
+
+    def empty_hand(self):
+        Hand.empty_hand(self)
+        self.update()
+
+    def hand_value(self):
+        # The hand's value, as `blackjack.hand_value` used to be bound to each hand
+        return self.total
+
+
 if __name__ == '__main__':
     print(__doc__)
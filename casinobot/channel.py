@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+
+# Output levels, a channel only sends messages at or below its own level
+QUIET = 0
+SAY = 1     # messages to the whole channel
+NOTICE = 2  # NOTICEs to a single player
+
+
+class Message:
+    # A message whose formatting is deferred until it is actually sent
+    def __init__(self, fmt, *args):
+        self.fmt = fmt
+        self.args = args
+
+    def __str__(self):
+        if self.args:
+            return self.fmt % self.args
+        return self.fmt
+
+
+class Channel:
+    # Wraps Phenny for the games, building messages only if they're going to be sent.
+    # Messages can be plain strings, `Message`s, callables returning a string, or a
+    # format string followed by its arguments.
+    def __init__(self, phenny, level=NOTICE):
+        self.phenny = phenny
+        self.level = level
+
+    @staticmethod
+    def wrap(phenny):
+        if isinstance(phenny, Channel):
+            return phenny
+        return Channel(phenny)
+
+    @staticmethod
+    def render(msg, args):
+        if args:
+            return msg % args
+        if callable(msg):
+            return msg()
+        return str(msg)
+
+    def enabled(self, level):
+        return level <= self.level
+
+    def say(self, msg, *args):
+        if self.level >= SAY:
+            self.phenny.say(self.render(msg, args))
+
+    def notice(self, nick, msg, *args):
+        if self.level >= NOTICE:
+            self.phenny.write(('NOTICE', nick + " " + self.render(msg, args)))
+
+
+if __name__ == '__main__':
+    print(__doc__)
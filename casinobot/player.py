@@ -1,27 +1,25 @@
 #!/usr/bin/env python
 
+from operator import attrgetter
+
 from casinobot import cards
+from casinobot.channel import Message
 
-# Global players dictionary for holding currently playing users
-players = dict()
-in_game = []
 
+class Bankroll:
+    # A player's gold and record, shared with the hands they split into so that every
+    # hand plays from the same gold and counts towards the same wins, losses and streaks
+    __slots__ = ('gold', 'splits', 'wins', 'nats', 'losses', 'ties', 'surrenders', 'natlosses',
+                 'losing_streak', 'losing_streak_max', 'winning_streak', 'winning_streak_max',
+                 'tie_streak', 'tie_streak_max', 'surrender_streak', 'surrender_streak_max')
 
-class Player:
-    # An object for building players
-    def __init__(self, uid, name):
-        self.uid = uid
-        self.name = name
+    def __init__(self):
         self.gold = 0
-        self.bet = 0
-        self.hand = cards.Hand()
-        self.in_game = False
-        self.did_doubledown = False
+        self.splits = 0
         self.wins = 0
         self.nats = 0
         self.losses = 0
         self.ties = 0
-        self.splits = 0
         self.surrenders = 0
         self.natlosses = 0
         self.losing_streak = 0
@@ -32,7 +30,82 @@ class Player:
         self.tie_streak_max = 0
         self.surrender_streak = 0
         self.surrender_streak_max = 0
+
+    # Functions for counting wins/losses/ties
+    def count_win(self):
+        self.wins += 1
+        self.losing_streak = 0
+        self.tie_streak = 0
+        self.surrender_streak = 0
+        self.winning_streak += 1
+        if self.winning_streak > self.winning_streak_max:
+            self.winning_streak_max = self.winning_streak
+
+    def count_loss(self):
+        self.losses += 1
+        self.winning_streak = 0
+        self.tie_streak = 0
+        self.surrender_streak = 0
+        self.losing_streak += 1
+        if self.losing_streak > self.losing_streak_max:
+            self.losing_streak_max = self.losing_streak
+
+    def count_tie(self):
+        self.ties += 1
+        self.tie_streak += 1
+        if self.tie_streak > self.tie_streak_max:
+            self.tie_streak_max = self.tie_streak
+
+    def count_surrender(self):
+        self.surrenders += 1
+        self.winning_streak = 0
+        self.tie_streak = 0
+        self.surrender_streak += 1
+        if self.surrender_streak > self.surrender_streak_max:
+            self.surrender_streak_max = self.surrender_streak
+        self.losing_streak += 1
+        if self.losing_streak > self.losing_streak_max:
+            self.losing_streak_max = self.losing_streak
+
+
+def bankroll_attr(name):
+    # A player attribute that reads and writes their bankroll's
+    def set_attr(self, value):
+        setattr(self.bankroll, name, value)
+    return property(attrgetter('bankroll.' + name), set_attr)
+
+
+class Player:
+    # An object for building players, sitting at `table` (the default table if None)
+    __slots__ = ('uid', 'name', 'bet', 'hand', 'in_game', 'did_doubledown', 'hooks', 'table', 'bankroll')
+
+    def __init__(self, uid, name, table=None):
+        self.uid = uid
+        self.name = name
+        self.bet = 0
+        self.hand = cards.BlackjackHand()
+        self.in_game = False
+        self.did_doubledown = False
         self.hooks = None
+        self.table = table if table is not None else default_table
+        self.bankroll = Bankroll()
+
+    gold = bankroll_attr('gold')
+    splits = bankroll_attr('splits')
+    wins = bankroll_attr('wins')
+    nats = bankroll_attr('nats')
+    losses = bankroll_attr('losses')
+    ties = bankroll_attr('ties')
+    surrenders = bankroll_attr('surrenders')
+    natlosses = bankroll_attr('natlosses')
+    losing_streak = bankroll_attr('losing_streak')
+    losing_streak_max = bankroll_attr('losing_streak_max')
+    winning_streak = bankroll_attr('winning_streak')
+    winning_streak_max = bankroll_attr('winning_streak_max')
+    tie_streak = bankroll_attr('tie_streak')
+    tie_streak_max = bankroll_attr('tie_streak_max')
+    surrender_streak = bankroll_attr('surrender_streak')
+    surrender_streak_max = bankroll_attr('surrender_streak_max')
 
     def __str__(self):
         string = "Player ID: %s  Name: %s  Gold: %d  Wins: %d  Losses: %d" % (
@@ -48,14 +121,15 @@ class Player:
         self.in_game = False
 
     def add_gold(self, gold):
-        self.gold += int(gold)
+        self.bankroll.gold += int(gold)
         return True
 
     def remove_gold(self, gold):
+        bankroll = self.bankroll
         gold = int(gold)
-        if gold > self.gold:
-            gold = self.gold
-        self.gold -= gold
+        if gold > bankroll.gold:
+            gold = bankroll.gold
+        bankroll.gold -= gold
 
     def place_bet(self, amount):
         amount = int(amount)
@@ -64,151 +138,199 @@ class Player:
         else:
             self.remove_gold(amount)
             self.bet += amount
-            return '%s placed a bet of %d gold. They have %d gold left.' % (self.name, amount, self.gold)
+            return Message('%s placed a bet of %d gold. They have %d gold left.', self.name, amount, self.gold)
 
     def remove_from_game(self):
-        remove_from_game(self.uid)
+        self.table.remove_from_game(self.uid)
 
     # Functions for winning/losing/ties
+    def count_win(self):
+        self.bankroll.count_win()
+
+    def count_loss(self):
+        self.bankroll.count_loss()
+
+    def count_tie(self):
+        self.bankroll.count_tie()
+
+    def count_surrender(self):
+        self.bankroll.count_surrender()
+
     def win_natural(self, phenny):
-        self.wins += 1
-        self.nats += 1
-        self.losing_streak = 0
-        self.tie_streak = 0
-        self.surrender_streak = 0
-        self.winning_streak += 1
-        if self.winning_streak > self.winning_streak_max:
-            self.winning_streak_max = self.winning_streak
+        self.bankroll.count_win()
+        self.bankroll.nats += 1
         winnings = self.bet * 1.5
         self.add_gold(winnings + self.bet)
         if self.hooks:
             self.hooks.on_win(self, nat=True)
         self.bet = 0
         self.remove_from_game()
-        phenny.write(('NOTICE', self.name + " You won " +
-                      str(winnings) + " gold!"))  # NOTICE
-        return "%s has a natural blackjack! They won %d gold (1.5x bet)! They now have %d gold." % (self.name, winnings, self.gold)
+        phenny.notice(self.name, "You won %s gold!", winnings)
+        return Message("%s has a natural blackjack! They won %d gold (1.5x bet)! They now have %d gold.", self.name, winnings, self.gold)
 
     def win(self, phenny, amount):
-        self.wins += 1
-        self.losing_streak = 0
-        self.tie_streak = 0
-        self.surrender_streak = 0
-        self.winning_streak += 1
-        if self.winning_streak > self.winning_streak_max:
-            self.winning_streak_max = self.winning_streak
+        self.bankroll.count_win()
         self.add_gold(amount)
         winnings = amount - self.bet
         if self.hooks:
             self.hooks.on_win(self)
         self.bet = 0
         self.remove_from_game()
-        phenny.write(('NOTICE', self.name + " You won " +
-                      str(winnings) + " gold!"))  # NOTICE
-        return "%s beat the dealer! They won %d gold! They now have %d gold." % (self.name, winnings, self.gold)
+        phenny.notice(self.name, "You won %s gold!", winnings)
+        return Message("%s beat the dealer! They won %d gold! They now have %d gold.", self.name, winnings, self.gold)
 
     def lose(self, phenny):
-        self.losses += 1
-        self.winning_streak = 0
-        self.tie_streak = 0
-        self.surrender_streak = 0
-        self.losing_streak += 1
-        if self.losing_streak > self.losing_streak_max:
-            self.losing_streak_max = self.losing_streak
-        if 0 in players:
-            players[0].add_gold(self.bet)
+        self.bankroll.count_loss()
+        if 0 in self.table.players:
+            self.table.players[0].add_gold(self.bet)
         bet = self.bet
         if self.hooks:
             self.hooks.on_loss(self)
         self.bet = 0
         self.remove_from_game()
-        phenny.write(('NOTICE', self.name + " You lost your bet of " +
-                      str(bet) + " gold. You have " + str(self.gold) + " left."))  # NOTICE
+        phenny.notice(self.name, "You lost your bet of %s gold. You have %s left.", bet, self.gold)
 
     def tie(self, phenny):
-        self.ties += 1
-        self.tie_streak += 1
-        if self.tie_streak > self.tie_streak_max:
-            self.tie_streak_max = self.tie_streak
+        self.bankroll.count_tie()
         self.add_gold(self.bet)
         if self.hooks:
             self.hooks.on_tie(self)
         self.bet = 0
         self.remove_from_game()
-        phenny.write(
-            ('NOTICE', self.name + " Your bet was returned to you."))  # NOTICE
+        phenny.notice(self.name, "Your bet was returned to you.")
+
+
+class Table:
+    # A blackjack table: the players sitting at it, the ones in the current game in turn
+    # order, and the shoe games are dealt from (None shuffles a new deck every game).
+    # Tables are independent of each other, so any number of games can be played at once.
+    def __init__(self, shoe=None):
+        self.players = dict()
+        self.in_game = []
+        self.shoe = shoe
+        self.dealer = None
+
+    # BASIC FUNCTIONS
+    def add_player(self, uid, nick):
+        self.players[uid] = Player(uid, nick, self)
+        return self.players[uid]
+
+    def remove_player(self, uid):
+        del self.players[uid]
+
+    def seat_dealer(self, gold):
+        # The dealer is kept between games, and only seated for the length of one
+        if self.dealer is None:
+            self.dealer = Player(0, 'Dealer', self)
+        self.dealer.gold = gold
+        self.dealer.bet = 0
+        self.dealer.hand.empty_hand()
+        self.players[0] = self.dealer
+        return self.dealer
+
+    def name_to_uid(self, name):
+        for uid in self.players:
+            if self.players[uid].name.lower() == name.lower():
+                return uid
+        else:
+            return None
+
+    def list_players(self):
+        player_names = ''
+        for uid in self.players:
+            player_names += self.players[uid].name + ', '
+        return "All Players: %s" % player_names[:-2]
+
+    def list_bets(self):
+        all_bets = ''
+        for uid in self.in_game:
+            all_bets += self.players[uid].name + " - " + str(self.players[uid].bet) + "  "
+        return "All Bets: %s " % all_bets[:-2]
+
+    # IN-GAME FUNCTIONS
+    def add_to_game(self, phenny, uid):
+        players = self.players
+        if uid in players.keys():
+            players[uid].did_doubledown = False
+            if uid in self.in_game:
+                return "You already joined the game!"
+            else:
+                self.in_game.append(uid)
+                players[uid].in_game = True
+                # If player hasn't bought in yet, suggest they do
+                if players[uid].gold == 0:
+                    phenny.notice(
+                        players[uid].name, "You have joined the game but not bought in yet. Use '!buy amount' to buy in.")
+                return Message("%s joined the game.", players[uid].name)
+
+    def make_fake_id(self, uid):
+        return str(uid) + "'s split" + str(self.players[uid].splits)
+
+    def remove_from_game(self, uid):
+        self.in_game.remove(uid)
+        self.players[uid].in_game = False
+
+    def list_in_game(self):
+        player_names = ''
+        for uid in self.in_game:
+            player_names += self.players[uid].name + ', '
+        return "Players In-Game: %s" % player_names[:-2]
+
+    def deal(self, deck, amount):
+        players = self.players
+        while amount > 0:
+            for uid in players:
+                if players[uid].in_game == True or uid == 0:
+                    players[uid].hand.add_card(deck.deal_card())
+            amount -= 1
+
+
+# The IRC bot's table, with its players dictionary and in-game list as globals
+default_table = Table()
+players = default_table.players
+in_game = default_table.in_game
 
 
 # BASIC FUNCTIONS
 def add_player(uid, nick):
-    players[uid] = Player(uid, nick)
+    default_table.add_player(uid, nick)
 
 
 def remove_player(uid):
-    del players[uid]
+    default_table.remove_player(uid)
 
 
 def name_to_uid(name):
-    for uid in players:
-        if players[uid].name.lower() == name.lower():
-            return uid
-    else:
-        return None
+    return default_table.name_to_uid(name)
 
 
 def list_players():
-    player_names = ''
-    for uid in players:
-        player_names += players[uid].name + ', '
-    return "All Players: %s" % player_names[:-2]
+    return default_table.list_players()
 
 
 def list_bets():
-    all_bets = ''
-    for uid in in_game:
-        all_bets += players[uid].name + " - " + str(players[uid].bet) + "  "
-    return "All Bets: %s " % all_bets[:-2]
+    return default_table.list_bets()
 
 
 # IN-GAME FUNCTIONS
 def add_to_game(phenny, uid):
-    uid = uid
-    if uid in players.keys():
-        players[uid].did_doubledown = False
-        if uid in in_game:
-            return "You already joined the game!"
-        else:
-            in_game.append(uid)
-            players[uid].in_game = True
-            # If player hasn't bought in yet, suggest they do
-            if players[uid].gold == 0:
-                phenny.write(
-                    ('NOTICE', players[uid].name + " You have joined the game but not bought in yet. Use '!buy amount' to buy in."))  # NOTICE
-            return "{0} joined the game.".format(players[uid].name)
+    return default_table.add_to_game(phenny, uid)
 
 
 def make_fake_id(uid):
-    return str(uid) + "'s split" + str(players[uid].splits)
+    return default_table.make_fake_id(uid)
 
 
 def remove_from_game(uid):
-    in_game.remove(uid)
-    players[uid].in_game = False
+    default_table.remove_from_game(uid)
 
 
 def list_in_game():
-    player_names = ''
-    for uid in in_game:
-        player_names += players[uid].name + ', '
-    return "Players In-Game: %s" % player_names[:-2]
+    return default_table.list_in_game()
 
 
 def deal(deck, amount):
-    while amount > 0:
-        for uid in players:
-            if players[uid].in_game == True or uid == 0:
-                players[uid].hand.add_card(deck.deal_card())
-        amount -= 1
+    default_table.deal(deck, amount)
 
 
 if __name__ == '__main__':
@@ -1,49 +1,33 @@
-import shelve
-
 from casinobot import cards, player
 
 
-class HalfProxy:
+class SplitHand(player.Player):
     """
-    A class which presents an implementation to proxy to another object,
-    barring certain variables which were set up to be local.
+    A hand split off from a player, with its own bet and cards but playing from the
+    player's bankroll, so its gold, wins, losses and streaks are the player's.
     """
+    __slots__ = ('fake_id', 'parent')
 
-    def __getattr__(self, item):
-        """
-        Return the parent's attributes if not specifically defined
-        here.
-        """
-        return getattr(self.parent, item)
-
-    def __setattr__(self, item, value):
-        """
-        If we've defined a parent, and we don't have the attribute, then set the 
-        parent's copy of it instead of ours. Otherwise, set ours.
-        """
-        if 'parent' in self.__dict__ and hasattr(self.parent,
-                                                 item) and item not in self.__dict__:
-            setattr(self.parent, item, value)
-        else:
-            self.__dict__[item] = value
-
-
-class SplitHand(HalfProxy, player.Player):
-
-    def __init__(self, player, fake_id):
+    def __init__(self, player, fake_id, table=None):
         """
         Takes in an originating player as the first argument and
-        the card to start with as the second
+        the card to start with as the second, sitting at `table`
+        (the player's table if None)
         """
+        self.uid = player.uid
+        self.name = player.name
         # start off with the original bet
         self.bet = player.bet
-        self.hand = cards.Hand()
+        self.hand = cards.BlackjackHand()
         # split the hand between self and parent
         self.hand.add_card(player.hand.remove_card(1))
         self.fake_id = fake_id
         self.in_game = True
         self.did_doubledown = False
+        self.hooks = player.hooks
+        self.table = table if table is not None else player.table
+        self.bankroll = player.bankroll
         self.parent = player
 
     def remove_from_game(self):
-        player.remove_from_game(self.fake_id)
+        self.table.remove_from_game(self.fake_id)
@@ -1,11 +1,18 @@
 import getopt
-import math
+import itertools
 import multiprocessing
-import statistics
 import sys
 import time
+from array import array
 
-from simulator import betting, simulator, stats, strategy
+from casinobot import cards
+from simulator import analysis, betting, dealer, engine, generator, outcomes, profiling, records, results, seats, simulator, stats, strategy
+
+try:
+    from simulator import vectorized
+except ImportError:
+    # NumPy isn't installed
+    vectorized = None
 
 
 BETTING_SYSTEMS = {
@@ -15,7 +22,24 @@ BETTING_SYSTEMS = {
     "fp": betting.FPBetting,
     "fibonacci": betting.Fibonacci,
     "labouchere": betting.Labouchere,
-    "simple": betting.SimpleBetting
+    "simple": betting.SimpleBetting,
+    "counting": betting.Counting
+}
+
+
+ENGINES = {
+    "casinobot": simulator.BlackjackSimulator,
+    "fast": engine.FastBlackjackSimulator,
+}
+
+if vectorized is not None:
+    ENGINES["numpy"] = vectorized.VectorizedBlackjackSimulator
+
+
+# Engines that can play a table of several seats
+TABLE_ENGINES = {
+    "casinobot": seats.TableSimulator,
+    "fast": seats.FastTableSimulator,
 }
 
 
@@ -23,6 +47,16 @@ HELP_GENERAL = [
     (['-h', '--help'], ['print this help']),
     (['-v', '--verbose'], ['print a LOT of extra info']),
     (['-f', '--out-file'], ['output the results to a file']),
+    (['    --format=FORMAT'],
+     ['format of the results: "text", "json", "csv" or "parquet",', 'the others written to --out-file or stdout instead of',
+      'the text, which goes to stderr (default "text")']),
+    (['    --iteration-rows'],
+     ['add a row per iteration to --format output, in a second', 'table next to --out-file for "csv" and "parquet"']),
+    (['    --profile'],
+     ['time each phase of the rounds (dealing, choosing actions,', 'strategy lookups, betting, dealer play...) and print',
+      'where the time went']),
+    (['    --pstats=DIR'],
+     ['cProfile every process, writing a pstats file per process', 'to DIR']),
 ]
 
 
@@ -35,7 +69,37 @@ HELP_SIMULATOR = [
     (['    --threads'],
      ['how many processes to run the simulation on (default 0 = auto)']),
     (['    --anti-fallacy'],
-     ['enable anti-fallacy strat (after a loss, bet 0 until a win, repeat)'])
+     ['enable anti-fallacy strat (after a loss, bet 0 until a win, repeat)']),
+    (['    --engine=ENGINE'],
+     ['blackjack engine to play rounds with, "casinobot",', 'the headless "fast", or "numpy" for flat bets',
+      '(default "casinobot")']),
+    (['    --decks=DECKS'], ['how many decks (1-8) are in the shoe (default 2)']),
+    (['    --penetration=PEN'],
+     ['fraction (0-1) of the shoe dealt before the cut card', 'and a reshuffle, 0 = every round (default 0)']),
+    (['    --seed=SEED'],
+     ['seed for a reproducible run, every iteration plays', 'the same regardless of --threads']),
+    (['    --skip=N'],
+     ['start from iteration N of a seeded run, e.g. to rerun', 'a single iteration with --iterations=1 (default 0)']),
+    (['    --analyze'],
+     ['calculate the expected value of the strategy per round and', 'strat table cell instead of simulating, from a shoe of',
+      '--decks decks (0 = infinite)']),
+    (['    --generate=FILE'],
+     ['write the strategy with the highest expected value for', '--decks decks (0 = infinite) to FILE and analyze it']),
+    (['    --dealer-cache=FILE'],
+     ["keep the dealer's outcome probabilities in FILE between", '--analyze and --generate runs']),
+    (['    --record=FILE'],
+     ['record the outcomes of --iterations iterations of --rounds', 'rounds played at flat bets to FILE instead of simulating']),
+    (['    --replay=FILE'],
+     ['play the betting system against the outcomes recorded in', 'FILE instead of dealing cards']),
+    (['    --round-file=FILE'],
+     ["write every round's gold won, gold after it, hands and", 'flags to FILE, readable as a NumPy array']),
+    (['    --seat=SEAT'],
+     ['add a seat STRAT[:SYSTEM[:OPTIONS]] to a table of up to {}'.format(seats.SEATS),
+      'seats dealt from one shoe, each with its own bankroll of',
+      '--gold, SYSTEM and OPTIONS default to --bet-system and',
+      '--bet-options (engines "casinobot" and "fast")']),
+    (['    --trajectories=FILE'],
+     ['write the gold trajectories of {} randomly sampled'.format(stats.TRAJECTORIES), 'iterations to FILE as CSV']),
 ]
 
 
@@ -45,6 +109,9 @@ HELP_BETTING = [
      ['comma-separated key=value list of options', 'to pass to the betting system']),
     (['-p', '--positive-prog'], ['use positive progression instead of negative']),
     (['    --list-bet-systems'], ['list available betting systems']),
+    (['    --sweep=GRID'],
+     ['comma-separated key=value1|value2|... list of bet options,', 'runs every combination on top of --bet-options',
+      'against the same cards and prints a table of the results']),
 ]
 
 
@@ -85,21 +152,174 @@ def usage(file):
     print("  {}".format(", ".join(sorted(BETTING_SYSTEMS.keys()))))
 
 
-def worker(num, iterations, outq, bjs, rounds, gold):
+# Each pool process keeps its own copy of the simulator, set up by `init_worker`
+worker_bjs = None
+worker_rounds = 0
+worker_gold = 0
+worker_seed = None
+worker_rows = False
+worker_profile = None
+
+
+def init_worker(bjs, rounds, gold, seed, rows=False, profile=None):
+    global worker_bjs, worker_rounds, worker_gold, worker_seed, worker_rows, worker_profile
+    worker_bjs = bjs
+    worker_rounds = rounds
+    worker_gold = gold
+    worker_seed = seed
+    worker_rows = rows
+    worker_profile = profile
+    if seed is None:
+        # Every process starts with a copy of the same random state otherwise
+        bjs.set_seed(None)
+    if profile is not None:
+        profile.install()
+
+
+def add_reason(reasons, reason, st):
+    if reason not in reasons:
+        reasons[reason] = {"gold_end": stats.RunningStats(), "hands": stats.RunningStats()}
+    reasons[reason]["gold_end"].add_value(st.gold_end)
+    reasons[reason]["hands"].add_value(st.total_hands)
+
+
+def iteration_row(i, config, reason, st):
+    # In the order of `results.ITERATION_COLUMNS`, with the index of the bet option set
+    # in place of its options
+    return (i, config, reason, st.gold_end, st.total_hands, st.max_drawdown, st.peak_round, st.ruin_round)
+
+
+def run_batch(batch):
+    (first, iterations) = batch
     total_stats = stats.BlackjackStats()
-    total_stats.gold_min = gold
+    total_stats.gold_min = worker_gold
     reasons = {}
-    for _ in range(iterations):
-        bjs.reset()
-        (reason, st) = bjs.run(rounds)
+    rows = []
+    if worker_profile is not None:
+        worker_profile.start()
+    for i in range(first, first + iterations):
+        if worker_seed is not None:
+            worker_bjs.set_seed(simulator.iteration_seed(worker_seed, i))
+        worker_bjs.reset()
+        (reason, st) = worker_bjs.run(worker_rounds, i)
 
         total_stats.add(st)
-        if reason not in reasons:
-            reasons[reason] = {"count": 0, "gold_end": [], "hands": []}
-        reasons[reason]["count"] += 1
-        reasons[reason]["gold_end"].append(st.gold_end)
-        reasons[reason]["hands"].append(st.total_hands)
-    outq.put((reasons, total_stats))
+        add_reason(reasons, reason, st)
+        if worker_rows:
+            rows.append(iteration_row(i, 0, reason, st))
+    phases = worker_profile.stop() if worker_profile is not None else None
+    return (iterations, reasons, total_stats, rows, phases)
+
+
+def run_sweep_batch(batch):
+    # Same as `run_batch`, with `worker_bjs` a `BettingSweep` or `TableSimulator` and
+    # results per bet option set or seat
+    (first, iterations) = batch
+    reasons = None
+    total_stats = None
+    rows = []
+    if worker_profile is not None:
+        worker_profile.start()
+    for i in range(first, first + iterations):
+        if worker_seed is not None:
+            worker_bjs.set_seed(simulator.iteration_seed(worker_seed, i))
+        sweep_results = worker_bjs.run(worker_rounds, i)
+
+        if reasons is None:
+            reasons = [{} for _ in sweep_results]
+            total_stats = [stats.BlackjackStats() for _ in sweep_results]
+            for st in total_stats:
+                st.gold_min = worker_gold
+        for (config, (config_reasons, config_stats, (reason, st))) in enumerate(zip(reasons, total_stats, sweep_results)):
+            config_stats.add(st)
+            add_reason(config_reasons, reason, st)
+            if worker_rows:
+                rows.append(iteration_row(i, config, reason, st))
+    phases = worker_profile.stop() if worker_profile is not None else None
+    return (iterations, reasons, total_stats, rows, phases)
+
+
+def run_record_batch(batch):
+    # Same as `run_batch`, with `worker_bjs` an `OutcomeRecorder`
+    (first, iterations) = batch
+    codes = array('I')
+    for i in range(first, first + iterations):
+        if worker_seed is not None:
+            worker_bjs.set_seed(simulator.iteration_seed(worker_seed, i))
+        codes.extend(worker_bjs.run(worker_rounds))
+    return (iterations, codes)
+
+
+def sweep_options(options, grid):
+    """
+    Expands `grid`, a comma-separated key=value1|value2|... list, into the bet options of
+    every combination of its values, each added to `options`.
+    """
+    keys = []
+    values = []
+    for pair in grid.strip().split(','):
+        (key, _, alternatives) = pair.partition('=')
+        keys.append(key)
+        values.append(alternatives.split('|'))
+
+    configs = []
+    for combo in itertools.product(*values):
+        opts = [options] if options else []
+        opts += ["{0}={1}".format(key, value) for (key, value) in zip(keys, combo)]
+        configs.append(",".join(opts))
+    return configs
+
+
+def print_sweep(configs, results, print_fn, label="Bet options"):
+    """
+    Prints a row of results for each bet option set (or seat): the average end gold with
+    its 95% confidence interval, the median, average hands and how often each end reason
+    ended an iteration.
+    """
+    all_reasons = sorted(set(reason for reasons in results for reason in reasons))
+    width = max(len(label), max(len(config) for config in configs))
+    header = "{0:<{1}}{2:>18}{3:>14}{4:>18}{5:>14}".format(
+        label, width, "Avg. end gold", "±", "Median", "Avg. hands")
+    header += "".join("  {0}".format(reason.rstrip('.')) for reason in all_reasons)
+    print_fn(header)
+    for (config, reasons) in zip(configs, results):
+        gold_end = stats.RunningStats()
+        hands = stats.RunningStats()
+        for reason in reasons.values():
+            gold_end.add(reason["gold_end"])
+            hands.add(reason["hands"])
+        line = "{0:<{1}}{2:>18,.2f}{3:>14,.2f}{4:>18,.2f}{5:>14,.2f}".format(
+            config, width, gold_end.mean, gold_end.confidence(), gold_end.quantile(0.5), hands.mean)
+        for reason in all_reasons:
+            count = reasons[reason]["gold_end"].count if reason in reasons else 0
+            line += "  {0:>{1}.2%}".format(count / gold_end.count, len(reason.rstrip('.')))
+        print_fn(line)
+
+
+def batches(first, iterations, threads):
+    """
+    Splits `iterations` numbered from `first` into (first, count) batches that shrink
+    as the remaining work runs out, so the processes finish close together even when
+    iterations vary a lot in length.
+    """
+    remaining = iterations
+    while remaining > 0:
+        size = max(1, remaining // (threads * 4))
+        yield (first, size)
+        first += size
+        remaining -= size
+
+
+def warn(*args):
+    # Problems found in the strategy files, kept out of the results
+    print(*args, file=sys.stderr)
+
+
+def print_progress(done, iterations, elapsed):
+    eta = elapsed * (iterations - done) / done
+    sys.stderr.write("\r{:>7.2%} ({:,}/{:,}) in {:.0f}s, ETA {:.0f}s   ".format(
+        done / iterations, done, iterations, elapsed, eta))
+    sys.stderr.flush()
 
 
 def main():
@@ -109,7 +329,7 @@ def main():
 
     try:
         opts, _ = getopt.getopt(sys.argv[1:], "hvf:s:i:g:b:o:pr:t:", [
-            "help", "verbose", "threads=", "out-file=", "strat=", "iterations=", "gold=", "bet-system=", "bet-options=", "positive-prog", "list-bet-systems", "rounds=", "target=", "anti-fallacy"])
+            "help", "verbose", "threads=", "out-file=", "strat=", "iterations=", "gold=", "bet-system=", "bet-options=", "positive-prog", "list-bet-systems", "rounds=", "target=", "anti-fallacy", "engine=", "decks=", "penetration=", "seed=", "skip=", "analyze", "generate=", "dealer-cache=", "sweep=", "record=", "replay=", "round-file=", "trajectories=", "format=", "iteration-rows", "profile", "pstats=", "seat="])
     except getopt.GetoptError as err:
         print(err)
         usage(sys.argv[0])
@@ -117,16 +337,18 @@ def main():
 
     verbose = False
     out_file = None
+    out_name = None
+    text_out = sys.stdout
+    results_out = sys.stdout
 
     def verbose_print(*args, **kwargs):
         if verbose:
             print(*args, **kwargs)
 
     def just_print(*args, **kwargs):
-        print(*args, **kwargs)
+        print(*args, file=text_out, **kwargs)
         if out_file is not None:
-            kwargs["file"] = out_file
-            print(*args, **kwargs)
+            print(*args, file=out_file, **kwargs)
 
     # Default options
     iterations = 1
@@ -143,6 +365,24 @@ def main():
     rounds = 0
 
     threads = 0
+    engine_name = "casinobot"
+    decks = 2
+    penetration = 0.0
+    seed = None
+    skip = 0
+    analyze = False
+    generate_file = None
+    dealer_file = None
+    sweep_grid = None
+    output_format = "text"
+    iteration_rows = False
+    record_file = None
+    replay_file = None
+    round_file = None
+    trajectories_file = None
+    profile = False
+    pstats_dir = None
+    seat_specs = []
 
     for o, a in opts:
         if o in ('-v', '--verbose'):
@@ -153,7 +393,7 @@ def main():
         elif o == '--threads':
             threads = int(a)
         elif o in ('-f', '--out-file'):
-            out_file = open(a, mode='w')
+            out_name = a
         elif o in ('-s', '--strat'):
             strat_file = a
         elif o in ('-b', '--bet-system'):
@@ -176,22 +416,98 @@ def main():
             target_gold = int(a)
         elif o == '--anti-fallacy':
             bet_anti_fallacy = True
+        elif o == '--engine':
+            engine_name = a
+        elif o == '--decks':
+            decks = int(a)
+        elif o == '--penetration':
+            penetration = float(a)
+        elif o == '--seed':
+            seed = int(a)
+        elif o == '--skip':
+            skip = int(a)
+        elif o == '--analyze':
+            analyze = True
+        elif o == '--generate':
+            generate_file = a
+        elif o == '--dealer-cache':
+            dealer_file = a
+        elif o == '--sweep':
+            sweep_grid = a
+        elif o == '--record':
+            record_file = a
+        elif o == '--replay':
+            replay_file = a
+        elif o == '--round-file':
+            round_file = a
+        elif o == '--trajectories':
+            trajectories_file = a
+        elif o == '--format':
+            output_format = a
+        elif o == '--iteration-rows':
+            iteration_rows = True
+        elif o == '--profile':
+            profile = True
+        elif o == '--pstats':
+            pstats_dir = a
+        elif o == '--seat':
+            seat_specs.append(a)
         else:
             assert False, "unhandled option"
 
+    if output_format not in results.FORMATS:
+        just_print("Invalid format '{}', use one of: {}".format(output_format, ", ".join(results.FORMATS)))
+        sys.exit(1)
+    if output_format == "text":
+        if out_name is not None:
+            out_file = open(out_name, mode='w')
+    elif out_name is None:
+        if output_format == "parquet" or iteration_rows and output_format == "csv":
+            just_print("--format={} needs an --out-file".format(
+                output_format + (" with --iteration-rows" if output_format == "csv" else "")))
+            sys.exit(1)
+        # Keep stdout for the results, and anything else printed out of it
+        results_out = sys.stdout
+        sys.stdout = text_out = sys.stderr
+
     if bet_system_name not in BETTING_SYSTEMS:
         just_print("Invalid betting system '{}'".format(bet_system_name))
         just_print("Available systems:", ", ".join(
             sorted(BETTING_SYSTEMS.keys())))
         sys.exit(1)
 
-    if bet_system_name != "none" and starting_gold == 0:
-        just_print("gold required to use a betting system")
+    if engine_name not in ENGINES:
+        just_print("Invalid engine '{}'".format(engine_name))
+        just_print("Available engines:", ", ".join(sorted(ENGINES.keys())))
         sys.exit(1)
 
-    if target_gold == 0 and rounds == 0:
-        just_print(
-            "At least one end condition (--target or --rounds) needs to be enabled.")
+    if generate_file is not None or analyze:
+        dealer_cache = dealer.DealerCache()
+        if dealer_file is not None:
+            dealer_cache.load(dealer_file)
+
+        just_print("Casino Simulator 9000!")
+        if generate_file is not None:
+            just_print("Generating strat file:", generate_file)
+            just_print()
+            strat = generator.StrategyGenerator(decks or None, just_print, dealer_cache).generate()
+            generator.StrategyGenerator.write(strat, generate_file)
+        else:
+            just_print("Using strat file:", strat_file)
+            strat = strategy.BlackjackStrategy.from_file(strat_file, warn)
+        just_print()
+        analysis.BlackjackAnalyzer(strat, decks or None, dealer_cache).print(just_print)
+
+        if dealer_file is not None:
+            dealer_cache.save(dealer_file)
+        if out_file is not None:
+            out_file.close()
+        sys.exit()
+
+    try:
+        shoe = cards.Shoe(decks, penetration)
+    except ValueError as err:
+        just_print(err)
         sys.exit(1)
 
     if threads == 0:
@@ -201,12 +517,109 @@ def main():
     if iterations < threads:
         threads = iterations
 
+    if record_file is not None:
+        if rounds == 0:
+            just_print("--record needs the number of --rounds to record")
+            sys.exit(1)
+        info = {"strat": strat_file, "decks": decks, "penetration": penetration, "seed": seed,
+                "skip": skip, "iterations": iterations, "rounds": rounds}
+        recorder = outcomes.OutcomeRecorder(strategy.BlackjackStrategy.from_file(strat_file, warn), shoe)
+        just_print("Casino Simulator 9000!")
+        just_print("Recording {0} iterations of {1} rounds to {2}...".format(iterations, rounds, record_file))
+        start = time.perf_counter()
+        with open(record_file, 'wb') as f:
+            outcomes.OutcomeFile.write_header(f, info)
+            with multiprocessing.Pool(threads, init_worker, (recorder, rounds, 0, seed)) as pool:
+                # In order, as iterations are stored one after another
+                for (_, codes) in pool.imap(run_record_batch, batches(skip, iterations, threads)):
+                    outcomes.OutcomeFile.write_codes(f, codes)
+        just_print("Completed in {:.2f}s".format(time.perf_counter() - start))
+        if out_file is not None:
+            out_file.close()
+        sys.exit()
+
+    outcome_file = None
+    if replay_file is not None:
+        try:
+            outcome_file = outcomes.OutcomeFile(replay_file)
+        except (OSError, ValueError) as err:
+            just_print(err)
+            sys.exit(1)
+        if skip + iterations > outcome_file.iterations:
+            just_print("{0} only has {1} iterations".format(replay_file, outcome_file.iterations))
+            sys.exit(1)
+        strat_file = outcome_file.info["strat"]
+
+    # Seats of a table, as (strat file, betting system, bet options)
+    table_seats = []
+    for spec in seat_specs:
+        (seat_strat, _, rest) = spec.partition(':')
+        (seat_system, sep, seat_options) = rest.partition(':')
+        table_seats.append((seat_strat, seat_system or bet_system_name, seat_options if sep else bet_options))
+    if table_seats:
+        if sweep_grid is not None or outcome_file is not None:
+            just_print("--seat can't be used with --sweep or --replay")
+            sys.exit(1)
+        if len(table_seats) > seats.SEATS:
+            just_print("A table has at most {} seats".format(seats.SEATS))
+            sys.exit(1)
+        if engine_name not in TABLE_ENGINES:
+            just_print("Engine '{}' can't play a table, use one of: {}".format(
+                engine_name, ", ".join(sorted(TABLE_ENGINES.keys()))))
+            sys.exit(1)
+        for (_, seat_system, _) in table_seats:
+            if seat_system not in BETTING_SYSTEMS:
+                just_print("Invalid betting system '{}'".format(seat_system))
+                sys.exit(1)
+
+    systems = [seat_system for (_, seat_system, _) in table_seats] or [bet_system_name]
+    if any(system != "none" for system in systems) and starting_gold == 0:
+        just_print("gold required to use a betting system")
+        sys.exit(1)
+
+    if target_gold == 0 and rounds == 0:
+        just_print(
+            "At least one end condition (--target or --rounds) needs to be enabled.")
+        sys.exit(1)
+
+    configs = [bet_options]
+    if sweep_grid is not None:
+        configs = sweep_options(bet_options, sweep_grid)
+    if table_seats:
+        configs = [" ".join(part for part in seat if part) for seat in table_seats]
+    replaying = sweep_grid is not None or outcome_file is not None
+    # Results per bet option set or seat, rather than for a single simulation
+    per_config = replaying or bool(table_seats)
+    if per_config and trajectories_file is not None:
+        just_print("--trajectories can't be used with --sweep, --replay or --seat")
+        sys.exit(1)
+
     just_print("Casino Simulator 9000!")
-    just_print("Using strat file:", strat_file)
-    just_print("Using betting system:", bet_system_name)
-    just_print("  with options:", bet_options)
+    if outcome_file is not None:
+        just_print("Replaying outcomes from:", replay_file)
+    elif sweep_grid is not None:
+        just_print("Using outcome streams shared by {} bet option sets".format(len(configs)))
+    else:
+        just_print("Using engine:", engine_name)
+    if table_seats:
+        just_print("Using a table of {} seats:".format(len(table_seats)))
+        for (i, (seat_strat, seat_system, seat_options)) in enumerate(table_seats, 1):
+            just_print("  Seat {}: {}, {} betting with options: {}".format(i, seat_strat, seat_system, seat_options))
+    else:
+        just_print("Using strat file:", strat_file)
+        just_print("Using betting system:", bet_system_name)
+        just_print("  with options:", bet_options)
+    if sweep_grid is not None:
+        just_print("  sweeping:", sweep_grid)
     if bet_anti_fallacy:
         just_print("Using anti-fallacy strategy")
+    if outcome_file is not None:
+        decks = outcome_file.info["decks"]
+        penetration = outcome_file.info["penetration"]
+        seed = outcome_file.info["seed"]
+    just_print("Using {} decks, {:.0%} penetration".format(decks, penetration))
+    if seed is not None:
+        just_print("Using seed:", seed)
 
     if starting_gold > 0:
         just_print()
@@ -228,68 +641,148 @@ def main():
     total_stats.gold_target = target_gold
     total_stats.gold_min = starting_gold
 
-    total_reasons = {}
+    # End reasons of each bet option set
+    total_reasons = [{} for _ in configs]
 
-    def add_reasons(reasons):
+    def add_reasons(total, reasons):
         for reason in reasons.keys():
-            if reason not in total_reasons:
-                total_reasons[reason] = reasons[reason]
+            if reason not in total:
+                total[reason] = reasons[reason]
             else:
-                total_reasons[reason]["count"] += reasons[reason]["count"]
-                total_reasons[reason]["gold_end"].extend(
-                    reasons[reason]["gold_end"])
-                total_reasons[reason]["hands"].extend(reasons[reason]["hands"])
-
-    out_q = multiprocessing.Queue()
-    procs = []
-    chunksize = int(math.ceil(iterations / float(threads)))
+                total[reason]["gold_end"].add(reasons[reason]["gold_end"])
+                total[reason]["hands"].add(reasons[reason]["hands"])
 
-    bet_system = BETTING_SYSTEMS[bet_system_name].from_options(bet_options)
-    strat = strategy.BlackjackStrategy.from_file(strat_file)
+    # Stats of each seat
+    seat_stats = []
+    for _ in table_seats:
+        seat_stats.append(stats.BlackjackStats())
+        seat_stats[-1].gold_start = starting_gold
+        seat_stats[-1].gold_target = target_gold
+        seat_stats[-1].gold_min = starting_gold
 
-    bj = simulator.BlackjackSimulator(strat, bet_system)
-    bj.set_starting_gold(starting_gold)
-    bj.set_target_gold(target_gold)
-    bj.set_anti_fallacy(bet_anti_fallacy)
-    bj.set_positive_prog(bet_positive_prog)
+    try:
+        if table_seats:
+            bj = TABLE_ENGINES[engine_name](
+                [strategy.BlackjackStrategy.from_file(seat_strat, warn) for (seat_strat, _, _) in table_seats],
+                [BETTING_SYSTEMS[seat_system].from_options(seat_options) for (_, seat_system, seat_options) in table_seats])
+        elif replaying:
+            bet_systems = [BETTING_SYSTEMS[bet_system_name].from_options(config) for config in configs]
+            bj = outcomes.BettingSweep(strategy.BlackjackStrategy.from_file(strat_file, warn), bet_systems, shoe, outcome_file)
+        else:
+            bj = ENGINES[engine_name](strategy.BlackjackStrategy.from_file(strat_file, warn),
+                                      BETTING_SYSTEMS[bet_system_name].from_options(bet_options))
+        bj.set_starting_gold(starting_gold)
+        bj.set_target_gold(target_gold)
+        bj.set_anti_fallacy(bet_anti_fallacy)
+        bj.set_positive_prog(bet_positive_prog)
+        if not replaying:
+            bj.set_shoe(shoe)
+        if round_file is not None:
+            bj.set_round_writer(records.RoundWriter(round_file))
+    except ValueError as err:
+        just_print(err)
+        sys.exit(1)
 
+    if round_file is not None:
+        info = {"strat": strat_file, "engine": "replay" if replaying else engine_name,
+                "bet-system": bet_system_name, "bet-options": configs[0], "gold": starting_gold,
+                "target": target_gold, "decks": decks, "penetration": penetration, "seed": seed,
+                "skip": skip, "iterations": iterations, "rounds": rounds}
+        records.RoundFile.write_header(round_file, info)
+        just_print("Writing rounds to:", round_file)
+
+    # Batches are handed to whichever process is free, with results added up as they
+    # come back. Progress goes to stderr, and only when someone is watching.
+    show_progress = sys.stderr.isatty()
+    done = 0
     start = time.perf_counter()
-    for i in range(threads):
-        p = multiprocessing.Process(
-            target=worker,
-            args=(i, chunksize, out_q, bj, rounds, starting_gold))
-        procs.append(p)
-        p.start()
-
-    for _ in range(threads):
-        (reasons, st) = out_q.get()
-        add_reasons(reasons)
-        total_stats.add(st)
+    run = run_sweep_batch if per_config else run_batch
+    rows = iteration_rows and output_format != "text"
+    iteration_results = []
+    worker = None
+    if profile or pstats_dir is not None:
+        worker = profiling.WorkerProfile(profile, pstats_dir)
+    phases = {}
+    with multiprocessing.Pool(threads, init_worker, (bj, rounds, starting_gold, seed, rows, worker)) as pool:
+        for (count, reasons, st, batch_rows, batch_phases) in pool.imap_unordered(run, batches(skip, iterations, threads)):
+            iteration_results.extend(batch_rows)
+            if batch_phases is not None:
+                profiling.merge(phases, batch_phases)
+            if not per_config:
+                add_reasons(total_reasons[0], reasons)
+                total_stats.add(st)
+            else:
+                for (total, config_reasons) in zip(total_reasons, reasons):
+                    add_reasons(total, config_reasons)
+                for (total, config_stats) in zip(seat_stats, st):
+                    total.add(config_stats)
+            done += count
+            if show_progress:
+                print_progress(done, iterations, time.perf_counter() - start)
 
-    for p in procs:
-        p.join()
+    if show_progress:
+        sys.stderr.write("\n")
 
     end = time.perf_counter()
 
     just_print("Completed in {:.2f}s".format(end - start))
     just_print()
 
-    # Display end reasons and stats
-    just_print("Results:")
-    for rs in sorted(total_reasons.keys()):
-        s = total_reasons[rs]
-        just_print("  {:.<22}{:.>12,} ({:>6.2%})".format(
-            rs, s["count"], s["count"]/iterations))
-        # just_print(s["gold_end"])
-        just_print("    {:.<16}{:.>16,.2f}".format(
-            "Avg. end gold", statistics.mean(s["gold_end"])))
-        just_print("    {:.<16}{:.>16,.2f}".format(
-            "Avg. hands dealt", statistics.mean(s["hands"])))
-    just_print("\nStats:")
-    total_stats.print(just_print)
+    if per_config:
+        print_sweep(configs, total_reasons, just_print, "Seat" if table_seats else "Bet options")
+        for (i, st) in enumerate(seat_stats, 1):
+            just_print("\nSeat {} stats:".format(i))
+            st.print(just_print)
+    else:
+        # Display end reasons and stats, averages with their 95% confidence intervals
+        just_print("Results:")
+        for rs in sorted(total_reasons[0].keys()):
+            s = total_reasons[0][rs]
+            count = s["gold_end"].count
+            just_print("  {:.<22}{:.>12,} ({:>6.2%})".format(
+                rs, count, count/iterations))
+            for (name, st) in (("end gold", s["gold_end"]), ("hands dealt", s["hands"])):
+                just_print("    {:.<16}{:.>16,.2f} (±{:,.2f})".format(
+                    "Avg. " + name, st.mean, st.confidence()))
+                just_print("    {:.<16}{:.>16,.2f} ({:,.2f} - {:,.2f})".format(
+                    "Median (5-95%)", st.quantile(0.5), st.quantile(0.05), st.quantile(0.95)))
+        just_print("\nStats:")
+        total_stats.print(just_print)
+        if trajectories_file is not None:
+            total_stats.write_trajectories(trajectories_file)
+            just_print("\nTrajectories written to:", trajectories_file)
+
+    if profile:
+        just_print("\nProfile:")
+        profiling.print_phases(phases, just_print)
+    if pstats_dir is not None:
+        just_print("\nProfiles written to:", pstats_dir)
+
+    if output_format != "text":
+        run_results = results.RunResults({
+            "strat": strat_file, "engine": "replay" if replaying else engine_name, "replay": replay_file, "bet_system": bet_system_name,
+            "bet_options": bet_options, "sweep": sweep_grid, "gold": starting_gold, "target": target_gold,
+            "rounds": rounds, "iterations": iterations, "skip": skip, "seed": seed, "decks": decks,
+            "penetration": penetration, "anti_fallacy": bet_anti_fallacy, "positive_prog": bet_positive_prog,
+            "seats": configs if table_seats else None, "threads": threads})
+        for (seat, (config, reasons)) in enumerate(zip(configs, total_reasons), 1):
+            if table_seats:
+                run_results.add_result(config, reasons, iterations, seat, seat_stats[seat - 1])
+            else:
+                run_results.add_result(config, reasons, iterations)
+        if not per_config:
+            run_results.set_stats(total_stats)
+        run_results.set_timing(end - start, iterations)
+        if profile:
+            run_results.set_profile(phases)
+        run_results.add_iterations((i, config + 1 if table_seats else None, configs[config]) + tuple(row)
+                                   for (i, config, *row) in iteration_results)
+        for file in run_results.write(output_format, out_name, results_out):
+            if file is not None:
+                just_print("\nResults written to:", file)
+
     if out_file is not None:
         out_file.close()
 
-
 if __name__ == "__main__":
     main()
@@ -0,0 +1,313 @@
+from casinobot import cards
+from simulator.dealer import BUST, DealerCache, shoe_values
+from simulator.engine import DOUBLEDOWN, HIT, SPLIT, STAND, SURRENDER
+
+# Most splits allowed in a single round
+MAX_SPLITS = 4
+
+
+def hand_total(hard, ace):
+    """
+    Value of a hand whose cards add up to `hard` counting aces as 1, with an ace
+    counted as 11 if that doesn't bust it.
+    """
+    if ace and hard <= 11:
+        return hard + 10
+    return hard
+
+
+class Situation:
+    """
+    A round after the initial deal against a dealer's upcard, with the player's cards
+    drawn from `comp` (card counts by rank index) and the dealer ending up with
+    `dealer` outcome probabilities. Calculates the expected value of playing a hand by
+    the compiled strategy `strat`, given that the dealer doesn't have a natural.
+    """
+
+    def __init__(self, strat, up, comp, dealer):
+        self.strat = strat
+        self.up = up
+        total = sum(comp)
+        self.draws = [(rank, n / total) for rank, n in enumerate(comp) if n]
+
+        # Expected value of standing on each total against the dealer's outcomes
+        self.stand = []
+        for value in range(22):
+            ev = dealer[BUST]
+            for i in range(BUST):
+                if value > 17 + i:
+                    ev += dealer[i]
+                elif value < 17 + i:
+                    ev -= dealer[i]
+            self.stand.append(ev)
+
+        self.hits = {}
+        self.turns = {}
+        self.split_hands = {}
+
+    def actions(self, st, cards_held, can_surrender, can_double, can_split):
+        """
+        Translates a strategy entry to the actions it can result in, the same way
+        `FastGame.choose_action` does. '?' picks evenly from all allowed actions.
+        """
+        if st == 'H':
+            return [HIT]
+        elif st == 'S':
+            return [STAND]
+        elif st == 'P':
+            if not can_split:
+                raise RuntimeError("Unable to split for some reason")
+            return [SPLIT]
+        elif st == 'D' or st == 'Dh':
+            return [DOUBLEDOWN if can_double else HIT]
+        elif st == 'R' or st == 'Rh':
+            return [SURRENDER if can_surrender else HIT]
+        elif st == 'Rs':
+            return [SURRENDER if can_surrender else STAND]
+        elif st == 'Ds':
+            return [DOUBLEDOWN if can_double else STAND]
+        elif st == 'H*':
+            return [STAND if cards_held > 2 else HIT]
+        elif st == '?':
+            actions = [STAND, HIT]
+            if can_double:
+                actions.append(DOUBLEDOWN)
+            if can_split:
+                actions.append(SPLIT)
+            if can_surrender:
+                actions.append(SURRENDER)
+            return actions
+        else:
+            raise RuntimeError("missing strategy '{0}'".format(st))
+
+    def action_ev(self, action, hard, ace):
+        """
+        Expected value of taking `action` (anything but splitting) at the start of a
+        turn on a hand worth `hard`.
+        """
+        if action == STAND:
+            return self.stand[hand_total(hard, ace)]
+        elif action == SURRENDER:
+            return -0.5
+        elif action == HIT:
+            return sum(p * self.hit(hard + cards.RANK_VALUES[rank], ace or rank == cards.ACE)
+                       for rank, p in self.draws)
+        else:
+            ev = 0.0
+            for rank, p in self.draws:
+                value = hand_total(hard + cards.RANK_VALUES[rank], ace or rank == cards.ACE)
+                ev += p * (2 * self.stand[value] if value <= 21 else -2)
+            return ev
+
+    def hit(self, hard, ace):
+        """
+        Expected value of a hand of three or more cards worth `hard`, with the rest of
+        its turn played by value.
+        """
+        key = (hard, ace)
+        if key in self.hits:
+            return self.hits[key]
+
+        value = hand_total(hard, ace)
+        if value > 21:
+            ev = -1.0
+        elif value == 21:
+            ev = self.stand[value]
+        else:
+            actions = self.actions(self.strat.by_value[self.up][value], 3, False, False, False)
+            ev = sum(self.action_ev(action, hard, ace) for action in actions) / len(actions)
+
+        self.hits[key] = ev
+        return ev
+
+    def turn(self, first, second, splits):
+        """
+        Plays a two-card hand's turn with `splits` splits left in the round. Returns the
+        splits the turn uses mapped to their probability and the expected value of the
+        hands it ends up with, weighted by that probability.
+        """
+        key = (first, second, splits)
+        if key in self.turns:
+            return self.turns[key]
+
+        hard = cards.RANK_VALUES[first] + cards.RANK_VALUES[second]
+        ace = first == cards.ACE or second == cards.ACE
+        value = hand_total(hard, ace)
+        can_double = value in (9, 10, 11)
+        can_split = first == second and splits > 0
+
+        st = self.strat.two_card[self.up][first * len(cards.RANKS) + second]
+        if st == 'P' and not can_split:
+            st = self.strat.by_value[self.up][value]
+        actions = self.actions(st, 2, True, can_double, can_split)
+
+        result = {}
+        for action in actions:
+            if action == SPLIT:
+                outcomes = self.split(first, splits)
+            else:
+                outcomes = {0: (1.0, self.action_ev(action, hard, ace))}
+            add_outcomes(result, outcomes, 1 / len(actions))
+
+        self.turns[key] = result
+        return result
+
+    def split(self, rank, splits):
+        """
+        Splits a pair of `rank`s with `splits` splits left. The first hand, along with
+        anything split off it, is played before the second.
+        """
+        result = {}
+        for used, (p, ev) in self.split_hand(rank, splits - 1).items():
+            for more, (q, other_ev) in self.split_hand(rank, splits - 1 - used).items():
+                add_outcomes(result, {1 + used + more: (p * q, ev * q + other_ev * p)})
+        return result
+
+    def split_hand(self, rank, splits):
+        """
+        Deals the second card to a hand split off a pair of `rank`s and plays it.
+        """
+        key = (rank, splits)
+        if key in self.split_hands:
+            return self.split_hands[key]
+
+        result = {}
+        for second, p in self.draws:
+            if hand_total(cards.RANK_VALUES[rank] + cards.RANK_VALUES[second],
+                          rank == cards.ACE or second == cards.ACE) == 21:
+                # Split hands of 21 are paid out as naturals
+                add_outcomes(result, {0: (1.0, 1.5)}, p)
+            else:
+                add_outcomes(result, self.turn(rank, second, splits), p)
+
+        self.split_hands[key] = result
+        return result
+
+    def play(self, first, second):
+        """
+        Expected value of playing the initial hand `first`, `second` by the strategy.
+        """
+        return sum(ev for (_, ev) in self.turn(first, second, MAX_SPLITS).values())
+
+
+def add_outcomes(result, outcomes, weight=1.0):
+    for used, (p, ev) in outcomes.items():
+        (q, total) = result.get(used, (0.0, 0.0))
+        result[used] = (q + p * weight, total + ev * weight)
+
+
+class BlackjackAnalyzer:
+    """
+    Calculates the expected value of a `BlackjackStrategy` under CasinoBot's rules from
+    card probabilities, without simulating any rounds.
+
+    With `decks=None`, cards are drawn from an infinite deck and the results are exact.
+    With a shoe of `decks` decks, the initial deal is removed from the shoe, and the
+    dealer's hand is drawn without replacement from what's left. The player's draws
+    come from the same shoe, which makes split hands independent of each other, the
+    usual approximation for finite decks.
+
+    Doubling down and splitting are always allowed, as they are with flat bets. Dealer
+    probabilities come from `dealer`, a `DealerCache` that can be shared and saved.
+    """
+
+    def __init__(self, strat, decks=None, dealer=None):
+        self.strat = strat
+        self.decks = decks
+        self.dealer = dealer if dealer is not None else DealerCache()
+        self.situations = {}
+
+    def deal_probabilities(self):
+        """
+        Yields every initial deal (player, upcard, player) as rank indices, with its
+        probability and the shoe it leaves behind.
+        """
+        ranks = len(cards.RANKS)
+        comp = [4 * (self.decks or 1)] * ranks
+        for first in range(ranks):
+            for up in range(ranks):
+                for second in range(ranks):
+                    left = list(comp)
+                    p = 1.0
+                    for rank in (first, up, second):
+                        p *= left[rank] / sum(left)
+                        if self.decks is not None:
+                            left[rank] -= 1
+                    yield (first, up, second, p, tuple(left))
+
+    def dealer_natural(self, up, comp):
+        """
+        Probability of the hole card giving the dealer a natural.
+        """
+        if up == cards.ACE:
+            tens = sum(n for rank, n in enumerate(comp) if cards.RANK_VALUES[rank] == 10)
+            return tens / sum(comp)
+        if cards.RANK_VALUES[up] == 10:
+            return comp[cards.ACE] / sum(comp)
+        return 0.0
+
+    def dealer_outcomes(self, up, comp):
+        """
+        Probabilities of the dealer's final hand (17-21 or bust) showing `up` and
+        drawing from `comp`, given that the dealer doesn't have a natural.
+        """
+        return self.dealer.outcomes(cards.RANK_VALUES[up], shoe_values(comp), self.decks is None)
+
+    def situation(self, up, comp):
+        key = (up, comp)
+        if key not in self.situations:
+            self.situations[key] = Situation(self.strat, up, comp, self.dealer_outcomes(up, comp))
+        return self.situations[key]
+
+    def analyze(self):
+        """
+        Returns the expected value of a round in bets, and the expected value of the
+        initial hands played by each strategy table cell, given that the dealer doesn't
+        have a natural, as {(row, dealer column): (probability, expected value)}.
+        """
+        total = 0.0
+        cells = {}
+        for (first, up, second, p, comp) in self.deal_probabilities():
+            natural = self.dealer_natural(up, comp)
+            hand = cards.Hand()
+            hand.add_card(cards.CARDS[first])
+            hand.add_card(cards.CARDS[second])
+            if hand.value == 11 and hand.aces:
+                # A natural only ties with the dealer's
+                total += p * (1 - natural) * 1.5
+                continue
+
+            ev = self.situation(up, comp).play(first, second)
+            total += p * (natural * -1 + (1 - natural) * ev)
+
+            column = self.strat.get_blackjack_rank(cards.RANKS[up])
+            row = self.strat.find_row(self.strat.strat_table.get(column, {}), hand)
+            weight = p * (1 - natural)
+            (q, cell_ev) = cells.get((row, column), (0.0, 0.0))
+            cells[(row, column)] = (q + weight, cell_ev + weight * ev)
+
+        cells = {cell: (q, ev / q) for cell, (q, ev) in cells.items()}
+        return total, cells
+
+    def print(self, print_fn=print):
+        total, cells = self.analyze()
+        decks = "an infinite deck" if self.decks is None else "{} decks".format(self.decks)
+        print_fn("Expected value with {}: {:+.3%} of the bet per round".format(decks, total))
+        print_fn()
+        print_fn("Expected value of the initial hands by strat table cell (%):")
+
+        columns = [self.strat.get_blackjack_rank(rank) for rank in cards.RANKS[1:10] + cards.RANKS[:1]]
+        rows = []
+        for entries in self.strat.strat_table.values():
+            rows.extend(row for row in entries if row not in rows)
+        print_fn("{:<6}".format("") + "".join("{:>7}".format(column) for column in columns))
+        for row in rows:
+            if not any((row, column) in cells for column in columns):
+                continue
+            line = "{:<6}".format(row)
+            for column in columns:
+                if (row, column) in cells:
+                    line += "{:>7.1f}".format(cells[(row, column)][1] * 100)
+                else:
+                    line += "{:>7}".format("")
+            print_fn(line)
@@ -0,0 +1,351 @@
+import datetime
+import getopt
+import glob
+import json
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+import casinosim
+from casinobot import blackjack, cards, player
+from simulator import engine, simulator, strategy
+
+# Options each betting system is benchmarked with
+BET_OPTIONS = {
+    "none": "",
+    "simple": "bet=10",
+    "martingale": "starting-bet=10",
+    "idkmartingale": "starting-bet=10",
+    "fibonacci": "starting-bet=10",
+    "labouchere": "starting-bet=10,seq=1-2-3-5-8-3-2",
+    "fp": "stacks=3,levels=5,stack-multi=2.223,bet-multi=2.223",
+    "counting": "unit=10",
+}
+
+# Benchmark groups, in the order they're run
+GROUPS = ("micro", "engines", "systems", "strats", "verbose", "processes")
+
+# Engines that play round by round, which the groups after "engines" can be run with.
+# The numpy engine only plays flat bets in batches through `run`.
+ROUND_ENGINES = ("casinobot", "fast")
+
+# Enough gold that no benchmark runs out of it
+GOLD = 10 ** 12
+
+# Benchmarks more than this much slower than the ones compared against are regressions
+THRESHOLD = 0.1
+
+
+def machine_info():
+    """
+    What the benchmarks ran on, and the commit they ran on if in a git repository.
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": multiprocessing.cpu_count(),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "commit": commit,
+        "time": datetime.datetime.now().isoformat(timespec='seconds'),
+    }
+
+
+class StubGame:
+    """
+    Accepts every action `BlackjackHooks.choose_action` can take, without playing any,
+    at a table seating the dealer and a player.
+    """
+    accept_surrender = True
+    accept_doubledown = True
+    accept_split = True
+
+    def __init__(self):
+        self.table = player.Table()
+        self.players = self.table.players
+        self.table.seat_dealer(0)
+        self.table.add_player(1, 'Bench')
+
+    def hit(self, pid):
+        pass
+
+    stand = surrender = doubledown = split = hit
+
+
+class Benchmarks:
+    """
+    Measures the throughput of the simulator: micro-benchmarks of the functions every
+    round goes through, and rounds per second of each engine, betting system, strategy
+    file, with and without verbose output, and in one or all processes. Each benchmark
+    is run `repeat` times and the fastest is kept.
+    """
+
+    def __init__(self, rounds=5000, repeat=3, engine_name="casinobot", out=print):
+        self.rounds = rounds
+        self.repeat = repeat
+        self.engine_name = engine_name
+        self.output = out
+        self.results = []
+        self.strats = {}
+
+    def log(self, *args):
+        if self.output is not None:
+            self.output(*args)
+
+    def add(self, group, name, count, seconds, unit):
+        result = {"group": group, "name": name, "rate": count / seconds, "unit": unit, "seconds": seconds}
+        self.results.append(result)
+        self.log("{:<10}{:<40}{:>16,.0f} {}".format(group, name, result["rate"], unit))
+
+    def best(self, fn):
+        """
+        Runs `fn` `repeat` times, returns the shortest time it took.
+        """
+        best = float('inf')
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    def strat(self, file):
+        if file not in self.strats:
+            self.strats[file] = strategy.BlackjackStrategy.from_file(file)
+        return self.strats[file]
+
+    def simulator(self, bet_system_name="simple", strat_file="strats/strat.txt", engine_name=None, out=None):
+        strat = self.strat(strat_file)
+        bet_system = casinosim.BETTING_SYSTEMS[bet_system_name].from_options(BET_OPTIONS[bet_system_name])
+        sim = casinosim.ENGINES[engine_name or self.engine_name](strat, bet_system, out)
+        sim.set_starting_gold(GOLD)
+        sim.set_shoe(cards.Shoe())
+        return sim
+
+    def play(self, sim):
+        """
+        Seconds it takes `sim` to play `rounds` rounds. Rounds are played one by one,
+        without the end conditions of `BlackjackSimulator.run`, so every betting system
+        plays them all.
+        """
+        def rounds():
+            sim.set_seed(1)
+            sim.reset()
+            for _ in range(self.rounds):
+                sim.play_round()
+        return self.best(rounds)
+
+    def run(self, groups=GROUPS):
+        for group in groups:
+            getattr(self, "bench_" + group)()
+        return self.results
+
+    def bench_micro(self):
+        rng = random.Random(1)
+        hands = []
+        while len(hands) < 1000:
+            hand = cards.BlackjackHand()
+            for _ in range(rng.choice((2, 2, 3))):
+                hand.add_card(rng.choice(cards.CARDS))
+            # Hands that still get to act
+            if hand.total < 21:
+                hands.append((rng.randrange(len(cards.RANKS)), hand))
+        n = 100
+
+        self.add("micro", "hand_value", n * len(hands), self.best(
+            lambda: [blackjack.hand_value(hand) for _ in range(n) for (_, hand) in hands]), "calls/s")
+
+        dealt = [hand.cards for (_, hand) in hands]
+
+        def deal():
+            for _ in range(n):
+                for held in dealt:
+                    hand = cards.BlackjackHand()
+                    for card in held:
+                        hand.add_card(card)
+        self.add("micro", "BlackjackHand.add_card", n * sum(map(len, dealt)), self.best(deal), "cards/s")
+
+        strat = self.strat("strats/strat.txt")
+        self.add("micro", "BlackjackStrategy.get_strat", n * len(hands), self.best(
+            lambda: [strat.get_strat(dealer, hand) for _ in range(n) for (dealer, hand) in hands]), "calls/s")
+
+        decks = 1000
+        self.add("micro", "Deck()", decks, self.best(lambda: [cards.Deck(rng) for _ in range(decks)]), "decks/s")
+        deck = cards.Deck(rng)
+        self.add("micro", "Deck.shuffle", decks, self.best(lambda: [deck.shuffle() for _ in range(decks)]), "shuffles/s")
+        shoe = cards.Shoe(6, rng=rng)
+        self.add("micro", "Shoe(6).shuffle", decks, self.best(lambda: [shoe.shuffle() for _ in range(decks)]), "shuffles/s")
+
+        # `choose_action` reads the hands from the game's table
+        hooks = simulator.BlackjackHooks(strat, casinosim.BETTING_SYSTEMS["simple"].from_options("bet=10"))
+        game = StubGame()
+        players = game.players
+        players[1].gold = GOLD
+        players[1].bet = 10
+
+        def choose():
+            for _ in range(n):
+                for (dealer, hand) in hands:
+                    players[0].hand.cards = [cards.CARDS[0], cards.CARDS[dealer]]
+                    players[1].hand = hand
+                    hooks.choose_action(game, 1)
+        self.add("micro", "BlackjackHooks.choose_action", n * len(hands), self.best(choose), "calls/s")
+
+        fast = engine.FastGame(player.Player(1, 'Bench'), strat, hooks, shoe)
+        self.add("micro", "FastGame.choose_action", n * len(hands), self.best(
+            lambda: [fast.choose_action(dealer, hand, True, True, True) for _ in range(n) for (dealer, hand) in hands]),
+            "calls/s")
+
+    def bench_engines(self):
+        for name in sorted(casinosim.ENGINES):
+            sim = self.simulator(engine_name=name)
+            if name == "numpy":
+                # Plays in batches, only through `run`
+                def rounds():
+                    sim.set_seed(1)
+                    sim.reset()
+                    sim.run(self.rounds)
+                seconds = self.best(rounds)
+            else:
+                seconds = self.play(sim)
+            self.add("engines", name, self.rounds, seconds, "rounds/s")
+
+    def bench_systems(self):
+        for name in sorted(casinosim.BETTING_SYSTEMS):
+            self.add("systems", name, self.rounds, self.play(self.simulator(bet_system_name=name)), "rounds/s")
+
+    def bench_strats(self):
+        for file in sorted(glob.glob("strats/*.txt")):
+            self.add("strats", os.path.basename(file), self.rounds, self.play(self.simulator(strat_file=file)),
+                     "rounds/s")
+
+    def bench_verbose(self):
+        self.add("verbose", "quiet", self.rounds, self.play(self.simulator()), "rounds/s")
+        with open(os.devnull, 'w') as devnull:
+            sim = self.simulator(out=lambda *args, **kwargs: print(*args, file=devnull, **kwargs))
+            self.add("verbose", "verbose", self.rounds, self.play(sim), "rounds/s")
+
+    def bench_processes(self):
+        """
+        Rounds per second of whole iterations run by casinosim's process pool, in a
+        single process and in one per CPU.
+        """
+        sim = self.simulator()
+        for threads in sorted({1, multiprocessing.cpu_count()}):
+            iterations = 2 * threads
+
+            def pool():
+                with multiprocessing.Pool(threads, casinosim.init_worker, (sim, self.rounds, GOLD, 1)) as p:
+                    for _ in p.imap_unordered(casinosim.run_batch, casinosim.batches(0, iterations, threads)):
+                        pass
+            self.add("processes", "{} process{}".format(threads, "" if threads == 1 else "es"),
+                     iterations * self.rounds, self.best(pool), "rounds/s")
+
+    @staticmethod
+    def compare(results, old, print_fn=print, threshold=THRESHOLD):
+        """
+        Prints the change of each result from the `old` results they share a name with.
+        Returns the regressions, those slower by more than `threshold`.
+        """
+        previous = {(r["group"], r["name"]): r["rate"] for r in old}
+        regressions = []
+        for r in results:
+            key = (r["group"], r["name"])
+            if key not in previous:
+                continue
+            change = r["rate"] / previous[key] - 1
+            regressed = change < -threshold
+            if regressed:
+                regressions.append(r)
+            print_fn("{:<10}{:<40}{:>+10.1%}{}".format(r["group"], r["name"], change, "  REGRESSION" if regressed else ""))
+        return regressions
+
+
+def usage():
+    print("Usage: python -m simulator.bench [OPTION...]")
+    print()
+    print("  -r, --rounds=ROUNDS     rounds per benchmark (default 5000)")
+    print("      --repeat=N          runs of each benchmark, the fastest is kept (default 3)")
+    print("      --engine=ENGINE     engine to benchmark the betting systems, strats and")
+    print("                          processes with, {} (default \"casinobot\")".format(
+        " or ".join('"{}"'.format(name) for name in ROUND_ENGINES)))
+    print("  -g, --groups=GROUPS     comma-separated benchmark groups to run, of:")
+    print("                          {}".format(", ".join(GROUPS)))
+    print("  -f, --out-file=FILE     save the results as JSON (default \"bench.json\")")
+    print("      --compare=FILE      compare with results saved before, exits with 1 if")
+    print("                          anything is over {:.0%} slower".format(THRESHOLD))
+
+
+def main():
+    try:
+        opts, _ = getopt.getopt(sys.argv[1:], "hr:g:f:", [
+            "help", "rounds=", "repeat=", "engine=", "groups=", "out-file=", "compare="])
+    except getopt.GetoptError as err:
+        print(err)
+        usage()
+        sys.exit(2)
+
+    rounds = 5000
+    repeat = 3
+    engine_name = "casinobot"
+    groups = GROUPS
+    out_file = "bench.json"
+    compare_file = None
+    for o, a in opts:
+        if o in ('-h', '--help'):
+            usage()
+            sys.exit()
+        elif o in ('-r', '--rounds'):
+            rounds = int(a)
+        elif o == '--repeat':
+            repeat = int(a)
+        elif o == '--engine':
+            engine_name = a
+        elif o in ('-g', '--groups'):
+            groups = a.split(',')
+        elif o in ('-f', '--out-file'):
+            out_file = a
+        elif o == '--compare':
+            compare_file = a
+
+    for group in groups:
+        if group not in GROUPS:
+            print("Unknown benchmark group '{}', use any of: {}".format(group, ", ".join(GROUPS)))
+            sys.exit(1)
+    if engine_name not in ROUND_ENGINES:
+        print("Unknown engine '{}', use one of: {}".format(engine_name, ", ".join(ROUND_ENGINES)))
+        sys.exit(1)
+
+    info = machine_info()
+    print("Benchmarking on {} ({} CPUs), Python {}".format(info["platform"], info["cpus"], info["python"]))
+    print()
+    bench = Benchmarks(rounds, repeat, engine_name)
+    results = bench.run(groups)
+
+    with open(out_file, 'w') as f:
+        json.dump({"machine": info, "settings": {"rounds": rounds, "repeat": repeat, "engine": engine_name},
+                   "results": results}, f, indent=2)
+        f.write("\n")
+    print()
+    print("Results saved to:", out_file)
+
+    if compare_file is not None:
+        with open(compare_file) as f:
+            old = json.load(f)
+        print()
+        print("Compared to {} ({}):".format(compare_file, old["machine"].get("commit") or old["machine"]["time"]))
+        if Benchmarks.compare(results, old["results"]):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,14 @@
 import math
 import random
 
+from simulator import counting
+
 
 class BettingSystem:
     def __init__(self):
         self.starting_gold = 0
         self.end_reason = None
+        self.seats = 1
 
     @staticmethod
     def parse_options(options):
@@ -34,6 +37,23 @@ class BettingSystem:
     def set_player(self, pl):
         self.player = pl
 
+    def set_shoe(self, shoe):
+        self.shoe = shoe
+
+    def set_seats(self, seats):
+        """
+        Sets how many seats are dealt the rounds, for betting systems that need to know
+        the order cards are dealt in.
+        """
+        self.seats = seats
+
+    def wrap_strategy(self, strat):
+        """
+        Returns the strategy to play by, for betting systems that change how hands are
+        played as well.
+        """
+        return strat
+
     def on_win(self, hands):
         pass
 
@@ -397,6 +417,90 @@ class FPBetting(BettingSystem):
         return self.next_bet
 
 
+class Counting(BettingSystem):
+    """
+    Bets by the true count of a persistent shoe (see `simulator.counting`), following a
+    ramp of (count, units) steps: `units` bets of `unit` gold at or above `count`, and a
+    single unit below the first step. Unbalanced systems step on the running count.
+
+    With `deviations`, hands are played with the Illustrious 18 index plays on top of the
+    strategy table. Their indices are Hi-Lo's, so they require the "hilo" system.
+    """
+
+    def __init__(self, unit, system="hilo", ramp=((2, 2), (3, 4), (4, 6), (5, 8)), deviations=False):
+        BettingSystem.__init__(self)
+
+        if system not in counting.SYSTEMS:
+            raise ValueError("Unknown counting system '{0}', use one of: {1}".format(
+                system, ", ".join(sorted(counting.SYSTEMS))))
+        if deviations and system != "hilo":
+            raise ValueError("The Illustrious 18 deviations require the hilo system")
+        if any(units < 1 for (_, units) in ramp):
+            raise ValueError("Bet ramp steps must be at least 1 unit")
+
+        self.unit = unit
+        self.system = system
+        self.ramp = sorted(ramp)
+        self.deviations = deviations
+        self.counter = None
+
+    @staticmethod
+    def parse_ramp(ramp):
+        steps = []
+        try:
+            for step in ramp.strip().split('/'):
+                (count, units) = step.split(':')
+                steps.append((int(count), int(units)))
+        except ValueError:
+            raise ValueError(
+                "Bet ramp must be a slash (/) separated list of count:units steps, e.g. 2:2/3:4/4:8.")
+        return steps
+
+    @staticmethod
+    def parse_flag(name, value):
+        # A flag given on its own is on
+        if value is True or value.lower() in ('1', 'true', 'yes'):
+            return True
+        if value.lower() in ('0', 'false', 'no'):
+            return False
+        raise ValueError("Option '{0}' must be 1/true/yes or 0/false/no, not '{1}'".format(name, value))
+
+    @classmethod
+    def from_options(cls, options):
+        opts = BettingSystem.parse_options(options)
+        if 'unit' not in opts:
+            raise RuntimeError(cls.__name__ + " requires 'unit' option")
+        kwargs = {}
+        if 'system' in opts:
+            kwargs['system'] = opts['system']
+        if 'ramp' in opts:
+            kwargs['ramp'] = Counting.parse_ramp(opts['ramp'])
+        if 'deviations' in opts:
+            kwargs['deviations'] = Counting.parse_flag('deviations', opts['deviations'])
+        return cls(int(opts['unit']), **kwargs)
+
+    def set_shoe(self, shoe):
+        BettingSystem.set_shoe(self, shoe)
+        self.counter = counting.Counter(self.system, shoe.decks)
+
+    def wrap_strategy(self, strat):
+        if not self.deviations:
+            return strat
+        return counting.CountingStrategy(strat, self.play_count)
+
+    def play_count(self):
+        return self.counter.play_count(self.shoe, self.seats)
+
+    def get_next_bet(self):
+        count = self.counter.bet_count(self.shoe)
+        units = 1
+        for (step, step_units) in self.ramp:
+            if count < step:
+                break
+            units = step_units
+        return units * self.unit
+
+
 def test_thing():
     fib = FibonacciSequence()
     for _ in range(5):
@@ -0,0 +1,185 @@
+import math
+
+from casinobot import cards
+
+# Tags added to the running count for each rank, indexed by rank index (A, 2-10, J, Q, K)
+SYSTEMS = {
+    "hilo": (-1, 1, 1, 1, 1, 1, 0, 0, 0, -1, -1, -1, -1),
+    "ko": (-1, 1, 1, 1, 1, 1, 1, 0, 0, -1, -1, -1, -1),
+    "omega2": (0, 1, 1, 2, 2, 2, 1, 0, -1, -2, -2, -2, -2),
+}
+
+# Running count an unbalanced system reaches after counting every card of the shoe
+KO_PIVOT = 4
+
+# The Illustrious 18 index plays for Hi-Lo's true count, as (hand, dealer's upcard, index,
+# entry, above): `entry` is played when the true count is at or above `index` if `above`,
+# or when it's below `index` otherwise. Totals are hard totals, and "10,10" is a pair of
+# tens. Insurance, the first of the 18, is left out as CasinoBot doesn't offer it.
+ILLUSTRIOUS_18 = (
+    ("16", "10", 0, 'S', True),
+    ("15", "10", 4, 'S', True),
+    ("10,10", "5", 5, 'P', True),
+    ("10,10", "6", 4, 'P', True),
+    ("10", "10", 4, 'D', True),
+    ("12", "3", 2, 'S', True),
+    ("12", "2", 3, 'S', True),
+    ("11", "A", 1, 'D', True),
+    ("9", "2", 1, 'D', True),
+    ("10", "A", 4, 'D', True),
+    ("9", "7", 3, 'D', True),
+    ("16", "9", 5, 'S', True),
+    ("13", "2", -1, 'H', False),
+    ("12", "4", 0, 'H', False),
+    ("12", "5", -2, 'H', False),
+    ("12", "6", -1, 'H', False),
+    ("13", "3", -2, 'H', False),
+)
+
+
+class Counter:
+    """
+    Running and true count of the cards dealt from a `casinobot.cards.Shoe`, with the
+    tags of one of `SYSTEMS`.
+
+    The count is brought up to date from the shoe's cursor whenever it's read, one tag
+    lookup per card dealt since, so dealing isn't slowed down at all. It starts over
+    whenever the shoe is shuffled. Unbalanced systems (KO) start from the initial
+    running count that puts their pivot at +4, and their true count is the running
+    count, as they're meant to be used.
+    """
+
+    def __init__(self, system, decks):
+        if system not in SYSTEMS:
+            raise ValueError("Unknown counting system '{0}', use one of: {1}".format(
+                system, ", ".join(sorted(SYSTEMS))))
+        tags = SYSTEMS[system]
+        self.system = system
+        # Tags per card code, so they add up to a whole deck's count
+        self.tags = tuple(tags[rank] for rank in cards.CARD_RANKS)
+        self.balanced = sum(self.tags) == 0
+        # A full shoe counts up to the pivot, e.g. -20 for KO with 6 decks
+        self.initial = 0 if self.balanced else KO_PIVOT - sum(self.tags) * decks
+        self.shoe_size = len(cards.CARDS) * decks
+        self.running = self.initial
+        self.pos = 0
+        self.shuffles = None
+        self.round_start = 0
+        self.round_shuffles = None
+
+    def sync(self, shoe):
+        """
+        Counts the cards dealt from `shoe` since the last call.
+        """
+        if shoe.shuffles != self.shuffles:
+            self.shuffles = shoe.shuffles
+            self.running = self.initial
+            self.pos = 0
+        tags = self.tags
+        running = self.running
+        for code in shoe.cards[self.pos:shoe.pos]:
+            running += tags[code]
+        self.running = running
+        self.pos = shoe.pos
+
+    def true_count(self, running, seen):
+        """
+        Running count per deck left in the shoe, rounded down.
+        """
+        if not self.balanced:
+            return running
+        decks_left = max(self.shoe_size - seen, 1) / len(cards.CARDS)
+        return math.floor(running / decks_left)
+
+    def bet_count(self, shoe):
+        """
+        True count to bet on before the next round is dealt from `shoe`. A shoe past its
+        cut card is shuffled before the round, so it's bet on as a fresh shoe.
+        """
+        self.sync(shoe)
+        if shoe.pos >= shoe.cut:
+            self.round_start = 0
+            self.round_shuffles = shoe.shuffles + 1
+            return self.true_count(self.initial, 0)
+        self.round_start = shoe.pos
+        self.round_shuffles = shoe.shuffles
+        return self.true_count(self.running, self.pos)
+
+    def play_count(self, shoe, seats=1):
+        """
+        True count of the cards the player has seen during a round dealt to `seats`
+        seats. The dealer's hole card is dealt right after every seat's first card, and
+        isn't counted until the round is over.
+        """
+        self.sync(shoe)
+        running = self.running
+        seen = self.pos
+        hole = self.round_start + seats
+        if self.shuffles == self.round_shuffles and seen > hole:
+            running -= self.tags[shoe.cards[hole]]
+            seen -= 1
+        return self.true_count(running, seen)
+
+
+class CountingStrategy:
+    """
+    A `BlackjackStrategy` with index plays on top: the strategy's entry is replaced by
+    a deviation's when the true count calls for it. `count` returns the true count the
+    player sees, and `deviations` are given in the format of `ILLUSTRIOUS_18`.
+
+    Total deviations only apply to hard hands, and not to pairs the strategy splits or
+    to hands it surrenders while they still can be (with two cards), as surrendering
+    is worth more than the standing deviations of 15 and 16 against a 10.
+    """
+
+    def __init__(self, strat, count, deviations=ILLUSTRIOUS_18):
+        self.strat = strat
+        self.count = count
+        self.pairs = [{} for _ in cards.RANKS]
+        self.totals = [{} for _ in cards.RANKS]
+        for (row, column, index, entry, above) in deviations:
+            for dealer, rank in enumerate(cards.RANKS):
+                if strat.get_blackjack_rank(rank) != column:
+                    continue
+                if ',' in row:
+                    self.pairs[dealer][cards.VALUES[row.split(',')[0]]] = (index, entry, above)
+                else:
+                    self.totals[dealer][int(row)] = (index, entry, above)
+
+    def get_strat(self, dealer, hand, force_value=False):
+        st = self.strat.get_strat(dealer, hand, force_value)
+
+        held = hand.cards
+        deviation = None
+        if hand.is_pair and not force_value:
+            deviation = self.pairs[dealer].get(held[0].value)
+        surrendering = st[0] == 'R' and len(held) == 2
+        if deviation is None and st != 'P' and not hand.is_soft and not surrendering:
+            deviation = self.totals[dealer].get(hand.total)
+
+        if deviation is not None:
+            (index, entry, above) = deviation
+            if (self.count() >= index) == above:
+                return entry
+        return st
+
+
+def test_pivot():
+    # Every system's running count after a whole shoe: the pivot for unbalanced
+    # systems, 0 for balanced ones
+    for system in sorted(SYSTEMS):
+        for decks in range(1, 9):
+            counter = Counter(system, decks)
+            shoe = cards.Shoe(decks)
+            shoe.shuffle()
+            shoe.pos = len(shoe.cards)
+            counter.sync(shoe)
+            expected = 0 if counter.balanced else KO_PIVOT
+            if counter.running != expected:
+                raise RuntimeError("{0} with {1} decks counts up to {2}, not {3}".format(
+                    system, decks, counter.running, expected))
+    print("A full shoe counts up to the pivot")
+
+
+if __name__ == "__main__":
+    test_pivot()
@@ -0,0 +1,129 @@
+import collections
+import os
+import pickle
+
+from casinobot import cards
+
+# Indices of the dealer's final hands in outcome tuples: totals 17-21, then busts
+OUTCOMES = 6
+BUST = 5
+
+
+def shoe_values(comp):
+    """
+    Converts card counts by rank index into counts by card value (1-10).
+    """
+    values = [0] * 10
+    for rank, n in enumerate(comp):
+        values[cards.RANK_VALUES[rank] - 1] += n
+    return tuple(values)
+
+
+class DealerCache:
+    """
+    Probabilities of the dealer's final hand (17-21 or bust) by upcard and the cards
+    left in the shoe, under CasinoBot's rules: the dealer stands on all 17s.
+
+    Shoes are given as counts of the card values 1 (aces) to 10 left in them. Every
+    dealer hand the calculation goes through is memoized, so hands that come up again
+    from another upcard or shoe aren't calculated again. Up to `maxsize` entries are
+    kept, dropping the least recently used ones, and the cache can be saved to a file
+    to keep it between runs.
+    """
+
+    def __init__(self, maxsize=1 << 18):
+        self.maxsize = maxsize
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        outcomes = self.entries.get(key)
+        if outcomes is None:
+            self.misses += 1
+        else:
+            self.entries.move_to_end(key)
+            self.hits += 1
+        return outcomes
+
+    def put(self, key, outcomes):
+        self.entries[key] = outcomes
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def outcomes(self, up, values, replace=False):
+        """
+        Returns the outcome probabilities of a dealer showing `up` (a card value 1-10)
+        and drawing from `values`, given that the dealer doesn't have a natural. With
+        `replace`, drawn cards are put back in the shoe, as with an infinite deck.
+        """
+        key = (up, values, replace)
+        outcomes = self.get(key)
+        if outcomes is not None:
+            return outcomes
+
+        # The hole card can't complete a natural
+        excluded = {1: 10, 10: 1}.get(up)
+        total = sum(n for value, n in enumerate(values, 1) if value != excluded)
+        result = [0.0] * OUTCOMES
+        for value, n in enumerate(values, 1):
+            if n == 0 or value == excluded:
+                continue
+            drawn = self.hand(up + value, up == 1 or value == 1, self.draw(values, value, replace), replace)
+            for i, p in enumerate(drawn):
+                result[i] += n / total * p
+
+        outcomes = tuple(result)
+        self.put(key, outcomes)
+        return outcomes
+
+    def hand(self, hard, ace, values, replace=False):
+        """
+        Returns the outcome probabilities of a dealer hand adding up to `hard` (aces
+        counted as 1) drawing from `values`.
+        """
+        total = hard + 10 if ace and hard <= 11 else hard
+        if total >= 17:
+            result = [0.0] * OUTCOMES
+            result[BUST if total > 21 else total - 17] = 1.0
+            return tuple(result)
+
+        key = (hard, ace, values, replace)
+        outcomes = self.get(key)
+        if outcomes is not None:
+            return outcomes
+
+        left = sum(values)
+        result = [0.0] * OUTCOMES
+        for value, n in enumerate(values, 1):
+            if n == 0:
+                continue
+            drawn = self.hand(hard + value, ace or value == 1, self.draw(values, value, replace), replace)
+            for i, p in enumerate(drawn):
+                result[i] += n / left * p
+
+        outcomes = tuple(result)
+        self.put(key, outcomes)
+        return outcomes
+
+    @staticmethod
+    def draw(values, value, replace):
+        if replace:
+            return values
+        values = list(values)
+        values[value - 1] -= 1
+        return tuple(values)
+
+    def load(self, file):
+        """
+        Adds the entries saved to `file` by `save`, if it exists.
+        """
+        if not os.path.exists(file):
+            return
+        with open(file, 'rb') as f:
+            for key, outcomes in pickle.load(f):
+                self.put(key, outcomes)
+
+    def save(self, file):
+        with open(file, 'wb') as f:
+            pickle.dump(list(self.entries.items()), f)
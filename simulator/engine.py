@@ -0,0 +1,255 @@
+import casinobot.cards as c
+from casinobot import player
+from simulator.simulator import BlackjackSimulator
+
+# Actions the headless game can take on a hand
+HIT = 0
+STAND = 1
+DOUBLEDOWN = 2
+SPLIT = 3
+SURRENDER = 4
+
+
+class FastHand(c.BlackjackHand):
+    """
+    A single hand in a headless game, carrying the per-hand state CasinoBot keeps
+    on `Player`/`SplitHand`.
+    """
+    __slots__ = ('bet', 'did_doubledown')
+
+    def __init__(self, bet):
+        c.BlackjackHand.__init__(self)
+        self.bet = bet
+        self.did_doubledown = False
+
+
+class FastGame:
+    """
+    Headless blackjack round engine.
+
+    Plays the same rules as `casinobot.blackjack.Game` dealing from a persistent
+    `casinobot.cards.Shoe`: dealer stands on all 17s, surrender, doubledown on 9, 10
+    or 11, up to 4 splits and 3:2 naturals. All state is local to the game, turns are
+    driven by a loop instead of callbacks, and no messages are formatted.
+    """
+
+    def __init__(self, pl, strat, hooks, shoe):
+        self.player = pl
+        self.strat = strat
+        self.hooks = hooks
+        self.betting = hooks.betting
+        self.random = hooks.random
+        self.shoe = shoe
+
+    def win(self, hand, natural=False):
+        pl = self.player
+        pl.count_win()
+        if natural:
+            pl.nats += 1
+            pl.add_gold(hand.bet * 1.5 + hand.bet)
+        else:
+            pl.add_gold(hand.bet * 2)
+        self.hooks.on_win(hand, nat=natural)
+
+    def lose(self, hand):
+        self.player.count_loss()
+        self.hooks.on_loss(hand)
+
+    def tie(self, hand):
+        self.player.count_tie()
+        self.player.add_gold(hand.bet)
+        self.hooks.on_tie(hand)
+
+    def surrender(self, hand):
+        self.player.add_gold(hand.bet / 2)
+        self.hooks.on_loss(hand, surrender=True)
+        self.player.count_surrender()
+
+    def play(self):
+        """
+        Plays a single round, from placing the bet to paying out the results.
+        """
+        pl = self.player
+        bet = self.hooks.next_bet(pl) or 0
+        pl.remove_gold(bet)
+
+        shoe = self.shoe
+        shoe.start_round()
+        hand = FastHand(bet)
+        dealer = FastHand(0)
+        for _ in range(2):
+            hand.add_card(shoe.deal_card())
+            dealer.add_card(shoe.deal_card())
+
+        # Check for naturals (an immediate blackjack)
+        dealer_natural = dealer.total == 21
+        if hand.total == 21:
+            if dealer_natural:
+                self.tie(hand)
+            else:
+                self.win(hand, natural=True)
+        elif dealer_natural:
+            self.lose(hand)
+            pl.natlosses += 1
+        elif self.play_hands(hand, dealer):
+            self.dealer_play(dealer)
+        else:
+            self.hooks.on_skip_dealer(self)
+
+        self.hooks.settle()
+
+    def play_hands(self, first, dealer):
+        """
+        Plays the player's hands in turn order. Returns whether the dealer has to play
+        out their hand afterwards, i.e. whether any hand is left that didn't bust,
+        surrender or win as a split natural.
+        """
+        pl = self.player
+        upcard = dealer.cards[1].index
+        self.in_game = in_game = [first]
+        turns = [first]
+        splits = 0
+
+        while turns:
+            hand = turns[0]
+            value = hand.total
+            can_surrender = True
+            can_double = value in (9, 10, 11) and pl.gold >= hand.bet
+            can_split = (hand.is_pair and
+                         pl.gold >= hand.bet and splits < 4)
+
+            while True:
+                action = self.choose_action(
+                    upcard, hand, can_surrender, can_double, can_split)
+
+                if action == HIT:
+                    hand.add_card(self.shoe.deal_card())
+                    value = hand.total
+                    if value > 21:
+                        self.lose(hand)
+                        in_game.remove(hand)
+                        del turns[0]
+                        break
+                    if value == 21:
+                        del turns[0]
+                        break
+                    can_surrender = can_double = can_split = False
+                elif action == STAND:
+                    del turns[0]
+                    break
+                elif action == SURRENDER:
+                    self.surrender(hand)
+                    in_game.remove(hand)
+                    del turns[0]
+                    break
+                elif action == DOUBLEDOWN:
+                    pl.remove_gold(hand.bet)
+                    hand.bet *= 2
+                    hand.did_doubledown = True
+                    hand.add_card(self.shoe.deal_card())
+                    if hand.is_bust:
+                        self.lose(hand)
+                        in_game.remove(hand)
+                    del turns[0]
+                    break
+                else:
+                    pl.remove_gold(hand.bet)
+                    splits += 1
+                    splitted = FastHand(hand.bet)
+                    splitted.add_card(hand.remove_card(1))
+                    in_game.append(splitted)
+                    turns.insert(1, splitted)
+                    for h in (hand, splitted):
+                        h.add_card(self.shoe.deal_card())
+                        if h.total == 21:
+                            self.win(h, natural=True)
+                            in_game.remove(h)
+                            turns.remove(h)
+                    break
+
+        return len(in_game) > 0
+
+    def dealer_play(self, dealer):
+        while dealer.total < 17:
+            dealer.add_card(self.shoe.deal_card())
+        self.settle_hands(dealer.total)
+
+    def settle_hands(self, dealer_value):
+        """
+        Pays out the hands left in the game against the dealer's final hand value.
+        """
+        for hand in self.in_game:
+            player_value = hand.total
+            if dealer_value > 21 or player_value > dealer_value:
+                self.win(hand)
+            elif player_value == dealer_value:
+                self.tie(hand)
+            else:
+                self.lose(hand)
+
+    def choose_action(self, upcard, hand, can_surrender, can_double, can_split):
+        """
+        Picks an action from the strategy table, translating it the same way
+        `BlackjackHooks.choose_action` does.
+        """
+        st = self.strat.get_strat(upcard, hand)
+
+        # If we're already at maximum splits (or splitting is not allowed for other reasons),
+        # pick a new strategy using the card value total instead of pairs.
+        if st == 'P' and (not can_split or not self.betting.can_double()):
+            st = self.strat.get_strat(upcard, hand, True)
+
+        if st == 'H':
+            return HIT
+        elif st == 'S':
+            return STAND
+        elif st == 'P':
+            if not can_split:
+                raise RuntimeError("Unable to split for some reason")
+            return SPLIT
+        elif st == 'D' or st == 'Dh':
+            if can_double and self.betting.can_double():
+                return DOUBLEDOWN
+            return HIT
+        elif st == 'R' or st == 'Rh':
+            return SURRENDER if can_surrender else HIT
+        elif st == 'Rs':
+            return SURRENDER if can_surrender else STAND
+        elif st == 'Ds':
+            if can_double and self.betting.can_double():
+                return DOUBLEDOWN
+            return STAND
+        elif st == 'H*':
+            return STAND if len(hand.cards) > 2 else HIT
+        elif st == '?':
+            actions = [STAND, HIT]
+            if can_double and self.betting.can_double():
+                actions.append(DOUBLEDOWN)
+            if can_split and self.betting.can_double():
+                actions.append(SPLIT)
+            if can_surrender:
+                actions.append(SURRENDER)
+            return self.random.choice(actions)
+        else:
+            raise RuntimeError("missing strategy '{0}'".format(st))
+
+
+class FastBlackjackSimulator(BlackjackSimulator):
+    """
+    `BlackjackSimulator` that plays its rounds with the headless `FastGame` instead of
+    CasinoBot, without touching CasinoBot's global player list.
+    """
+
+    def new_player(self):
+        return player.Player(self.uid, self.name)
+
+    def reset(self):
+        BlackjackSimulator.reset(self)
+        self.game = FastGame(self.player, self.strat, self.hooks, self.shoe)
+
+    def set_shoe(self, shoe):
+        BlackjackSimulator.set_shoe(self, shoe)
+        self.game.shoe = shoe
+
+    def play_round(self):
+        self.game.play()
@@ -0,0 +1,253 @@
+from casinobot import cards
+from simulator.analysis import BlackjackAnalyzer, Situation
+from simulator.strategy import MAX_VALUE, BlackjackStrategy
+
+# Dealer's upcard columns, in the order of the strat file headers
+COLUMNS = ('2', '3', '4', '5', '6', '7', '8', '9', '10', 'A')
+
+# Rows of a generated table: totals, ace hands and pairs
+VALUE_ROWS = tuple(str(value) for value in range(4, 21))
+ACE_ROWS = tuple("A," + rank for rank in COLUMNS[:-2])
+PAIR_ROWS = tuple(rank + "," + rank for rank in COLUMNS)
+
+# Entries tried for each kind of row, preferring the simpler ones on a tie. Totals
+# pick what to do on the first decision of a turn and on later ones (e.g. 'Ds' doubles
+# down, or stands if it can't), the other rows only ever make a first decision.
+VALUE_ENTRIES = ('H', 'S', 'D', 'Ds', 'R', 'Rs', 'H*')
+ACE_ENTRIES = ('H', 'S', 'R')
+PAIR_ENTRIES = ('H', 'S', 'P', 'D', 'R')
+COMBO_ENTRIES = ('H', 'S', 'D', 'R')
+
+# How many times to go over the rows before giving up on improving them further
+MAX_PASSES = 10
+
+# Rows whose entries are closer than this (in bets per round of a column) are settled
+# with the slower, more precise probabilities of finite shoes
+CLOSE = 0.0005
+
+
+class ColumnStrategy:
+    """
+    Compiled lookups of a single dealer's upcard column, in the shape `Situation` uses.
+    """
+
+    def __init__(self, up, entries):
+        self.two_card = {up: ['S'] * (len(cards.RANKS) * len(cards.RANKS))}
+        self.by_value = {up: ['S'] * (MAX_VALUE + 1)}
+        self.up = up
+        self.entries = entries
+
+    def set(self, row, st, hands):
+        """
+        Sets the entry of `row`, played by the two-card `hands` (indices to `two_card`).
+        """
+        self.entries[row] = st
+        for i in hands:
+            self.two_card[self.up][i] = st
+        if row.isdigit():
+            self.by_value[self.up][int(row)] = st
+
+
+class StrategyGenerator:
+    """
+    Finds the strategy table with the highest expected value under CasinoBot's rules,
+    using the same probabilities as `BlackjackAnalyzer`.
+
+    Each dealer's upcard column is improved one row at a time, trying every entry the
+    row can have and keeping the best, until a pass over the rows changes nothing.
+    Rows are shared: a total's entry plays both two-card hands and hands of three or
+    more cards of that value, soft or hard, so the rows can't be solved independently.
+
+    With `decks=None` cards are drawn from an infinite deck. Otherwise the upcard is
+    removed from a shoe of `decks` decks, and the dealer draws without replacement from
+    the rest. Dealer probabilities come from the `DealerCache` `dealer`.
+    """
+
+    def __init__(self, decks=None, out=None, dealer=None):
+        self.decks = decks
+        self.output = out
+        self.analyzer = BlackjackAnalyzer(None, decks, dealer)
+
+    def print(self, *args):
+        if self.output is not None:
+            self.output(*args)
+
+    def generate(self):
+        """
+        Returns the generated table as a `BlackjackStrategy`.
+        """
+        strat_table = {}
+        for column in COLUMNS:
+            strat_table[column] = self.generate_column(column)
+        return BlackjackStrategy(strat_table)
+
+    def generate_column(self, column):
+        up = cards.RANKS.index(column)
+        comp = [4 * (self.decks or 1)] * len(cards.RANKS)
+        if self.decks is not None:
+            comp[up] -= 1
+        comp = tuple(comp)
+        dealer = self.analyzer.dealer_outcomes(up, comp)
+
+        # Two-card hands the dealer doesn't have a natural against, and their rows
+        total = sum(comp)
+        deals = []
+        rows = {row: [] for row in VALUE_ROWS + ACE_ROWS + PAIR_ROWS}
+        for first in range(len(cards.RANKS)):
+            for second in range(len(cards.RANKS)):
+                hand = cards.Hand()
+                hand.add_card(cards.CARDS[first])
+                hand.add_card(cards.CARDS[second])
+                row = BlackjackStrategy.find_row(rows, hand)
+                if row in rows:
+                    rows[row].append(first * len(cards.RANKS) + second)
+                    p = comp[first] / total * comp[second] / total
+                    deals.append((first, second, p))
+
+        table = ColumnStrategy(up, {})
+        for row in VALUE_ROWS:
+            table.set(row, 'H' if int(row) < 17 else 'S', rows[row])
+        for row in ACE_ROWS:
+            table.set(row, 'H' if row < "A,7" else 'S', rows[row])
+        for row in PAIR_ROWS:
+            table.set(row, 'H', rows[row])
+
+        def evaluate():
+            situation = Situation(table, up, comp, dealer)
+            return sum(p * situation.play(first, second) for (first, second, p) in deals)
+
+        # Higher totals first, as lower ones hit into them
+        order = [(row, VALUE_ENTRIES) for row in reversed(VALUE_ROWS)]
+        order += [(row, ACE_ENTRIES) for row in ACE_ROWS]
+        order += [(row, PAIR_ENTRIES) for row in PAIR_ROWS]
+        (best, close) = self.improve(table, rows, order, evaluate)
+
+        if self.decks is not None:
+            # With the initial deal removed from the shoe too, the same way
+            # `BlackjackAnalyzer` does it, settle the rows that were nearly a tie and
+            # find the hands worth playing differently from their total
+            shoe_deals = self.shoe_deals(up)
+            exact = [(row, entries) for (row, entries) in order if row in close]
+            (best, _) = self.improve(table, rows, exact, lambda: self.deal_ev(table, up, shoe_deals))
+            self.add_combos(table, up, shoe_deals)
+            best = self.deal_ev(table, up, shoe_deals)
+
+        self.print("Column {0}: {1:+.3%}".format(column, best))
+        return table.entries
+
+    def add_combos(self, table, up, shoe_deals):
+        """
+        Adds combo rows ("10,6") for the two-card hands that do better played differently
+        from the other hands of their total.
+        """
+        combos = {}
+        for deal in shoe_deals:
+            (first, second) = deal[:2]
+            if first == second or cards.ACE in (first, second):
+                continue
+            hand = cards.Hand()
+            hand.add_card(cards.CARDS[first])
+            hand.add_card(cards.CARDS[second])
+            combos.setdefault(BlackjackStrategy.get_card_combo(hand), []).append(deal)
+
+        for (row, deals) in sorted(combos.items()):
+            hands = [first * len(cards.RANKS) + second for (first, second, _, _) in deals]
+            best = self.deal_ev(table, up, deals)
+            choice = None
+            for st in COMBO_ENTRIES:
+                table.set(row, st, hands)
+                ev = self.deal_ev(table, up, deals)
+                if ev > best + 1e-12:
+                    best = ev
+                    choice = st
+            if choice is not None:
+                table.set(row, choice, hands)
+            else:
+                (first, second) = deals[0][:2]
+                value = str(cards.RANK_VALUES[first] + cards.RANK_VALUES[second])
+                table.set(row, table.entries[value], hands)
+                del table.entries[row]
+
+    def shoe_deals(self, up):
+        """
+        Returns the initial deals against `up` the player doesn't have a natural in, as
+        (first, second, probability, the shoe left), weighted by the dealer not having a
+        natural either.
+        """
+        deals = []
+        for (first, dealt, second, p, comp) in self.analyzer.deal_probabilities():
+            if dealt != up:
+                continue
+            if cards.ACE in (first, second) and cards.RANK_VALUES[first] + cards.RANK_VALUES[second] == 11:
+                continue
+            deals.append((first, second, p * (1 - self.analyzer.dealer_natural(up, comp)), comp))
+        return deals
+
+    def deal_ev(self, table, up, deals):
+        """
+        Expected value of playing `deals` (see `shoe_deals`) by `table`.
+        """
+        total = 0.0
+        weight = 0.0
+        for (first, second, p, comp) in deals:
+            situation = Situation(table, up, comp, self.analyzer.dealer_outcomes(up, comp))
+            total += p * situation.play(first, second)
+            weight += p
+        return total / weight
+
+    def improve(self, table, rows, order, evaluate):
+        """
+        Goes over the rows in `order`, trying each of their entries and keeping the best,
+        until nothing changes. Returns the best expected value and the rows whose
+        entries were within `CLOSE` of each other on the last pass.
+        """
+        best = evaluate()
+        for _ in range(MAX_PASSES):
+            changed = False
+            close = set()
+            for (row, entries) in order:
+                current = table.entries[row]
+                for st in entries:
+                    if st == current:
+                        continue
+                    table.set(row, st, rows[row])
+                    ev = evaluate()
+                    if abs(ev - best) < CLOSE:
+                        close.add(row)
+                    if ev > best + 1e-12:
+                        best = ev
+                        current = st
+                        changed = True
+                table.set(row, current, rows[row])
+            if not changed:
+                break
+        return (best, close)
+
+    @staticmethod
+    def write(strat, file):
+        """
+        Writes the table of `strat` in the format `BlackjackStrategy.from_file` reads.
+        Combo rows only some columns have play like their total in the rest.
+        """
+        rows = {}
+        for entries in strat.strat_table.values():
+            rows.update((row, None) for row in entries if row not in VALUE_ROWS + ACE_ROWS + PAIR_ROWS)
+        combos = sorted(rows, key=lambda row: (sum(cards.VALUES[rank] for rank in row.split(',')), row))
+
+        with open(file, 'w') as f:
+            f.write("\t\t" + "\t".join(COLUMNS) + "\n")
+            for group in (VALUE_ROWS, combos, ACE_ROWS, PAIR_ROWS):
+                if not group:
+                    continue
+                for row in group:
+                    line = []
+                    for column in COLUMNS:
+                        entries = strat.strat_table[column]
+                        if row not in entries:
+                            row_value = sum(cards.VALUES[rank] for rank in row.split(','))
+                            line.append(entries[str(row_value)])
+                        else:
+                            line.append(entries[row])
+                    f.write(row + "\t\t" + "\t".join(line) + "\n")
+                if group is not PAIR_ROWS:
+                    f.write("\n")
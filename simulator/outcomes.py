@@ -0,0 +1,394 @@
+import json
+import math
+import random
+import sys
+from array import array
+
+from casinobot import player
+from simulator import betting, records
+from simulator.engine import FastGame, FastHand
+from simulator.simulator import BlackjackHooks, BlackjackSimulator
+
+# Recorded rounds are packed into 32-bit codes: the bets won or lost by the hands that
+# weren't naturals or surrendered (offset by 16, 5 bits), then the naturals won, hands
+# surrendered, splits and doubledowns (3 bits each), and the alternative outcome of the
+# round played without doubling down or splitting (3 bits)
+UNITS_OFFSET = 16
+
+# Alternative outcomes, recorded when the round doubled down or split. The round can't be
+# played again if the shoe ran out of cards in the middle of it.
+ALT_LOSS = 0
+ALT_TIE = 1
+ALT_WIN = 2
+ALT_SURRENDER = 3
+ALT_NONE = 7
+
+ALTERNATIVES = {
+    ALT_LOSS: (-1, 0, 0),
+    ALT_TIE: (0, 0, 0),
+    ALT_WIN: (1, 0, 0),
+    ALT_SURRENDER: (0, 0, 1),
+}
+
+# First line of an outcome file, followed by a line of JSON settings and the round codes
+MAGIC = b"casinosim-outcomes 1\n"
+
+
+def encode(units, naturals, surrenders, splits, doubles, alternative=ALT_NONE):
+    return ((units + UNITS_OFFSET) | naturals << 5 | surrenders << 8 | splits << 11 |
+            doubles << 14 | alternative << 17)
+
+
+def decode(code):
+    """
+    Unpacks a round code into (units, naturals, surrenders, hands, result, extra bets) of
+    the round as played and of its alternative, where `result` is what the betting system
+    sees and `extra bets` how many bets doubling down and splitting added to the first.
+    Rounds that didn't add any have no alternative (`None`).
+    """
+    units = (code & 0x1f) - UNITS_OFFSET
+    naturals = code >> 5 & 7
+    surrenders = code >> 8 & 7
+    splits = code >> 11 & 7
+    doubles = code >> 14 & 7
+    alternative = code >> 17 & 7
+
+    played = (units, naturals, surrenders, splits + 1, units + naturals - surrenders, splits + doubles)
+    if splits + doubles == 0:
+        return (played, None)
+    if alternative == ALT_NONE:
+        return (played, played)
+    (units, naturals, surrenders) = ALTERNATIVES[alternative]
+    return (played, (units, naturals, surrenders, 1, units + naturals - surrenders, 0))
+
+
+class RecordingGame(FastGame):
+    """
+    Plays rounds with a flat bet of 1 and records what they'd pay instead of paying it
+    out. Doubling down and splitting are always affordable, and rounds that did either
+    are played again from the same cards without them, for when they aren't.
+    """
+
+    def __init__(self, strat, shoe, rng):
+        pl = player.Player(1, 'Recorder')
+        pl.gold = math.inf
+        hooks = BlackjackHooks(strat, betting.NoBetting(), rng=rng)
+        FastGame.__init__(self, pl, strat, hooks, shoe)
+
+    def win(self, hand, natural=False):
+        if natural:
+            self.naturals += 1
+        else:
+            self.units += hand.bet
+        self.count(hand)
+
+    def lose(self, hand):
+        self.units -= hand.bet
+        self.count(hand)
+
+    def tie(self, hand):
+        self.count(hand)
+
+    def surrender(self, hand):
+        self.surrenders += 1
+        self.count(hand)
+
+    def count(self, hand):
+        self.hands += 1
+        if hand.did_doubledown:
+            self.doubles += 1
+
+    def record(self):
+        """
+        Plays a round and returns its code.
+        """
+        shoe = self.shoe
+        shoe.start_round()
+        start = shoe.pos
+        shuffles = shoe.shuffles
+        (units, naturals, surrenders, hands, doubles) = self.play_recorded()
+        if hands == 1 and doubles == 0:
+            return encode(units, naturals, surrenders, 0, 0)
+
+        alternative = ALT_NONE
+        if shoe.shuffles == shuffles:
+            # Without any gold left over after the bet, nothing can be doubled or split
+            end = shoe.pos
+            state = self.random.getstate()
+            shoe.pos = start
+            self.player.gold = 0
+            (alt_units, _, alt_surrenders, _, _) = self.play_recorded()
+            self.player.gold = math.inf
+            shoe.pos = end
+            self.random.setstate(state)
+            if alt_surrenders:
+                alternative = ALT_SURRENDER
+            else:
+                alternative = (ALT_LOSS, ALT_TIE, ALT_WIN)[alt_units + 1]
+        return encode(units, naturals, surrenders, hands - 1, doubles, alternative)
+
+    def play_recorded(self):
+        """
+        Deals and plays a round. Returns the bets won (negative if lost) by the hands that
+        weren't naturals or surrendered, the naturals won, hands surrendered, hands
+        played and hands doubled down.
+        """
+        self.units = 0
+        self.naturals = 0
+        self.surrenders = 0
+        self.hands = 0
+        self.doubles = 0
+
+        shoe = self.shoe
+        hand = FastHand(1)
+        dealer = FastHand(0)
+        for _ in range(2):
+            hand.add_card(shoe.deal_card())
+            dealer.add_card(shoe.deal_card())
+
+        dealer_natural = dealer.total == 21
+        if hand.total == 21:
+            if dealer_natural:
+                self.tie(hand)
+            else:
+                self.win(hand, natural=True)
+        elif dealer_natural:
+            self.lose(hand)
+        elif self.play_hands(hand, dealer):
+            self.dealer_play(dealer)
+
+        return (self.units, self.naturals, self.surrenders, self.hands, self.doubles)
+
+
+class OutcomeStream:
+    """
+    Round codes of a strategy played at flat bets, either read from an `OutcomeFile` or
+    recorded by `recorder` (a `RecordingGame`) as they're needed. Any number of betting
+    systems can be replayed against the same stream, as card play doesn't depend on the
+    size of the bet.
+    """
+
+    def __init__(self, recorder=None, codes=None):
+        self.recorder = recorder
+        self.codes = codes if codes is not None else array('I')
+
+    def __len__(self):
+        return len(self.codes)
+
+    def record(self):
+        """
+        Records another round. Returns `False` if there's no recorder to do it.
+        """
+        if self.recorder is None:
+            return False
+        self.codes.append(self.recorder.record())
+        return True
+
+
+class OutcomeRecorder:
+    """
+    Records outcome streams of `strat` dealt from `shoe`, with its own random stream
+    seeded the same way as `BlackjackSimulator`'s.
+    """
+
+    def __init__(self, strat, shoe):
+        self.random = random.Random()
+        self.shoe = shoe
+        shoe.random = self.random
+        self.game = RecordingGame(strat, shoe, self.random)
+
+    def set_seed(self, seed):
+        self.random.seed(seed)
+        self.shoe.reset()
+
+    def stream(self):
+        return OutcomeStream(self.game)
+
+    def run(self, rounds):
+        """
+        Records an iteration of `rounds` rounds. Returns their codes.
+        """
+        record = self.game.record
+        return array('I', (record() for _ in range(rounds)))
+
+
+class OutcomeFile:
+    """
+    Outcome streams of several iterations saved to a file: `MAGIC`, a line of JSON with
+    the settings they were recorded with, and every iteration's `rounds` round codes in
+    turn, as little-endian 32-bit integers.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        with open(file, 'rb') as f:
+            if f.readline() != MAGIC:
+                raise ValueError("{0} isn't an outcome file".format(file))
+            self.info = json.loads(f.readline().decode())
+            self.offset = f.tell()
+        self.iterations = self.info["iterations"]
+        self.rounds = self.info["rounds"]
+
+    def stream(self, iteration):
+        if not 0 <= iteration < self.iterations:
+            raise ValueError("{0} only has {1} iterations".format(self.file, self.iterations))
+        codes = array('I')
+        with open(self.file, 'rb') as f:
+            f.seek(self.offset + iteration * self.rounds * codes.itemsize)
+            codes.fromfile(f, self.rounds)
+        if sys.byteorder != 'little':
+            codes.byteswap()
+        return OutcomeStream(codes=codes)
+
+    @staticmethod
+    def write_header(f, info):
+        """
+        Writes the start of an outcome file to `f`, the iterations' codes follow with
+        `write_codes`. `info` needs at least "iterations" and "rounds".
+        """
+        f.write(MAGIC)
+        f.write(json.dumps(info).encode() + b"\n")
+
+    @staticmethod
+    def write_codes(f, codes):
+        if sys.byteorder != 'little':
+            codes = array('I', codes)
+            codes.byteswap()
+        codes.tofile(f)
+
+
+class ReplaySimulator(BlackjackSimulator):
+    """
+    `BlackjackSimulator` that replays the rounds of an `OutcomeStream` with its betting
+    system instead of dealing them. Gold is paid out the same way the engines pay it,
+    and the betting system sees the same round results.
+
+    A round that doubled down or split is replayed as recorded if the player has the
+    gold for every extra bet and the betting system allows doubling, and as its
+    alternative played without either otherwise. Results are exact unless the player
+    could have afforded some of the extra bets but not all of them. A stream read from
+    a file ends the iteration after its last round.
+    """
+
+    def new_player(self):
+        return player.Player(1, self.name)
+
+    def reset(self):
+        BlackjackSimulator.reset(self)
+        self.round = 0
+        self.hands = 0
+        self.decoded = {}
+
+    def set_stream(self, stream):
+        self.stream = stream
+
+    def play_round(self):
+        pl = self.player
+        hooks = self.hooks
+        bet = hooks.next_bet(pl) or 0
+
+        stream = self.stream
+        i = self.round
+        if i >= len(stream):
+            stream.record()
+        code = stream.codes[i]
+        self.round += 1
+        if self.round == len(stream) and stream.recorder is None and not hooks.end:
+            hooks.end_reason = "Ran out of recorded rounds."
+            hooks.end = True
+
+        outcomes = self.decoded.get(code)
+        if outcomes is None:
+            outcomes = self.decoded[code] = decode(code)
+        (units, naturals, surrenders, hands, res, extra) = outcomes[0]
+        if extra and (pl.gold - bet < extra * bet or not self.bet_system.can_double()):
+            (units, naturals, surrenders, hands, res, extra) = outcomes[1]
+        self.hands += hands
+
+        flags = 0
+        if naturals:
+            flags |= records.NATURAL
+        if surrenders:
+            flags |= records.SURRENDER
+        if hands > 1:
+            flags |= records.SPLIT
+        if extra >= hands:
+            flags |= records.DOUBLE
+        hooks.round_hands = hands
+        hooks.round_flags = flags
+
+        # Naturals pay 3:2 and surrenders return half the bet, rounded down like
+        # `Player.add_gold` does
+        pl.gold += units * bet + naturals * (int(bet * 2.5) - bet) + surrenders * (int(bet / 2) - bet)
+
+        hooks.settle_result(res)
+
+    def update_stats(self):
+        BlackjackSimulator.update_stats(self)
+        self.stats.total_hands = self.hands
+
+
+class BettingSweep:
+    """
+    Runs several betting systems against the same cards (common random numbers): each
+    iteration gets a single `OutcomeStream`, recorded from `shoe` or read from the
+    `OutcomeFile` `outcome_file`, and every betting system is replayed against it by its
+    own `ReplaySimulator`. Card play is shared by all of them, and the differences
+    between their results come from the betting alone.
+    """
+
+    def __init__(self, strat, bet_systems, shoe, outcome_file=None):
+        for bet_system in bet_systems:
+            if isinstance(bet_system, betting.Counting):
+                raise ValueError("Counting bets depend on the cards, it can't be replayed")
+        self.recorder = OutcomeRecorder(strat, shoe)
+        self.outcome_file = outcome_file
+        self.simulators = [ReplaySimulator(strat, bet_system) for bet_system in bet_systems]
+
+    def set_starting_gold(self, gold):
+        for sim in self.simulators:
+            sim.set_starting_gold(gold)
+
+    def set_target_gold(self, target):
+        for sim in self.simulators:
+            sim.set_target_gold(target)
+
+    def set_anti_fallacy(self, enable):
+        for sim in self.simulators:
+            sim.set_anti_fallacy(enable)
+
+    def set_positive_prog(self, enable):
+        for sim in self.simulators:
+            sim.set_positive_prog(enable)
+
+    def set_round_writer(self, writer):
+        """
+        Records the rounds of the only betting system, see
+        `BlackjackSimulator.set_round_writer`.
+        """
+        if len(self.simulators) > 1:
+            raise ValueError("Rounds can only be recorded for a single set of bet options")
+        self.simulators[0].set_round_writer(writer)
+
+    def set_seed(self, seed):
+        """
+        Re-seeds the random stream the outcome streams are recorded with, see
+        `BlackjackSimulator.set_seed`.
+        """
+        self.recorder.set_seed(seed)
+
+    def run(self, rounds, iteration=0):
+        """
+        Runs a single iteration of every betting system, on the stream of `iteration` if
+        replaying a file. Returns their (end reason, stats) in order.
+        """
+        if self.outcome_file is not None:
+            stream = self.outcome_file.stream(iteration)
+        else:
+            stream = self.recorder.stream()
+        results = []
+        for sim in self.simulators:
+            sim.set_stream(stream)
+            sim.reset()
+            results.append(sim.run(rounds, iteration))
+        return results
@@ -0,0 +1,172 @@
+import cProfile
+import os
+import time
+
+from casinobot import blackjack, cards
+from simulator import counting, engine, outcomes, records, seats, simulator, strategy
+
+try:
+    from simulator import vectorized
+except ImportError:
+    # NumPy isn't installed
+    vectorized = None
+
+# Methods timed as each phase of a round, as (class, method name) pairs
+PHASES = [
+    ("setup", [(blackjack.Game, "__init__"), (blackjack.Game, "begin_game"),
+               (simulator.BlackjackSimulator, "reset"), (engine.FastBlackjackSimulator, "reset"),
+               (seats.TableSimulator, "play_round")]),
+    ("bets", [(simulator.BlackjackHooks, "next_bet"), (simulator.BlackjackHooks, "settle_result")]),
+    ("deal", [(blackjack.Game, "deal_cards"), (engine.FastGame, "play"), (seats.FastTableGame, "play")]),
+    ("shuffle", [(cards.Deck, "shuffle"), (cards.CompactDeck, "shuffle")]),
+    ("turns", [(blackjack.Game, "_start_turn"), (blackjack.Game, "hit"), (blackjack.Game, "stand"),
+               (blackjack.Game, "surrender"), (blackjack.Game, "doubledown"), (blackjack.Game, "split"),
+               (blackjack.Game, "next_player"), (engine.FastGame, "play_hands")]),
+    ("choose_action", [(simulator.BlackjackHooks, "choose_action"), (engine.FastGame, "choose_action")]),
+    ("get_strat", [(strategy.BlackjackStrategy, "get_strat"), (counting.CountingStrategy, "get_strat")]),
+    ("dealer", [(blackjack.Game, "dealer_play"), (blackjack.Game, "calc_winners"), (blackjack.Game, "skip_dealer"),
+                (engine.FastGame, "dealer_play"), (engine.FastGame, "settle_hands")]),
+    ("settle", [(blackjack.Game, "game_over"), (simulator.BlackjackHooks, "settle")]),
+    ("replay", [(outcomes.ReplaySimulator, "play_round")]),
+    ("records", [(records.RoundWriter, "add"), (records.RoundWriter, "add_records"), (records.RoundWriter, "flush")]),
+    ("bookkeeping", [(simulator.BlackjackSimulator, "run"), (outcomes.BettingSweep, "run"),
+                     (seats.TableSimulator, "run")]),
+]
+
+if vectorized is not None:
+    PHASES += [
+        ("batch", [(vectorized.VectorizedBlackjackSimulator, "play_batch"),
+                   (vectorized.VectorizedBlackjackSimulator, "gold_deltas"),
+                   (vectorized.VectorizedBlackjackSimulator, "add_hands"),
+                   (vectorized.VectorizedBlackjackSimulator, "track_risk")]),
+        ("records", [(vectorized.VectorizedBlackjackSimulator, "write_rounds")]),
+        ("bookkeeping", [(vectorized.VectorizedBlackjackSimulator, "run")]),
+    ]
+
+
+def merge(total, phases):
+    """
+    Adds the (calls, nanoseconds) of each phase in `phases` to `total`.
+    """
+    for (phase, (calls, ns)) in phases.items():
+        (total_calls, total_ns) = total.get(phase, (0, 0))
+        total[phase] = (total_calls + calls, total_ns + ns)
+
+
+def print_phases(phases, print_fn):
+    """
+    Prints the calls and time spent in each phase, most time first.
+    """
+    total = sum(ns for (_, ns) in phases.values())
+    print_fn("{:<16}{:>14}{:>12}{:>9}{:>12}".format("Phase", "Calls", "Seconds", "Time", "ns/call"))
+    for (phase, (calls, ns)) in sorted(phases.items(), key=lambda item: -item[1][1]):
+        print_fn("{:<16}{:>14,}{:>12.3f}{:>9.2%}{:>12,.0f}".format(
+            phase, calls, ns / 1e9, ns / total if total else 0, ns / calls if calls else 0))
+
+
+class PhaseTimer:
+    """
+    Counts the calls and time spent in each phase of the rounds played in this process.
+
+    Timing is opt-in: `install` replaces the methods listed in `PHASES` with timed
+    wrappers, and `uninstall` puts the originals back, so nothing is timed or paid for
+    unless installed. A phase's time excludes the phases it calls, e.g. the time
+    `choose_action` spends in `get_strat` only counts towards `get_strat`. The timers'
+    own overhead of a few hundred nanoseconds per call is counted in the phases.
+    """
+
+    def __init__(self, phases=PHASES):
+        self.phases = phases
+        self.times = {}
+        self.current = None
+        self.started = 0
+        self.originals = []
+
+    def wrap(self, phase, fn):
+        timer = self
+        times = self.times
+        counter = time.perf_counter_ns
+
+        def timed(*args, **kwargs):
+            now = counter()
+            outer = timer.current
+            if outer is not None:
+                times[outer][1] += now - timer.started
+            entry = times[phase]
+            entry[0] += 1
+            timer.current = phase
+            timer.started = now
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                now = counter()
+                entry[1] += now - timer.started
+                timer.current = outer
+                timer.started = now
+
+        timed.__name__ = fn.__name__
+        timed.__doc__ = fn.__doc__
+        timed.__wrapped__ = fn
+        return timed
+
+    def install(self):
+        for (phase, methods) in self.phases:
+            self.times.setdefault(phase, [0, 0])
+            for (cls, name) in methods:
+                original = cls.__dict__[name]
+                self.originals.append((cls, name, original))
+                setattr(cls, name, self.wrap(phase, original))
+
+    def uninstall(self):
+        for (cls, name, original) in reversed(self.originals):
+            setattr(cls, name, original)
+        self.originals = []
+
+    def take(self):
+        """
+        Returns the (calls, nanoseconds) of each phase called since the last `take`,
+        and starts counting from zero.
+        """
+        phases = {}
+        for (phase, entry) in self.times.items():
+            if entry[0]:
+                phases[phase] = (entry[0], entry[1])
+            entry[0] = entry[1] = 0
+        return phases
+
+
+class WorkerProfile:
+    """
+    Profiling of a pool process: phase timing with a `PhaseTimer` if `phases`, and a
+    cProfile of everything it runs dumped to `directory` if given, one pstats file per
+    process that can be read with `pstats.Stats`.
+    """
+
+    def __init__(self, phases=True, directory=None):
+        self.timer = PhaseTimer() if phases else None
+        self.directory = directory
+        self.profile = None
+
+    def install(self):
+        if self.timer is not None:
+            self.timer.install()
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+            self.profile = cProfile.Profile()
+
+    def file(self):
+        return os.path.join(self.directory, "worker-{}.pstats".format(os.getpid()))
+
+    def start(self):
+        if self.profile is not None:
+            self.profile.enable()
+
+    def stop(self):
+        """
+        Stops profiling a batch, returns the phase times it took.
+        """
+        if self.profile is not None:
+            self.profile.disable()
+            # Rewritten after every batch, as pool processes aren't told when they're done
+            self.profile.dump_stats(self.file())
+        return self.timer.take() if self.timer is not None else {}
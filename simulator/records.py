@@ -0,0 +1,123 @@
+import json
+import os
+import struct
+
+try:
+    import numpy as np
+except ImportError:
+    # Round files can still be written without NumPy, just not read
+    np = None
+
+# Flags of a round record
+NATURAL = 1
+SURRENDER = 2
+SPLIT = 4
+DOUBLE = 8
+
+# A round record: iteration, round (counted from 0 in its iteration), gold won (negative
+# if lost), gold after the round, hands played and flags, padded to 28 bytes
+RECORD = struct.Struct('<IIqqBBxx')
+
+# The same record as a NumPy structured array type
+if np is not None:
+    DTYPE = np.dtype({
+        'names': ['iteration', 'round', 'net', 'gold', 'hands', 'flags'],
+        'formats': ['<u4', '<u4', '<i8', '<i8', 'u1', 'u1'],
+        'offsets': [0, 4, 8, 16, 24, 25],
+        'itemsize': RECORD.size,
+    })
+else:
+    DTYPE = None
+
+# First line of a round file, followed by a line of JSON settings and the records
+MAGIC = b"casinosim-rounds 1\n"
+
+
+class RoundWriter:
+    """
+    Appends round records to a round file started by `RoundFile.write_header`. Records
+    are buffered and written `chunk` records at a time.
+
+    Any number of processes can append to the same file: each opens it in append mode
+    the first time it writes, and writes each chunk with a single call, so chunks end up
+    whole and one after another. Records of an iteration stay in order, but can be
+    interleaved with chunks of iterations other processes play.
+    """
+
+    def __init__(self, file, chunk=1 << 15):
+        self.file = file
+        self.chunk = chunk
+        self.fd = None
+        self.buffer = bytearray()
+
+    def __getstate__(self):
+        # Each process opens the file on its own
+        state = self.__dict__.copy()
+        state["fd"] = None
+        state["buffer"] = bytearray()
+        return state
+
+    def add(self, iteration, curr_round, net, gold, hands, flags):
+        self.buffer += RECORD.pack(iteration, curr_round, net, gold, hands, flags)
+        if len(self.buffer) >= self.chunk * RECORD.size:
+            self.flush()
+
+    def add_records(self, records):
+        """
+        Adds records already packed together, e.g. the bytes of a `DTYPE` array.
+        """
+        self.buffer += records
+        if len(self.buffer) >= self.chunk * RECORD.size:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        if self.fd is None:
+            self.fd = os.open(self.file, os.O_WRONLY | os.O_APPEND)
+        data = memoryview(self.buffer)
+        while data:
+            data = data[os.write(self.fd, data):]
+        self.buffer = bytearray()
+
+
+class RoundFile:
+    """
+    A file of round records: `MAGIC`, a line of JSON with the settings of the run, and
+    fixed-width `RECORD`s. `records()` maps them into memory as a NumPy structured
+    array, so runs of billions of rounds can be analyzed without loading them or
+    playing them again.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        with open(file, 'rb') as f:
+            if f.readline() != MAGIC:
+                raise ValueError("{0} isn't a round file".format(file))
+            self.info = json.loads(f.readline().decode())
+            self.offset = f.tell()
+
+    def __len__(self):
+        return (os.path.getsize(self.file) - self.offset) // RECORD.size
+
+    def records(self):
+        """
+        Returns every record as a read-only memory-mapped `DTYPE` array. The records of
+        iteration `i` are `records[records['iteration'] == i]`, in order.
+        """
+        if np is None:
+            raise RuntimeError("Reading round files requires NumPy")
+        count = len(self)
+        if count == 0:
+            return np.empty(0, dtype=DTYPE)
+        return np.memmap(self.file, dtype=DTYPE, mode='r', offset=self.offset, shape=(count,))
+
+    @staticmethod
+    def write_header(file, info):
+        """
+        Creates the round file `file` for `RoundWriter`s to append to, with the settings
+        `info`.
+        """
+        with open(file, 'wb') as f:
+            f.write(MAGIC)
+            f.write(json.dumps(info).encode() + b"\n")
@@ -0,0 +1,236 @@
+import csv
+import json
+import math
+import os
+import sys
+
+from simulator import stats
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    # Parquet output falls back to CSV
+    pyarrow = None
+
+# Formats results can be written in, "text" being the usual printed output
+FORMATS = ("text", "json", "csv", "parquet")
+
+# Columns of the per-iteration rows, the seat being numbered from 1 at tables
+ITERATION_COLUMNS = ("iteration", "seat", "bet_options", "end_reason", "gold_end", "hands",
+                     "max_drawdown", "peak_round", "ruin_round")
+
+# Output buffer size, results are written in bulk
+BUFFER_SIZE = 1 << 20
+
+
+def number(value):
+    # NaN isn't valid JSON, and doesn't mean anything in a CSV either
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def plain(value):
+    # NumPy scalars, as kept in the numpy engine's stats, as the numbers they hold
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError("Object of type {} is not JSON serializable".format(type(value).__name__))
+
+
+def summarize(st):
+    """
+    Summary of a `stats.RunningStats` as a dict.
+    """
+    return {
+        "count": st.count,
+        "mean": number(st.mean if st.count else math.nan),
+        "confidence": number(st.confidence()),
+        "min": number(st.min if st.count else math.nan),
+        "median": number(st.quantile(0.5)),
+        "p05": number(st.quantile(0.05)),
+        "p95": number(st.quantile(0.95)),
+        "max": number(st.max if st.count else math.nan),
+    }
+
+
+def summarize_stats(st):
+    """
+    Summary of a `stats.BlackjackStats` as a dict.
+    """
+    values = {"gold_start": st.gold_start, "gold_target": st.gold_target,
+              "gold_max": st.gold_max, "gold_min": st.gold_min}
+    for (name, stat) in stats.OUTPUT_CONFIG:
+        if name != "" and "gold" not in stat:
+            values[stat["attr"]] = getattr(st, stat["attr"])
+    values["max_drawdown"] = st.max_drawdown
+    for (_, attr) in stats.RISK_OUTPUT_CONFIG:
+        values[attr] = summarize(getattr(st, attr))
+    return values
+
+
+def flatten(values, prefix=""):
+    """
+    Flattens nested dicts into a single dict with dotted keys.
+    """
+    flat = {}
+    for (key, value) in values.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, prefix + key + "."))
+        else:
+            flat[prefix + key] = value
+    return flat
+
+
+class RunResults:
+    """
+    Results of a run in a machine-readable shape: the run's settings, the end reasons of
+    each set of bet options with their end gold and hands, the combined stats, timing
+    and optionally the time spent in each phase and a row per iteration. The seats of a
+    table each get a result with their seat number and their own stats.
+
+    JSON gets everything in a single document. CSV and Parquet get a table with a row
+    per set of bet options and a column per value, with the iteration rows in a second
+    table written next to it (`iterations_file`).
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.results = []
+        self.stats = None
+        self.timing = {}
+        self.profile = None
+        self.iterations = []
+
+    def add_result(self, bet_options, reasons, iterations, seat=None, st=None):
+        """
+        Adds the end reasons of a set of bet options, as collected by casinosim, and for
+        a seat of a table its number and `stats.BlackjackStats`.
+        """
+        summary = {}
+        for reason in sorted(reasons):
+            count = reasons[reason]["gold_end"].count
+            summary[reason.rstrip('.')] = {
+                "count": count,
+                "fraction": count / iterations,
+                "gold_end": summarize(reasons[reason]["gold_end"]),
+                "hands": summarize(reasons[reason]["hands"]),
+            }
+        result = {}
+        if seat is not None:
+            result["seat"] = seat
+        result["bet_options"] = bet_options
+        result["reasons"] = summary
+        if st is not None:
+            result["stats"] = summarize_stats(st)
+        self.results.append(result)
+
+    def set_stats(self, st):
+        """
+        Adds the combined `stats.BlackjackStats` of the run.
+        """
+        self.stats = summarize_stats(st)
+
+    def set_timing(self, seconds, iterations):
+        self.timing = {"seconds": seconds, "iterations_per_second": iterations / seconds if seconds else None}
+
+    def set_profile(self, phases):
+        """
+        Adds the (calls, nanoseconds) of each phase, as merged by `profiling.merge`.
+        """
+        self.profile = {phase: {"calls": calls, "seconds": ns / 1e9} for (phase, (calls, ns)) in sorted(phases.items())}
+
+    def add_iterations(self, rows):
+        """
+        Adds per-iteration rows, tuples in the order of `ITERATION_COLUMNS`.
+        """
+        self.iterations.extend(rows)
+
+    def to_dict(self):
+        results = {"config": self.config, "timing": self.timing, "results": self.results}
+        if self.stats is not None:
+            results["stats"] = self.stats
+        if self.profile is not None:
+            results["profile"] = self.profile
+        if self.iterations:
+            results["iterations"] = [dict(zip(ITERATION_COLUMNS, row)) for row in sorted(self.iterations)]
+        return results
+
+    def rows(self):
+        """
+        The results as flat rows, one per set of bet options or seat.
+        """
+        rows = []
+        for result in self.results:
+            row = flatten({"config": self.config, "timing": self.timing})
+            if "seat" in result:
+                row["seat"] = result["seat"]
+            row["bet_options"] = result["bet_options"]
+            row.update(flatten(result["reasons"], "reasons."))
+            if "stats" in result:
+                row.update(flatten(result["stats"], "stats."))
+            elif self.stats is not None:
+                row.update(flatten(self.stats, "stats."))
+            if self.profile is not None:
+                row.update(flatten(self.profile, "profile."))
+            rows.append(row)
+        return rows
+
+    @staticmethod
+    def iterations_file(file):
+        """
+        Where the iteration rows of table output written to `file` go.
+        """
+        (root, ext) = os.path.splitext(file)
+        return root + ".iterations" + ext
+
+    def write(self, fmt, file=None, stream=sys.stdout):
+        """
+        Writes the results in `fmt` to `file`, or to `stream` if `file` is `None`.
+        Returns the files written.
+        """
+        if fmt == "json":
+            with self.open(file, stream) as f:
+                json.dump(self.to_dict(), f, indent=2, default=plain)
+                f.write("\n")
+            return [file]
+
+        if fmt == "parquet" and pyarrow is None:
+            sys.stderr.write("pyarrow isn't installed, writing CSV instead\n")
+            fmt = "csv"
+            file = os.path.splitext(file)[0] + ".csv"
+
+        rows = self.rows()
+        columns = []
+        for row in rows:
+            columns.extend(column for column in row if column not in columns)
+        written = [file]
+        if fmt == "csv":
+            with self.open(file, stream) as f:
+                writer = csv.DictWriter(f, columns)
+                writer.writeheader()
+                writer.writerows(rows)
+            if self.iterations:
+                written.append(self.iterations_file(file))
+                with self.open(written[-1], stream) as f:
+                    writer = csv.writer(f)
+                    writer.writerow(ITERATION_COLUMNS)
+                    writer.writerows(sorted(self.iterations))
+        else:
+            table = pyarrow.table({column: [row.get(column) for row in rows] for column in columns})
+            pyarrow.parquet.write_table(table, file)
+            if self.iterations:
+                written.append(self.iterations_file(file))
+                iterations = sorted(self.iterations)
+                table = pyarrow.table({column: [row[i] for row in iterations]
+                                       for (i, column) in enumerate(ITERATION_COLUMNS)})
+                pyarrow.parquet.write_table(table, written[-1])
+        return written
+
+    @staticmethod
+    def open(file, stream):
+        if file is None:
+            # A copy of the stream, which stays open when the copy is closed
+            stream.flush()
+            return os.fdopen(os.dup(stream.fileno()), 'w', buffering=BUFFER_SIZE, newline='')
+        return open(file, 'w', buffering=BUFFER_SIZE, newline='')
@@ -0,0 +1,233 @@
+import random
+
+from casinobot import blackjack, cards, channel, player
+from simulator.engine import FastBlackjackSimulator, FastHand
+from simulator.simulator import BlackjackSimulator, Phenny
+
+# Most seats a table has
+SEATS = 7
+
+
+class TableHooks:
+    """
+    Hands the callbacks of a CasinoBot game played by several seats on to each seat's
+    `BlackjackHooks`: game-wide callbacks to every seat in the game, and turns to the
+    hooks of the player whose turn it is.
+    """
+
+    def __init__(self):
+        self.seats = []
+        self.turned = []
+
+    def on_init(self, bj):
+        for hooks in self.seats:
+            hooks.on_init(bj)
+
+    def on_begin_game(self, bj):
+        self.turned = []
+        for hooks in self.seats:
+            hooks.on_begin_game(bj)
+
+    def on_start_turn(self, bj, uid):
+        hooks = bj.players[uid].hooks
+        if hooks not in self.turned:
+            self.turned.append(hooks)
+        hooks.on_start_turn(bj, uid)
+
+    def on_hit(self, bj, uid):
+        bj.players[uid].hooks.on_hit(bj, uid)
+
+    def on_loss(self, pl, surrender=False):
+        pl.hooks.on_loss(pl, surrender)
+
+    def on_skip_dealer(self, bj):
+        # Only the seats that played out their hands, like with a single seat
+        for hooks in self.turned:
+            hooks.on_skip_dealer(bj)
+
+    def on_game_over(self, bj):
+        for hooks in self.seats:
+            hooks.on_game_over(bj)
+
+
+class FastTableGame:
+    """
+    Headless round engine for several seats: plays the `FastGame` of each seat against
+    a single dealer hand, dealt from their shared shoe in seat order. With one seat it
+    deals and plays exactly like `FastGame.play`.
+    """
+
+    def __init__(self, shoe):
+        self.shoe = shoe
+
+    def play(self, games):
+        hands = []
+        for game in games:
+            pl = game.player
+            bet = game.hooks.next_bet(pl) or 0
+            pl.remove_gold(bet)
+            hands.append(FastHand(bet))
+
+        shoe = self.shoe
+        shoe.start_round()
+        dealer = FastHand(0)
+        for _ in range(2):
+            for hand in hands:
+                hand.add_card(shoe.deal_card())
+            dealer.add_card(shoe.deal_card())
+
+        dealer_natural = dealer.total == 21
+        playing = []
+        turned = []
+        for (game, hand) in zip(games, hands):
+            if hand.total == 21:
+                if dealer_natural:
+                    game.tie(hand)
+                else:
+                    game.win(hand, natural=True)
+            elif dealer_natural:
+                game.lose(hand)
+                game.player.natlosses += 1
+            elif game.play_hands(hand, dealer):
+                playing.append(game)
+            else:
+                turned.append(game)
+
+        if playing:
+            while dealer.total < 17:
+                dealer.add_card(shoe.deal_card())
+            dealer_value = dealer.total
+            for game in playing:
+                game.settle_hands(dealer_value)
+        else:
+            # The dealer skips only if no seat has a hand left
+            for game in turned:
+                game.hooks.on_skip_dealer(game)
+
+        for game in games:
+            game.hooks.settle()
+
+
+class TableSimulator:
+    """
+    Plays full tables: up to `SEATS` seats, each with its own strategy, betting system,
+    bankroll and stats, dealt from one shoe against one dealer. Seats are dealt and
+    play in order, and a seat leaves the table when an end condition is reached for
+    it, with the table playing on until every seat has left or the round limit is
+    reached. Seats see the same cards as the seats before them play them, so strategies
+    are compared under the same shoes rather than independent ones.
+
+    Each seat is a simulator of `seat_engine` that plays its rounds at the table.
+    """
+
+    seat_engine = BlackjackSimulator
+    name = 'Table'
+
+    def __init__(self, strats, bet_systems, out=None):
+        if not 1 <= len(strats) <= SEATS:
+            raise ValueError("A table has 1 to {0} seats".format(SEATS))
+        level = channel.NOTICE if out is not None else channel.QUIET
+        self.phenny = channel.Channel(Phenny(self.print), level)
+        self.output = out
+        self.random = random.Random()
+        self.shoe = cards.Shoe(rng=self.random)
+        self.table = player.Table(self.shoe)
+        self.hooks = TableHooks()
+
+        self.seats = []
+        for (uid, (strat, bet_system)) in enumerate(zip(strats, bet_systems), 1):
+            seat = self.seat_engine(strat, bet_system, out)
+            seat.join_table(self.table, uid, self.random)
+            self.seats.append(seat)
+
+    def print(self, *args):
+        if self.output is not None:
+            self.output(*args)
+
+    def set_starting_gold(self, gold):
+        for seat in self.seats:
+            seat.set_starting_gold(gold)
+
+    def set_target_gold(self, target):
+        for seat in self.seats:
+            seat.set_target_gold(target)
+
+    def set_anti_fallacy(self, enable):
+        for seat in self.seats:
+            seat.set_anti_fallacy(enable)
+
+    def set_positive_prog(self, enable):
+        for seat in self.seats:
+            seat.set_positive_prog(enable)
+
+    def set_shoe(self, shoe):
+        """
+        Sets the shoe every seat is dealt from, see `BlackjackSimulator.set_shoe`.
+        """
+        self.shoe = shoe
+        self.table.shoe = shoe
+        for seat in self.seats:
+            seat.set_shoe(shoe)
+
+    def set_seed(self, seed):
+        """
+        Re-seeds the random stream of the whole table, see `BlackjackSimulator.set_seed`.
+        """
+        self.random.seed(seed)
+        self.shoe.reset()
+
+    def set_round_writer(self, writer):
+        if writer is not None:
+            raise ValueError("Rounds can't be recorded for a table of seats")
+
+    def play_round(self, seated):
+        """
+        Plays a single round of blackjack with the seats in `seated`.
+        """
+        self.hooks.seats = [seat.hooks for seat in seated]
+        # The game reverses the turn order of the players who joined
+        for seat in reversed(seated[1:]):
+            self.phenny.say(self.table.add_to_game(self.phenny, seat.uid))
+        first = seated[0]
+        blackjack.Game(self.phenny, first.uid, first.name, self.hooks, table=self.table)
+
+    def run(self, rounds, iteration=0):
+        """
+        Runs a single iteration of the table. Returns the (end reason, stats) of every
+        seat in order.
+        """
+        results = [None] * len(self.seats)
+        seated = []
+        trajectories = []
+        for seat in self.seats:
+            seat.reset()
+            seated.append(seat)
+            trajectories.append(seat.begin_run(rounds))
+
+        curr_round = 0
+        while seated:
+            for seat in seated:
+                seat.bet_system.set_seats(len(seated))
+            self.play_round(seated)
+            curr_round += 1
+            for seat in seated[:]:
+                i = seat.uid - 1
+                end_reason = seat.end_round(curr_round, trajectories[i])
+                if rounds > 0 and curr_round >= rounds:
+                    end_reason = "Finished rounds."
+                if end_reason is not None:
+                    results[i] = seat.end_run(end_reason, curr_round, trajectories[i])
+                    seated.remove(seat)
+        return results
+
+
+class FastTableSimulator(TableSimulator):
+    """
+    `TableSimulator` that plays its rounds with the headless `FastTableGame` instead of
+    CasinoBot.
+    """
+
+    seat_engine = FastBlackjackSimulator
+
+    def play_round(self, seated):
+        FastTableGame(self.shoe).play([seat.game for seat in seated])
@@ -1,8 +1,19 @@
+import hashlib
 import random
 import time
 
-from casinobot import blackjack, player
-from simulator import betting, stats, strategy
+from casinobot import blackjack, cards, channel, player
+from simulator import betting, records, stats, strategy
+
+
+def iteration_seed(seed, iteration):
+    """
+    Derives the seed of a single iteration from the seed of the whole run. Each
+    iteration gets an independent random stream that doesn't depend on which process
+    plays it, or on what was played before it.
+    """
+    digest = hashlib.sha256("{0}:{1}".format(seed, iteration).encode()).digest()
+    return int.from_bytes(digest, 'big')
 
 
 class Phenny:
@@ -38,15 +49,20 @@ class BlackjackHooks:
     loss (-2), one normal win (+1) and one tie (0) will be handled as one normal loss (-1).
     """
 
-    def __init__(self, strat, betting, out=None):
+    def __init__(self, strat, betting, out=None, rng=random, uid=1):
         self.strat = strat
         self.betting = betting
+        self.random = rng
+        self.uid = uid
         self.end = False
         self.end_reason = 'N/A'
         self.output = out
         self.anti_fallacy = False
         self.af_trigger = False
         self.positive_prog = False
+        self.dealer_skips = 0
+        self.round_hands = 0
+        self.round_flags = 0
 
         self.reset_results()
 
@@ -76,8 +92,17 @@ class BlackjackHooks:
         """
         self.print("on_begin_game")
 
+        pl = bj.players[self.uid]
+        bet = self.next_bet(pl)
+        if bet is not None:
+            self.print("Phenny:", pl.place_bet(bet))
+
+    def next_bet(self, pl):
+        """
+        Asks the betting system for the next bet `pl` should place. Returns `None` and
+        flags the simulation to end if no bet can be placed.
+        """
         bet = self.betting.get_next_bet()
-        pl = player.players[1]
 
         if bet == 0:
             self.end_reason = "Infinite loop: zero gold bets."
@@ -91,13 +116,14 @@ class BlackjackHooks:
         if self.betting.end_reason is not None:
             self.end_reason = self.betting.end_reason
             self.end = True
-            return
+            return None
 
         if pl.gold < bet:
             self.end_reason = "Ran out of gold."
             self.end = True
-        else:
-            self.print("Phenny:", pl.place_bet(bet))
+            return None
+
+        return bet
 
     def reset_results(self):
         """
@@ -107,6 +133,8 @@ class BlackjackHooks:
         self.losses = 0
         self.ties = 0
         self.surrenders = 0
+        self.hands = 0
+        self.flags = 0
 
     def on_win(self, pl, nat=False):
         """
@@ -114,7 +142,11 @@ class BlackjackHooks:
         """
         if pl.did_doubledown:
             self.wins += 1
+            self.flags |= records.DOUBLE
+        if nat:
+            self.flags |= records.NATURAL
         self.wins += 1
+        self.hands += 1
 
     def on_loss(self, pl, surrender=False):
         """
@@ -122,21 +154,27 @@ class BlackjackHooks:
         """
         if pl.did_doubledown:
             self.losses += 1
+            self.flags |= records.DOUBLE
         self.losses += 1
         if surrender:
             self.surrenders += 1
+            self.flags |= records.SURRENDER
+        self.hands += 1
 
     def on_tie(self, pl):
         """
         Called when a hand is tied.
         """
+        if pl.did_doubledown:
+            self.flags |= records.DOUBLE
         self.ties += 1
+        self.hands += 1
 
     def on_start_turn(self, bj, uid):
         """
         Called when a player's turn starts and an action can be made.
         """
-        pid = player.players[uid].uid
+        pid = bj.players[uid].uid
         self.print("on_start_turn", uid, pid)
         self.choose_action(bj, uid)
 
@@ -147,13 +185,39 @@ class BlackjackHooks:
         self.print("on_hit")
         self.choose_action(bj, uid)
 
+    def on_skip_dealer(self, bj):
+        """
+        Called when every hand busted or surrendered during the turns, so the dealer
+        doesn't play out their hand.
+        """
+        self.print("on_skip_dealer")
+        self.dealer_skips += 1
+
     def on_game_over(self, bj):
         """
         Called when the game is over and all cards revealed.
         """
         self.print("on_game_over")
-        self.print("dealer:", player.players[0].hand)
+        self.print("dealer:", bj.players[0].hand)
+        self.settle()
+
+    def settle(self):
+        """
+        Reports the round's combined hand results to the betting system.
+        """
         res = self.wins - self.losses
+        self.round_hands = self.hands
+        self.round_flags = self.flags
+        if self.hands > 1:
+            self.round_flags |= records.SPLIT
+        self.reset_results()
+        self.settle_result(res)
+
+    def settle_result(self, res):
+        """
+        Reports a round's result `res`, hands won minus hands lost with doubledowns
+        counted twice, to the betting system.
+        """
         if self.positive_prog:
             res = -res
         self.print("res:", res)
@@ -167,7 +231,6 @@ class BlackjackHooks:
             self.af_trigger = False
         else:
             self.betting.on_tie()
-        self.reset_results()
 
     def choose_action(self, bj, uid):
         """
@@ -175,11 +238,12 @@ class BlackjackHooks:
         the selected strategy, and translates different actions to CasinoBot calls.
         """
         self.print("choose_action", uid)
-        pl = player.players[player.players[uid].uid]
-        bet = player.players[uid].bet
-        pid = player.players[uid].uid
-        hand = player.players[uid].hand
-        dealer = player.players[0].hand.cards[1].rank
+        players = bj.players
+        pl = players[players[uid].uid]
+        bet = players[uid].bet
+        pid = players[uid].uid
+        hand = players[uid].hand
+        dealer = players[0].hand.cards[1].index
 
         st = self.strat.get_strat(dealer, hand)
 
@@ -188,9 +252,10 @@ class BlackjackHooks:
         if st == 'P' and (not bj.accept_split or not self.betting.can_double()):
             st = self.strat.get_strat(dealer, hand, True)
 
-        self.print("Dealer:", bj.show_dealers_hand())
-        self.print("Hand:", hand)
-        self.print("Strat:", st)
+        if self.output is not None:
+            self.print("Dealer:", bj.show_dealers_hand())
+            self.print("Hand:", hand)
+            self.print("Strat:", st)
         if st == 'H':
             bj.hit(pid)
         elif st == 'S':
@@ -236,17 +301,20 @@ class BlackjackHooks:
                 actions.append(bj.split)
             if bj.accept_surrender:
                 actions.append(bj.surrender)
-            random.choice(actions)(pid)
+            self.random.choice(actions)(pid)
         else:
             raise RuntimeError("missing strategy '{0}'".format(st))
 
 
 class BlackjackSimulator:
     name = 'Sim'
+    uid = 1
 
     def __init__(self, strat, bet_system, out=None):
-        self.phenny = Phenny(self.print)
-        self.strat = strat
+        # Messages are only built when there's somewhere to print them
+        level = channel.NOTICE if out is not None else channel.QUIET
+        self.phenny = channel.Channel(Phenny(self.print), level)
+        self.strat = bet_system.wrap_strategy(strat)
         self.bet_system = bet_system
         self.output = out
 
@@ -255,15 +323,35 @@ class BlackjackSimulator:
         self.rounds = 0
         self.anti_fallacy = False
         self.positive_prog = False
+        self.round_writer = None
+        self.random = random.Random()
+        self.shoe = cards.Shoe(rng=self.random)
+        self.table = player.Table(self.shoe)
+        self.bet_system.set_shoe(self.shoe)
+
+        self.reset()
+
+    def new_player(self):
+        """
+        Seats a fresh player for the simulation at its own CasinoBot table.
+        """
+        return self.table.add_player(self.uid, self.name)
 
+    def join_table(self, table, uid, rng):
+        """
+        Plays as seat `uid` of a `seats.TableSimulator`: seats the player at the CasinoBot
+        table `table`, dealing from its shoe with the table's random stream `rng`.
+        """
+        self.table = table
+        self.uid = uid
+        self.name = "Seat {0}".format(uid)
+        self.random = rng
+        self.set_shoe(table.shoe)
         self.reset()
 
     def reset(self):
-        if 1 in player.players:
-            player.remove_player(1)
-        player.add_player(1, self.name)
-        self.player = player.players[1]
-        self.hooks = BlackjackHooks(self.strat, self.bet_system, self.output)
+        self.player = self.new_player()
+        self.hooks = BlackjackHooks(self.strat, self.bet_system, self.output, self.random, self.uid)
         self.hooks.set_anti_fallacy(self.anti_fallacy)
         self.hooks.set_positive_prog(self.positive_prog)
         self.player.hooks = self.hooks
@@ -293,35 +381,121 @@ class BlackjackSimulator:
     def set_target_gold(self, target):
         self.target_gold = target
 
+    def set_shoe(self, shoe):
+        """
+        Sets the `casinobot.cards.Shoe` the rounds are dealt from. The shoe is shuffled
+        with the simulator's own random stream, and handed to the betting system for
+        the systems that count cards.
+        """
+        shoe.random = self.random
+        self.shoe = shoe
+        self.table.shoe = shoe
+        self.bet_system.set_shoe(shoe)
+
+    def set_seed(self, seed):
+        """
+        Re-seeds the simulator's random stream, `None` seeds it from the OS. The shoe is
+        put back in order, so everything after this plays out the same for the same seed.
+        Call before `reset()` to start a reproducible iteration.
+        """
+        self.random.seed(seed)
+        self.shoe.reset()
+
+    def set_round_writer(self, writer):
+        """
+        Records every round played to the `records.RoundWriter` `writer`, `None` stops
+        recording them.
+        """
+        self.round_writer = writer
+
     def print(self, *args):
         if self.output is not None:
             self.output(*args)
 
-    def run(self, rounds):
-        end_reason = "N/A"
+    def play_round(self):
+        """
+        Plays a single round of blackjack.
+        """
+        blackjack.Game(self.phenny, 1, self.name, self.hooks, table=self.table)
 
+    def run(self, rounds, iteration=0):
+        """
+        Plays rounds until the round limit `rounds` or another end condition is reached.
+        Rounds are recorded as played in iteration `iteration` if there's a round writer.
+        """
+        writer = self.round_writer
+        gold = self.player.gold
+        trajectory = self.begin_run(rounds)
         curr_round = 0
         while True:
-            bj = blackjack.Game(self.phenny, 1, self.name, self.hooks)
-            del bj
+            self.play_round()
+            if writer is not None:
+                hooks = self.hooks
+                writer.add(iteration, curr_round, self.player.gold - gold, self.player.gold,
+                           hooks.round_hands, hooks.round_flags)
+                gold = self.player.gold
             curr_round += 1
+            end_reason = self.end_round(curr_round, trajectory)
             if rounds > 0 and curr_round >= rounds:
                 end_reason = "Finished rounds."
+            if end_reason is not None:
                 break
-            if self.starting_gold > 0:
-                if self.player.gold > self.stats.gold_max:
-                    self.stats.gold_max = self.player.gold
-                if self.player.gold < self.stats.gold_min:
-                    self.stats.gold_min = self.player.gold
-                if self.target_gold > 0 and self.player.gold >= self.target_gold:
-                    end_reason = 'Reached target gold.'
-                    break
-            if self.hooks.end:
-                end_reason = self.hooks.end_reason
-                break
 
-        # Update stats
+        if writer is not None:
+            writer.flush()
+        return self.end_run(end_reason, curr_round, trajectory)
+
+    def begin_run(self, rounds):
+        """
+        Starts tracking a run of up to `rounds` rounds, returns the `stats.Trajectory`
+        its gold is sampled to.
+        """
+        trajectory = stats.Trajectory(stats.TRAJECTORY_POINTS, max(1, rounds // stats.TRAJECTORY_POINTS))
+        trajectory.add(self.player.gold)
+        return trajectory
 
+    def end_round(self, curr_round, trajectory):
+        """
+        Tracks the gold after `curr_round` rounds. Returns the reason the run ends after
+        the round, or `None` if it goes on.
+        """
+        if self.starting_gold > 0:
+            gold = self.player.gold
+            st = self.stats
+            if gold > st.gold_max:
+                st.gold_max = gold
+                st.peak_round = curr_round
+            elif st.gold_max - gold > st.max_drawdown:
+                st.max_drawdown = st.gold_max - gold
+            if gold < st.gold_min:
+                st.gold_min = gold
+            if curr_round == trajectory.next:
+                trajectory.add(gold)
+            if self.target_gold > 0 and gold >= self.target_gold:
+                return 'Reached target gold.'
+        if self.hooks.end:
+            return self.hooks.end_reason
+        return None
+
+    def end_run(self, end_reason, curr_round, trajectory):
+        """
+        Finishes the stats of a run that ended with `end_reason` after `curr_round`
+        rounds. Returns the end reason and the stats.
+        """
+        self.update_stats()
+        if self.starting_gold > 0:
+            if end_reason == "Ran out of gold.":
+                # Nothing was bet on the last round
+                self.stats.ruin_round = curr_round - 1
+            trajectory.end(curr_round, self.player.gold)
+            self.stats.end_iteration(self.random.random(), trajectory)
+
+        return (end_reason, self.stats)
+
+    def update_stats(self):
+        """
+        Copies the player's end-of-run counters into `self.stats`.
+        """
         self.stats.gold_end = self.player.gold
 
         total = self.player.wins + self.player.losses + \
@@ -337,5 +511,4 @@ class BlackjackSimulator:
         self.stats.loss_streak = self.player.losing_streak_max
         self.stats.tie_streak = self.player.tie_streak_max
         self.stats.surrender_streak = self.player.surrender_streak_max
-
-        return (end_reason, self.stats)
+        self.stats.dealer_skips = self.hooks.dealer_skips
@@ -1,3 +1,6 @@
+import heapq
+import math
+
 # What to output when `BlackjackStats.print()` is called
 OUTPUT_CONFIG = [
     #("Ending gold",     {"attr": "gold_end",    "gold": True}),
@@ -18,8 +21,22 @@ OUTPUT_CONFIG = [
     ("Loss streak",     {"attr": "loss_streak"}),
     ("Tie streak",      {"attr": "tie_streak"}),
     ("Surrender streak", {"attr": "surrender_streak"}),
+    ("", {}),
+    ("Dealer skips",    {"attr": "dealer_skips"}),
+]
+
+# Distributions over iterations printed after the rest, only for runs with gold
+RISK_OUTPUT_CONFIG = [
+    ("Max drawdown",    "drawdowns"),
+    ("Rounds to peak",  "peak_rounds"),
+    ("Rounds to ruin",  "ruin_rounds"),
 ]
 
+# Iterations whose bankroll trajectories are sampled, and roughly how many points each
+# trajectory is kept at
+TRAJECTORIES = 100
+TRAJECTORY_POINTS = 100
+
 
 class BlackjackStats:
     gold_start = 0
@@ -42,6 +59,34 @@ class BlackjackStats:
     tie_streak = 0
     surrender_streak = 0
 
+    # Rounds every hand busted or surrendered in, without the dealer drawing
+    dealer_skips = 0
+
+    # Largest drop from the highest gold to a later low, the round the highest gold was
+    # first reached in and the rounds bet on before running out of gold (`None` if the
+    # player didn't)
+    max_drawdown = 0
+    peak_round = 0
+    ruin_round = None
+
+    def __init__(self):
+        # Distributions of the above over iterations, and a sample of their trajectories
+        self.drawdowns = RunningStats()
+        self.peak_rounds = RunningStats()
+        self.ruin_rounds = RunningStats()
+        self.trajectories = Reservoir(TRAJECTORIES)
+
+    def end_iteration(self, key, trajectory):
+        """
+        Adds the iteration's risk stats to the distributions, and its `Trajectory` to the
+        sample with the random sort key `key`.
+        """
+        self.drawdowns.add_value(self.max_drawdown)
+        self.peak_rounds.add_value(self.peak_round)
+        if self.ruin_round is not None:
+            self.ruin_rounds.add_value(self.ruin_round)
+        self.trajectories.add_value(key, (trajectory.step, trajectory.gold, trajectory.last))
+
     def add(self, other):
         self.gold_max = max(self.gold_max, other.gold_max)
         self.gold_min = min(self.gold_min, other.gold_min)
@@ -59,6 +104,13 @@ class BlackjackStats:
         self.tie_streak = max(self.tie_streak, other.tie_streak)
         self.surrender_streak = max(
             self.surrender_streak, other.surrender_streak)
+        self.dealer_skips += other.dealer_skips
+
+        self.max_drawdown = max(self.max_drawdown, other.max_drawdown)
+        self.drawdowns.add(other.drawdowns)
+        self.peak_rounds.add(other.peak_rounds)
+        self.ruin_rounds.add(other.ruin_rounds)
+        self.trajectories.add(other.trajectories)
 
     def print(self, print_fn=print):
         for (name, stat) in OUTPUT_CONFIG:
@@ -77,3 +129,246 @@ class BlackjackStats:
             if "percentage" in stat:
                 print_fn(" ({:>6.2%})".format(attr/self.total_hands), end='')
             print_fn()
+
+        if self.gold_start == 0 or self.drawdowns.count == 0:
+            return
+        # Averages over iterations, with the 95th percentile
+        print_fn()
+        for (name, attr) in RISK_OUTPUT_CONFIG:
+            st = getattr(self, attr)
+            if st.count == 0:
+                continue
+            print_fn("{:.<16}{:.>20,.2f} (95%: {:,.2f})".format(name, st.mean, st.quantile(0.95)), end='')
+            if st is self.ruin_rounds:
+                print_fn(" in {:.2%} of iterations".format(st.count / self.drawdowns.count), end='')
+            print_fn()
+
+    def write_trajectories(self, file):
+        """
+        Writes the sampled trajectories to `file` as CSV, a row per point: the sample,
+        the round and the gold after it. Each ends with the gold after the last round.
+        """
+        with open(file, 'w') as f:
+            f.write("sample,round,gold\n")
+            for (i, (step, gold, last)) in enumerate(self.trajectories.items()):
+                for (j, value) in enumerate(gold):
+                    f.write("{0},{1},{2}\n".format(i, j * step, value))
+                if last is not None and last[0] > (len(gold) - 1) * step:
+                    f.write("{0},{1},{2}\n".format(i, last[0], last[1]))
+
+
+class Trajectory:
+    """
+    Gold after every `step` rounds of an iteration, starting with round 0. When it gets
+    to twice `points` points, every other one is dropped and the step doubled, so
+    iterations of any length are kept at `points` to twice as many points. The last
+    round of the iteration is kept with its number in `last`, as it's rarely on the grid.
+    """
+
+    def __init__(self, points, step=1):
+        self.points = points
+        self.step = step
+        self.gold = []
+        self.next = 0
+        self.last = None
+
+    def add(self, gold):
+        """
+        Adds the gold after round `next`.
+        """
+        self.gold.append(gold)
+        if len(self.gold) >= 2 * self.points:
+            self.gold = self.gold[::2]
+            self.step *= 2
+        self.next = len(self.gold) * self.step
+
+    def end(self, curr_round, gold):
+        """
+        Records the gold after the last round, `curr_round`.
+        """
+        self.last = (curr_round, gold)
+
+
+class Reservoir:
+    """
+    A uniform sample of up to `size` items from a stream: each item is added with a
+    random sort key, and the items with the lowest keys are kept (bottom-k sampling).
+    Samples taken in different processes are combined with `add`, and the result
+    doesn't depend on how the stream was split between them.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.count = 0
+        self.sample = []
+
+    def add_value(self, key, item):
+        self.count += 1
+        self.sample.append((key, item))
+        if len(self.sample) > 2 * self.size:
+            self.sample = heapq.nsmallest(self.size, self.sample, key=lambda entry: entry[0])
+
+    def add(self, other):
+        self.count += other.count
+        self.sample = heapq.nsmallest(self.size, self.sample + other.sample, key=lambda entry: entry[0])
+
+    def items(self):
+        return [item for (_, item) in sorted(self.sample, key=lambda entry: entry[0])[:self.size]]
+
+
+class TDigest:
+    """
+    Mergeable quantile estimates in constant memory (a merging t-digest). Values are
+    summarized as up to about `compression` centroids, the mean and count of
+    neighbouring values, kept smallest at the tails. Quantiles are interpolated
+    between the centroids, so they're accurate for the spread of the values rather than
+    their size and always lie between the smallest and largest value added. Merging
+    digests combines their centroids.
+    """
+
+    def __init__(self, compression=200):
+        self.compression = compression
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        # (mean, count) in order of the means, and values added since the last compress
+        self.centroids = []
+        self.buffer = []
+
+    def add_value(self, value):
+        self.count += 1
+        self.buffer.append(value)
+        if len(self.buffer) >= 5 * self.compression:
+            self.compress()
+
+    def add(self, other):
+        if other.count == 0:
+            return
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.centroids += other.centroids
+        self.buffer += other.buffer
+        self.compress()
+
+    def compress(self):
+        """
+        Merges the buffered values into the centroids. A centroid may grow as long as it
+        spans at most one unit of the arcsine scale function, which keeps the centroids
+        at the extreme quantiles small.
+        """
+        if self.buffer:
+            self.min = min(self.min, min(self.buffer))
+            self.max = max(self.max, max(self.buffer))
+        items = sorted(self.centroids + [(value, 1) for value in self.buffer])
+        self.buffer = []
+        if not items:
+            return
+
+        total = self.count
+        scale = self.compression / (2 * math.pi)
+
+        def limit(q):
+            # The quantile one unit of the scale function above `q`
+            k = scale * math.asin(2 * q - 1) + 1
+            return 1.0 if k >= scale * math.pi / 2 else (math.sin(k / scale) + 1) / 2
+
+        centroids = []
+        (mean, n) = items[0]
+        seen = 0
+        q_limit = limit(0)
+        for (value, count) in items[1:]:
+            if (seen + n + count) / total <= q_limit:
+                n += count
+                mean += (value - mean) * count / n
+            else:
+                centroids.append((mean, n))
+                seen += n
+                q_limit = limit(seen / total)
+                (mean, n) = (value, count)
+        centroids.append((mean, n))
+        self.centroids = centroids
+
+    def quantile(self, q):
+        """
+        Returns the estimated `q` (0-1) quantile, or NaN if nothing was added.
+        """
+        if self.count == 0:
+            return math.nan
+        if self.buffer or len(self.centroids) > self.compression:
+            self.compress()
+
+        # Each centroid is centred at the middle of its count, the smallest and largest
+        # values are at the very ends
+        rank = q * self.count
+        (prev_mean, prev_rank) = (self.min, 0)
+        seen = 0
+        for (mean, n) in self.centroids:
+            centre = seen + n / 2
+            if rank < centre:
+                if centre == prev_rank:
+                    return mean
+                return prev_mean + (mean - prev_mean) * (rank - prev_rank) / (centre - prev_rank)
+            (prev_mean, prev_rank) = (mean, centre)
+            seen += n
+        if self.count == prev_rank:
+            return self.max
+        return prev_mean + (self.max - prev_mean) * (rank - prev_rank) / (self.count - prev_rank)
+
+
+class RunningStats:
+    """
+    Count, mean and variance (Welford's algorithm), min, max and quantiles of a stream
+    of values, kept in constant memory. Stats collected in different processes are
+    combined with `add`.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.sketch = TDigest()
+
+    def add_value(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self.sketch.add_value(value)
+
+    def add(self, other):
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.sketch.add(other.sketch)
+
+    def variance(self):
+        if self.count < 2:
+            return 0.0
+        return self.m2 / (self.count - 1)
+
+    def stdev(self):
+        return math.sqrt(self.variance())
+
+    def confidence(self, z=1.96):
+        """
+        Half-width of the confidence interval of the mean, 95% by default.
+        """
+        if self.count == 0:
+            return math.nan
+        return z * self.stdev() / math.sqrt(self.count)
+
+    def quantile(self, q):
+        if self.count == 0:
+            return math.nan
+        return min(max(self.sketch.quantile(q), self.min), self.max)
@@ -1,43 +1,125 @@
+from casinobot import cards
 from casinobot.blackjack import hand_value
 
+RANK_COUNT = len(cards.RANKS)
+
+# Sizes the value lookups past any hand a strategy can be asked about
+MAX_VALUE = 31
+
+# Hands of three or more cards that can be dealt without reaching 21 (2,2,2 .. 20)
+MULTI_CARD_VALUES = range(6, 21)
+
 
 class BlackjackStrategy:
     def __init__(self, strat_table, out=None):
         self.strat_table = strat_table
         self.output = out
+        self.compile()
 
     def print(self, *args):
         if self.output is not None:
             self.output(*args)
 
     def get_strat(self, dealer, hand, force_value=False):
-        dealer = self.get_blackjack_rank(dealer)
-        val = str(hand_value(hand))
-
-        if force_value:
-            if val not in self.strat_table[dealer]:
-                print("Max splits and no backup entry in strat table, standing!")
-                print("Hand value:", val)
-                print("Cards:", self.get_card_combo(hand))
-                return 'S'
-            return self.strat_table[dealer][val]
-
-        thing = self.get_pair_hand(hand) or self.get_ace_hand(
-            hand) or self.get_card_combo(hand)
-
-        if thing not in self.strat_table[dealer]:
-            thing = val
-
-        if thing not in self.strat_table[dealer]:
-            print("No entry in strat table, standing!")
-            print("Hand value:", val)
-            print("Cards:", self.get_card_combo(hand))
-            return 'S'
+        """
+        Picks the action for `hand` against the dealer's upcard, given as its rank index
+        (`Card.index`). With `force_value`, two-card hands are looked up by value only.
+        """
+        held = hand.cards
+        if len(held) == 2 and not force_value:
+            return self.two_card[dealer][held[0].index * RANK_COUNT + held[1].index]
+        return self.by_value[dealer][hand.total]
 
-        self.print("hand value:", val)
-        self.print("hand in strat table:", thing)
+    def compile(self):
+        """
+        Flattens `strat_table` into lists indexed by the dealer's upcard rank index:
+        `two_card[dealer][first * 13 + second]` for two-card hands and
+        `by_value[dealer][value]` for the rest, with the pair -> ace -> combo -> total
+        fallbacks already resolved.
+
+        Entries a hand can reach but the table is missing stand, and are reported to the
+        strategy's output along with the rows no hand can ever reach. Rows only naturals
+        reach, like "A,10", aren't reported, as naturals are paid out before they're
+        played.
+        """
+        columns = {}
+        missing = {}
+        used = set()
+        naturals = set()
+        # Aces last, in the same order as the table headers
+        for rank in cards.RANKS[1:] + cards.RANKS[:1]:
+            column = self.get_blackjack_rank(rank)
+            if column not in columns:
+                columns[column] = self.compile_column(column, missing, used, naturals)
+
+        self.two_card = [columns[self.get_blackjack_rank(rank)][0] for rank in cards.RANKS]
+        self.by_value = [columns[self.get_blackjack_rank(rank)][1] for rank in cards.RANKS]
+
+        for row, dealer in sorted(missing.items(), key=lambda item: int(item[0])):
+            self.print("No entry in strat table for {0} against {1}, standing!".format(
+                row, " ".join(dealer)))
+
+        rows = set()
+        for entries in self.strat_table.values():
+            rows.update(entries)
+        unused = [row for row in rows if row not in used and row not in naturals]
+        if unused:
+            self.print("Unused rows in strat table:", " ".join(sorted(unused)))
+
+    def compile_column(self, column, missing, used, naturals):
+        """
+        Compiles the entries against a single dealer's upcard. Records missing entries
+        in `missing` (row -> columns), every row a hand looks up in `used` and the rows
+        naturals would be looked up by in `naturals`.
+        """
+        entries = self.strat_table.get(column, {})
+        two_card = ['S'] * (RANK_COUNT * RANK_COUNT)
+        by_value = [entries.get(str(value)) for value in range(MAX_VALUE + 1)]
+        needed = set(MULTI_CARD_VALUES)
+
+        for first in range(RANK_COUNT):
+            for second in range(RANK_COUNT):
+                hand = cards.BlackjackHand()
+                hand.add_card(cards.CARDS[first])
+                hand.add_card(cards.CARDS[second])
+                value = hand.total
+                if hand.is_natural:
+                    # Naturals are paid out before anyone gets to pick an action
+                    naturals.add(self.find_row(entries, hand))
+                    continue
+
+                row = self.find_row(entries, hand)
+                if row == str(value):
+                    needed.add(value)
+                st = entries.get(row)
+                if st is None:
+                    continue
+                if st == 'P':
+                    # Looked up again by value when the hand can't be split
+                    needed.add(value)
+                used.add(row)
+                two_card[first * RANK_COUNT + second] = st
+
+        for value in needed:
+            if by_value[value] is None:
+                missing.setdefault(str(value), []).append(column)
+            else:
+                used.add(str(value))
+        by_value = [st or 'S' for st in by_value]
+
+        return two_card, by_value
 
-        return self.strat_table[dealer][thing]
+    @staticmethod
+    def find_row(entries, hand):
+        """
+        Returns the row of `entries` (a single dealer column) a two-card `hand` is played
+        by, falling back from its pair, ace and combo rows to its value.
+        """
+        row = BlackjackStrategy.get_pair_hand(hand) or BlackjackStrategy.get_ace_hand(
+            hand) or BlackjackStrategy.get_card_combo(hand)
+        if row not in entries:
+            row = str(hand_value(hand))
+        return row
 
     @staticmethod
     def from_file(file, out=None):
@@ -48,6 +130,8 @@ class BlackjackStrategy:
         First row is a header with with dealer's visible card as column names.
         First column contains the player's card value, card combinations, ace-card combinations and pairs.
         See folder `strats/` for examples.
+
+        Two-card combinations are matched with their ranks sorted as strings ("10,2", "5,J").
         """
         strat = {}
         with open(file, 'r') as f:
@@ -0,0 +1,484 @@
+import math
+from array import array
+
+import numpy as np
+
+import casinobot.cards as c
+from casinobot import player
+from simulator import betting, records, stats
+from simulator.engine import FastGame, FastHand, FastBlackjackSimulator
+from simulator.simulator import BlackjackHooks
+
+# Strategy table entries as lookup codes
+HIT = 0
+STAND = 1
+DOUBLE_HIT = 2
+DOUBLE_STAND = 3
+SURRENDER_HIT = 4
+SURRENDER_STAND = 5
+SPLIT = 6
+HIT_ONCE = 7
+RANDOM = 8
+
+ACTION_CODES = {
+    'H': HIT, 'S': STAND,
+    'D': DOUBLE_HIT, 'Dh': DOUBLE_HIT, 'Ds': DOUBLE_STAND,
+    'R': SURRENDER_HIT, 'Rh': SURRENDER_HIT, 'Rs': SURRENDER_STAND,
+    'P': SPLIT, 'H*': HIT_ONCE, '?': RANDOM,
+}
+
+# Whether a code hits once doubling down and surrendering are no longer allowed
+HITS_LATER = np.array([True, False, True, False, True, False, False, False, False])
+
+# Hand outcomes
+WIN = 0
+NAT_WIN = 1
+LOSS = 2
+NAT_LOSS = 3
+TIE = 4
+SURRENDER = 5
+
+RANK_VALUES = np.array(c.RANK_VALUES, dtype=np.int16)
+
+
+def hand_values(total, soft):
+    """
+    Blackjack values of hands from their hard totals and whether they hold an ace.
+    """
+    return np.where(soft & (total <= 11), total + 10, total)
+
+
+def max_run(mask, carry=0):
+    """
+    Returns the longest run of `True`s in `mask` when `carry` `True`s precede it, and
+    the length of the run at its end.
+    """
+    breaks = np.flatnonzero(~mask)
+    if breaks.size == 0:
+        run = carry + mask.size
+        return run, run
+    last = mask.size - 1 - breaks[-1]
+    longest = max(carry + breaks[0], last)
+    if breaks.size > 1:
+        longest = max(longest, np.diff(breaks).max() - 1)
+    return longest, last
+
+
+class StrategyTable:
+    """
+    A `BlackjackStrategy` flattened into lookup arrays: `two_card[upcard, rank, rank]`
+    for the first decision on a hand and `by_value[upcard, value]` for the rest, all
+    indexed by rank index.
+    """
+
+    def __init__(self, strat):
+        ranks = len(c.RANKS)
+        self.two_card = np.empty((ranks, ranks, ranks), dtype=np.int8)
+        self.by_value = np.empty((ranks, len(strat.by_value[0])), dtype=np.int8)
+
+        for up in range(ranks):
+            for first in range(ranks):
+                for second in range(ranks):
+                    self.two_card[up, first, second] = self.code(
+                        strat.two_card[up][first * ranks + second])
+            for value, st in enumerate(strat.by_value[up]):
+                self.by_value[up, value] = self.code(st)
+
+    @staticmethod
+    def code(st):
+        if st not in ACTION_CODES:
+            raise RuntimeError("missing strategy '{0}'".format(st))
+        return ACTION_CODES[st]
+
+
+class ReplayGame(FastGame):
+    """
+    Replays a single round from fixed cards with the scalar engine, recording each
+    hand's outcome and bet multiplier instead of paying it out. Used for the rounds
+    that split, which the vectorized engine doesn't play itself.
+    """
+
+    def __init__(self, strat, bet_system, rng):
+        pl = player.Player(1, 'Replay')
+        pl.gold = math.inf
+        hooks = BlackjackHooks(strat, bet_system, rng=rng)
+        FastGame.__init__(self, pl, strat, hooks, c.CompactDeck())
+        self.outcomes = []
+        self.dealer_skipped = False
+
+    def win(self, hand, natural=False):
+        self.outcomes.append((NAT_WIN if natural else WIN, hand.bet))
+
+    def lose(self, hand):
+        self.outcomes.append((LOSS, hand.bet))
+
+    def tie(self, hand):
+        self.outcomes.append((TIE, hand.bet))
+
+    def surrender(self, hand):
+        self.outcomes.append((SURRENDER, hand.bet))
+
+    def replay(self, cards):
+        # Compact codes below 13 are the hearts, so rank indices work as card codes
+        self.shoe.cards = array('B', cards)
+        self.shoe.pos = 0
+        self.outcomes = []
+
+        hand = FastHand(1)
+        dealer = FastHand(0)
+        for _ in range(2):
+            hand.add_card(self.shoe.deal_card())
+            dealer.add_card(self.shoe.deal_card())
+        self.dealer_skipped = not self.play_hands(hand, dealer)
+        if not self.dealer_skipped:
+            self.dealer_play(dealer)
+
+        return self.outcomes
+
+
+class VectorizedBlackjackSimulator(FastBlackjackSimulator):
+    """
+    Monte Carlo engine for flat betting (`SimpleBetting` and `NoBetting`) that plays
+    batches of independent rounds at once with NumPy.
+
+    Every round is dealt from a freshly shuffled shoe. The player's hands and the
+    dealer are played out with the strategy compiled into lookup arrays, and the rounds
+    that split are replayed with the scalar engine. The resulting per-hand outcomes feed
+    the stats, and a cumulative sum of the round results gives the bankroll trajectory
+    for target and ruin detection. Doubling down and splitting are always assumed to be
+    affordable, so results may differ slightly for rounds played within a couple of bets
+    of ruin. With `NoBetting`, hands are counted but no gold changes hands, and the
+    simulation only ends when the round limit is reached. Without a round limit it ends
+    after the first round, like the other engines do.
+    """
+
+    batch_size = 1 << 16
+
+    def __init__(self, strat, bet_system, out=None):
+        if not isinstance(bet_system, (betting.SimpleBetting, betting.NoBetting)):
+            raise ValueError("The vectorized engine only supports flat betting")
+        self.strat_table = StrategyTable(strat)
+        FastBlackjackSimulator.__init__(self, strat, bet_system, out)
+
+    def set_shoe(self, shoe):
+        if shoe.cut > 0:
+            raise ValueError("The vectorized engine reshuffles every round, penetration must be 0")
+        FastBlackjackSimulator.set_shoe(self, shoe)
+
+    def set_anti_fallacy(self, enable):
+        if enable:
+            raise ValueError("The vectorized engine doesn't support the anti-fallacy strat")
+        FastBlackjackSimulator.set_anti_fallacy(self, enable)
+
+    def reset(self):
+        FastBlackjackSimulator.reset(self)
+        self.replayer = ReplayGame(self.strat, self.bet_system, self.random)
+        self.rng = np.random.default_rng(self.random.getrandbits(64))
+
+        # Streak state carried between batches
+        self.streaks = {"win": 0, "loss": 0, "tie": 0, "surrender": 0}
+
+    def new_cards(self, n):
+        """
+        Returns `n` unshuffled shoes, one per row, as rank indices. Cards are shuffled
+        into place as they're drawn by `draw`.
+        """
+        deck = np.arange(len(c.RANKS), dtype=np.uint8)
+        return np.tile(deck, (n, len(c.SUITS) * self.shoe.decks))
+
+    def draw(self, cards, pos, rows):
+        """
+        Draws the next card for each of `rows`, swapping a random card from the rest of
+        the shoe into place (a lazy Fisher-Yates shuffle).
+        """
+        j = pos[rows]
+        k = self.rng.integers(j, cards.shape[1])
+        card = cards[rows, k]
+        cards[rows, k] = cards[rows, j]
+        cards[rows, j] = card
+        pos[rows] = j + 1
+        return card
+
+    def play_batch(self, n):
+        """
+        Plays `n` rounds. Returns the outcome and bet multiplier of every round's hand,
+        a dict of split rounds to their lists of (outcome, multiplier) hands, and which
+        rounds ended without the dealer playing because every hand busted or
+        surrendered.
+        """
+        table = self.strat_table
+        rng = self.rng
+        cards = self.new_cards(n)
+        pos = np.zeros(n, dtype=np.intp)
+        rows = np.arange(n)
+
+        # Deal the player's and the dealer's cards in turn, the dealer's second card is
+        # the visible one
+        first = self.draw(cards, pos, rows)
+        hole = self.draw(cards, pos, rows)
+        second = self.draw(cards, pos, rows)
+        up = self.draw(cards, pos, rows)
+
+        total = RANK_VALUES[first] + RANK_VALUES[second]
+        soft = (first == c.ACE) | (second == c.ACE)
+        dealer_total = RANK_VALUES[hole] + RANK_VALUES[up]
+        dealer_soft = (hole == c.ACE) | (up == c.ACE)
+
+        outcome = np.full(n, -1, dtype=np.int8)
+        multiplier = np.ones(n, dtype=np.int8)
+
+        # Check for naturals (an immediate blackjack)
+        natural = hand_values(total, soft) == 21
+        dealer_natural = hand_values(dealer_total, dealer_soft) == 21
+        outcome[natural & dealer_natural] = TIE
+        outcome[natural & ~dealer_natural] = NAT_WIN
+        outcome[~natural & dealer_natural] = NAT_LOSS
+        live = outcome < 0
+
+        # First decision, with every action still allowed
+        act = table.two_card[up, first, second]
+        value = hand_values(total, soft)
+        can_double = (value >= 9) & (value <= 11)
+
+        # Rounds that might split are played by the scalar engine
+        split = live & ((act == SPLIT) | ((act == RANDOM) & (first == second)))
+        live &= ~split
+
+        # Pick randomly between standing, hitting, doubling down and surrendering
+        rand = live & (act == RANDOM)
+        choices = 3 + can_double[rand]
+        picks = (rng.random(choices.size) * choices).astype(np.int8)
+        picks[(picks == 2) & (choices == 3)] = 3
+        act[rand] = np.array([STAND, HIT, DOUBLE_HIT, SURRENDER_HIT], dtype=np.int8)[picks]
+
+        surrender = live & ((act == SURRENDER_HIT) | (act == SURRENDER_STAND))
+        outcome[surrender] = SURRENDER
+
+        double = live & ((act == DOUBLE_HIT) | (act == DOUBLE_STAND)) & can_double
+        multiplier[double] = 2
+        double_rows = np.flatnonzero(double)
+        card = self.draw(cards, pos, double_rows)
+        total[double_rows] += RANK_VALUES[card]
+        soft[double_rows] |= card == c.ACE
+
+        hit = live & ~surrender & ~double & (
+            (act == HIT) | (act == DOUBLE_HIT) | (act == HIT_ONCE))
+        hitting = np.flatnonzero(hit)
+        while hitting.size:
+            card = self.draw(cards, pos, hitting)
+            total[hitting] += RANK_VALUES[card]
+            soft[hitting] |= card == c.ACE
+            value = hand_values(total[hitting], soft[hitting])
+            # Busted hands are settled below, and 21 stands
+            hitting = hitting[value < 21]
+            act = table.by_value[up[hitting], value[value < 21]]
+            if (act == SPLIT).any():
+                raise RuntimeError("Unable to split for some reason")
+            again = HITS_LATER[act]
+            rand = act == RANDOM
+            again[rand] = rng.random(rand.sum()) < 0.5
+            hitting = hitting[again]
+
+        value = hand_values(total, soft)
+        bust = live & (outcome < 0) & (value > 21)
+        outcome[bust] = LOSS
+
+        # Dealer plays out their hand against the remaining hands
+        standing = live & (outcome < 0)
+        drawing = np.flatnonzero(standing)
+        while True:
+            drawing = drawing[hand_values(dealer_total[drawing], dealer_soft[drawing]) < 17]
+            if not drawing.size:
+                break
+            card = self.draw(cards, pos, drawing)
+            dealer_total[drawing] += RANK_VALUES[card]
+            dealer_soft[drawing] |= card == c.ACE
+
+        dealer_value = hand_values(dealer_total, dealer_soft)
+        won = standing & ((dealer_value > 21) | (value > dealer_value))
+        tied = standing & ~won & (value == dealer_value)
+        outcome[won] = WIN
+        outcome[tied] = TIE
+        outcome[standing & ~won & ~tied] = LOSS
+
+        skipped = live & ~standing
+        split_rounds = {}
+        for r in np.flatnonzero(split):
+            # Only the first four cards have been shuffled into place
+            rng.shuffle(cards[r, 4:])
+            split_rounds[r] = self.replayer.replay(cards[r].tolist())
+            skipped[r] = self.replayer.dealer_skipped
+
+        return outcome, multiplier, split_rounds, skipped
+
+    def gold_deltas(self, outcome, multiplier, bet):
+        """
+        Gold won or lost by hands with the given outcomes when betting `bet`.
+        """
+        stake = multiplier.astype(np.int64) * bet
+        delta = np.zeros(outcome.size, dtype=np.int64)
+        delta[outcome == WIN] = stake[outcome == WIN]
+        delta[outcome == NAT_WIN] = (stake[outcome == NAT_WIN] * 5) // 2 - stake[outcome == NAT_WIN]
+        lost = (outcome == LOSS) | (outcome == NAT_LOSS)
+        delta[lost] = -stake[lost]
+        surrender = outcome == SURRENDER
+        delta[surrender] = stake[surrender] // 2 - stake[surrender]
+        return delta
+
+    def add_hands(self, hands):
+        """
+        Adds a sequence of hand outcomes, in the order they were settled, to the stats.
+        """
+        st = self.stats
+        wins = np.count_nonzero((hands == WIN) | (hands == NAT_WIN))
+        losses = np.count_nonzero((hands == LOSS) | (hands == NAT_LOSS))
+        ties = np.count_nonzero(hands == TIE)
+        surrenders = np.count_nonzero(hands == SURRENDER)
+        st.wins += wins
+        st.losses += losses
+        st.ties += ties
+        st.surrenders += surrenders
+        st.nat_wins += np.count_nonzero(hands == NAT_WIN)
+        st.nat_losses += np.count_nonzero(hands == NAT_LOSS)
+        st.total_hands += wins + losses + ties + surrenders
+
+        # Ties only break tie streaks, everything else is counted without them
+        streaks = self.streaks
+        longest, streaks["tie"] = max_run(hands == TIE, streaks["tie"])
+        st.tie_streak = max(st.tie_streak, longest)
+
+        decided = hands[hands != TIE]
+        won = (decided == WIN) | (decided == NAT_WIN)
+        for name, mask in (("win", won),
+                           ("loss", ~won),
+                           ("surrender", decided == SURRENDER)):
+            longest, streaks[name] = max_run(mask, streaks[name])
+            attr = name + "_streak"
+            setattr(st, attr, max(getattr(st, attr), longest))
+
+    def track_risk(self, first, gold, trajectory):
+        """
+        Updates the drawdown, the peak and the `trajectory` with the gold after each of
+        the rounds following round `first`.
+        """
+        st = self.stats
+        peaks = np.maximum.accumulate(np.concatenate(([st.gold_max], gold)))[1:]
+        st.max_drawdown = max(st.max_drawdown, int((peaks - gold).max()))
+        highest = int(gold.max())
+        if highest > st.gold_max:
+            st.peak_round = first + 1 + int(np.argmax(gold))
+        while trajectory.next <= first + gold.size:
+            trajectory.add(int(gold[trajectory.next - first - 1]))
+
+    def write_rounds(self, iteration, first, outcome, multiplier, split_rounds, gold, deltas):
+        """
+        Records a batch of rounds numbered from `first` to the round writer, starting
+        from `gold`.
+        """
+        batch = np.zeros(outcome.size, dtype=records.DTYPE)
+        batch['iteration'] = iteration
+        batch['round'] = np.arange(first, first + outcome.size)
+        batch['net'] = deltas
+        batch['gold'] = gold + np.cumsum(deltas)
+        hands = np.ones(outcome.size, dtype=np.uint8)
+        flags = np.zeros(outcome.size, dtype=np.uint8)
+        flags[outcome == NAT_WIN] |= records.NATURAL
+        flags[outcome == SURRENDER] |= records.SURRENDER
+        flags[multiplier == 2] |= records.DOUBLE
+        for r, split_hands in split_rounds.items():
+            if r < outcome.size:
+                hands[r] = len(split_hands)
+                flags[r] = records.SPLIT
+                if any(o == NAT_WIN for (o, m) in split_hands):
+                    flags[r] |= records.NATURAL
+                if any(m == 2 for (o, m) in split_hands):
+                    flags[r] |= records.DOUBLE
+        batch['hands'] = hands
+        batch['flags'] = flags
+        self.round_writer.add_records(batch.tobytes())
+
+    def run(self, rounds, iteration=0):
+        bet = self.bet_system.get_next_bet()
+        zero_bets = bet == 0 and rounds == 0
+        if zero_bets:
+            rounds = 1
+
+        end_reason = "N/A"
+        gold = self.player.gold
+        trajectory = stats.Trajectory(stats.TRAJECTORY_POINTS, max(1, rounds // stats.TRAJECTORY_POINTS))
+        trajectory.add(gold)
+        curr_round = 0
+        while end_reason == "N/A":
+            n = self.batch_size
+            if rounds > 0:
+                n = min(n, rounds - curr_round)
+            outcome, multiplier, split_rounds, skipped = self.play_batch(n)
+            start_gold = gold
+
+            # Round results as if every round was bet on
+            deltas = self.gold_deltas(outcome, multiplier, bet)
+            for r, hands in split_rounds.items():
+                split_outcome, split_multiplier = np.array(hands, dtype=np.int8).T
+                deltas[r] = self.gold_deltas(split_outcome, split_multiplier, bet).sum()
+
+            # Find the round that ends the simulation, if any
+            end = n
+            if bet > 0:
+                before = gold + np.concatenate(([0], np.cumsum(deltas)[:-1]))
+                broke = np.flatnonzero(before < bet)
+                if broke.size:
+                    end = broke[0] + 1
+                    # Nothing was bet on the last round
+                    deltas[broke[0]] = 0
+                    end_reason = "Ran out of gold."
+                after = gold + np.cumsum(deltas[:end])
+                if self.target_gold > 0:
+                    reached = np.flatnonzero(after >= self.target_gold)
+                    if reached.size and reached[0] + 1 <= end:
+                        end = reached[0] + 1
+                        end_reason = 'Reached target gold.'
+            # Batches never go past the round limit, so it's only reached by the last round
+            if rounds > 0 and curr_round + end >= rounds:
+                end_reason = "Finished rounds."
+
+            if bet > 0 and self.starting_gold > 0:
+                after = gold + np.cumsum(deltas[:end])
+                self.track_risk(curr_round, after, trajectory)
+                self.stats.gold_max = max(self.stats.gold_max, int(after.max()))
+                self.stats.gold_min = min(self.stats.gold_min, int(after.min()))
+                gold = int(after[-1])
+
+            # Hands in the order they were settled
+            counts = np.ones(end, dtype=np.intp)
+            for r, hands in split_rounds.items():
+                if r < end:
+                    counts[r] = len(hands)
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            hands = np.empty(counts.sum(), dtype=np.int8)
+            hands[starts] = outcome[:end]
+            for r, split_hands in split_rounds.items():
+                if r < end:
+                    hands[starts[r]:starts[r] + len(split_hands)] = [o for (o, m) in split_hands]
+            self.add_hands(hands)
+            self.stats.dealer_skips += int(np.count_nonzero(skipped[:end]))
+
+            if self.round_writer is not None:
+                self.write_rounds(iteration, curr_round, outcome[:end], multiplier[:end],
+                                  split_rounds, start_gold, deltas[:end])
+
+            curr_round += end
+
+        if zero_bets:
+            end_reason = "Infinite loop: zero gold bets."
+
+        if self.round_writer is not None:
+            self.round_writer.flush()
+        self.player.gold = gold
+        self.stats.gold_end = gold
+        if bet > 0 and self.starting_gold > 0:
+            if end_reason == "Ran out of gold.":
+                # Nothing was bet on the last round
+                self.stats.ruin_round = curr_round - 1
+            trajectory.end(curr_round, gold)
+            self.stats.end_iteration(self.random.random(), trajectory)
+        return (end_reason, self.stats)